@@ -0,0 +1,75 @@
+"""add_customer_tag_links
+
+Revision ID: 3b7c1d2e9f40
+Revises: efdde5977741
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7c1d2e9f40'
+down_revision: Union[str, None] = 'efdde5977741'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'customer_tag_links',
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tag_id'], ['customer_tags.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('customer_id', 'tag_id')
+    )
+    op.create_index('ix_customer_tag_links_tag_id', 'customer_tag_links', ['tag_id', 'customer_id'], unique=False)
+
+    # 1. 补齐 customers.tags 中出现但 customer_tags 中不存在的标签
+    op.execute("""
+        INSERT INTO customer_tags (name, color, usage_count, created_at, updated_at)
+        SELECT DISTINCT left(btrim(t.name), 50), '#1677ff', 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+        FROM customers c
+        CROSS JOIN LATERAL unnest(string_to_array(c.tags, ',')) AS t(name)
+        WHERE c.tags IS NOT NULL
+          AND btrim(t.name) <> ''
+        ON CONFLICT (name) DO NOTHING
+    """)
+
+    # 2. 由逗号分隔文本生成关联记录
+    op.execute("""
+        INSERT INTO customer_tag_links (customer_id, tag_id)
+        SELECT DISTINCT c.id, ct.id
+        FROM customers c
+        CROSS JOIN LATERAL unnest(string_to_array(c.tags, ',')) AS t(name)
+        JOIN customer_tags ct ON ct.name = left(btrim(t.name), 50)
+        WHERE c.tags IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+    # 3. 按关联表重算标签使用次数，并规范化展示字段
+    op.execute("""
+        UPDATE customer_tags SET usage_count = (
+            SELECT count(*) FROM customer_tag_links l WHERE l.tag_id = customer_tags.id
+        )
+    """)
+    op.execute("""
+        UPDATE customers SET tags = (
+            SELECT string_agg(ct.name, ',' ORDER BY ct.name)
+            FROM customer_tag_links l
+            JOIN customer_tags ct ON ct.id = l.tag_id
+            WHERE l.customer_id = customers.id
+        )
+        WHERE tags IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    # customers.tags 文本字段始终保持同步，删除关联表不会丢失标签
+    op.drop_index('ix_customer_tag_links_tag_id', table_name='customer_tag_links')
+    op.drop_table('customer_tag_links')
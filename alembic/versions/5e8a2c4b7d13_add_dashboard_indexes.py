@@ -0,0 +1,30 @@
+"""add_dashboard_indexes
+
+Revision ID: 5e8a2c4b7d13
+Revises: 3b7c1d2e9f40
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8a2c4b7d13'
+down_revision: Union[str, None] = '3b7c1d2e9f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 仪表盘聚合查询使用的索引
+    op.create_index('ix_customers_status_followup', 'customers', ['status', 'next_followup_date'], unique=False)
+    op.create_index('ix_orders_order_date', 'orders', ['order_date'], unique=False)
+    op.create_index('ix_orders_estimated_completion', 'orders', ['estimated_completion_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_estimated_completion', table_name='orders')
+    op.drop_index('ix_orders_order_date', table_name='orders')
+    op.drop_index('ix_customers_status_followup', table_name='customers')
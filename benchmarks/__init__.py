@@ -0,0 +1,15 @@
+"""
+性能基准测试套件
+
+- data_generator: 按固定种子生成客户/邮件/订单/线索/知识库分块和 .eml 邮件样本（结果可复现）
+- run_benchmarks: 运行基准测试，结果写入 benchmarks/results/*.json，并按 thresholds.json 检查回归
+- mock_llm_server: 本地 OpenAI 兼容模拟服务（对话/流式/Embedding，可配置延迟、500 和 429）
+- load_test: 按目标速率回放入站邮件，压测 同步 → 分析 → 自动回复 流水线
+
+用法：
+    python -m benchmarks.run_benchmarks                      # SQLite，默认规模
+    python -m benchmarks.run_benchmarks --customers 5000     # 更大规模
+    python -m benchmarks.run_benchmarks --db postgresql      # 本地 PostgreSQL（DB_NAME 默认 crm_benchmark）
+    python -m benchmarks.run_benchmarks --save-baseline      # 把本次结果保存为基线
+    python -m benchmarks.load_test --start-mock --rate 5 --count 200 --ensure-rules
+"""
@@ -0,0 +1,452 @@
+"""
+基准测试数据生成器
+
+所有数据由 random.Random(seed) 生成，时间以固定的 BASE_TIME 为基准：
+同一种子、同一规模生成的数据库和 .eml 文件完全一致，前后两次基准测试的差异只来自代码改动。
+
+生成内容：
+- 客户（按销售漏斗比例分布状态）、往来邮件、订单、线索
+- 知识库文档和分块（向量围绕 KNOWLEDGE_TOPICS 个主题中心分布，检索结果稳定）
+- .eml 邮件样本：纯文本、HTML、RFC2047 编码标题 + GBK 正文、PDF 附件、内嵌图片、长引用回复
+- AI 分析结果 JSON 文本（_parse_analysis_result 的输入，也是模拟大模型服务的返回内容）
+
+数据库模型在用到时才导入：只生成邮件/分析结果（模拟服务、压测）时不需要数据库。
+"""
+import json
+import math
+import random
+import hashlib
+from datetime import datetime, timedelta
+from email import policy
+from email.message import EmailMessage
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BASE_TIME = datetime(2025, 1, 1, 9, 0, 0)
+BATCH_SIZE = 1000
+KNOWLEDGE_TOPICS = 8
+
+COUNTRIES = ['United States', 'Germany', 'United Kingdom', 'France', 'Australia', 'Canada', 'Japan', 'Brazil', 'Mexico', 'Spain']
+INDUSTRIES = ['Retail', 'Wholesale', 'E-commerce', 'Fashion Brand', 'Sportswear', 'Department Store']
+COMPANY_SIZES = ['1-10', '11-50', '51-200', '201-500', '500+']
+SOURCES = ['Google搜索', '展会', '推荐', '官网询盘', 'LinkedIn', 'B2B平台']
+# 销售漏斗各阶段的客户比例
+CUSTOMER_STATUS_WEIGHTS = [
+    ('cold', 40), ('contacted', 25), ('replied', 12), ('qualified', 8),
+    ('negotiating', 5), ('customer', 6), ('lost', 4),
+]
+ORDER_STATUSES = ['quotation', 'confirmed', 'production', 'shipped', 'delivered', 'completed']
+LEAD_STATUSES = ['new', 'contacted', 'in_progress', 'qualified', 'unqualified', 'converted']
+BUSINESS_STAGES = ['新客询盘', '报价跟进', '样品阶段', '谈判议价', '订单确认', '生产跟踪', '售后服务', '老客维护', '垃圾营销']
+AI_CATEGORIES = ['inquiry', 'quotation', 'order', 'complaint', 'follow_up', 'sample']
+SENTIMENTS = ['positive', 'neutral', 'negative', 'urgent']
+KNOWLEDGE_CATEGORIES = ['产品手册', 'FAQ', '价格表', '案例', '公司介绍', '其他']
+
+PRODUCTS = ['seamless briefs', 'cotton boxers', 'sports bras', 'lace panties', 'thermal underwear',
+            'bamboo socks', 'shapewear', 'maternity bras', 'kids underwear', 'modal camisoles']
+WORDS = ('quality price order sample shipment delivery fabric cotton spandex modal bamboo size color '
+         'logo packaging label carton quantity MOQ discount payment deposit balance invoice factory '
+         'production schedule inspection certificate OEKO-TEX BSCI design pattern stock season '
+         'collection customer market retail wholesale brand request confirm update please thanks').split()
+SUBJECTS = [
+    'Inquiry about {product}', 'RE: Quotation for {product}', 'Sample request - {product}',
+    'Order confirmation #{number}', 'Follow up on our last order', 'Price list for {product}',
+    'RE: RE: Shipping schedule for PO {number}', 'Complaint about {product} quality',
+]
+
+
+class DatasetSpec:
+    """数据规模（同一 spec + seed 生成的数据完全相同）"""
+
+    def __init__(self, customers: int = 1000, emails_per_customer: int = 20, orders_per_customer: int = 2,
+                 leads: int = 500, documents: int = 24, chunks_per_document: int = 40,
+                 embedding_dim: int = 1536, eml_count: int = 120, analysis_results: int = 200, seed: int = 42):
+        self.customers = customers
+        self.emails_per_customer = emails_per_customer
+        self.orders_per_customer = orders_per_customer
+        self.leads = leads
+        self.documents = documents
+        self.chunks_per_document = chunks_per_document
+        self.embedding_dim = embedding_dim
+        self.eml_count = eml_count
+        self.analysis_results = analysis_results
+        self.seed = seed
+
+    def to_dict(self) -> Dict:
+        return dict(vars(self))
+
+
+def _sentence(rng: random.Random, min_words: int = 8, max_words: int = 20) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    return '\n\n'.join(
+        ' '.join(_sentence(rng) for _ in range(rng.randint(2, 5)))
+        for _ in range(count)
+    )
+
+
+def _subject(rng: random.Random) -> str:
+    return rng.choice(SUBJECTS).format(product=rng.choice(PRODUCTS), number=rng.randint(10000, 99999))
+
+
+def _weighted(rng: random.Random, weighted: List[Tuple[str, int]]) -> str:
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights=weights)[0]
+
+
+def _insert(session, model, rows: List[Dict]):
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def topic_centroids(spec: DatasetSpec) -> List[List[float]]:
+    """各知识主题的中心向量（单位向量）"""
+    rng = random.Random(spec.seed * 7919 + 1)
+    return [_unit([rng.gauss(0, 1) for _ in range(spec.embedding_dim)]) for _ in range(KNOWLEDGE_TOPICS)]
+
+
+def _near(rng: random.Random, centroid: List[float], noise: float) -> List[float]:
+    """中心向量附近的随机向量（noise 为每维噪声相对中心的比例）"""
+    scale = noise / math.sqrt(len(centroid))
+    return _unit([c + rng.gauss(0, scale) for c in centroid])
+
+
+def benchmark_queries(spec: DatasetSpec) -> List[Tuple[str, List[float]]]:
+    """检索基准使用的 (查询文本, 查询向量)，向量落在某个主题附近"""
+    rng = random.Random(spec.seed * 7919 + 2)
+    centroids = topic_centroids(spec)
+    queries = []
+    for topic, centroid in enumerate(centroids):
+        text = f"What is the MOQ and lead time for {PRODUCTS[topic % len(PRODUCTS)]}?"
+        queries.append((text, _near(rng, centroid, 0.5)))
+    return queries
+
+
+def reset_schema(engine):
+    """删除并重建所有表（只用于基准测试库）"""
+    from src.crm.database import Base
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def generate_database(session, spec: DatasetSpec) -> Dict[str, int]:
+    """写入客户/邮件/订单/线索/知识库数据，返回各表行数"""
+    from src.crm.database import Customer, EmailHistory, Order, Lead, KnowledgeDocument, KnowledgeChunk
+
+    rng = random.Random(spec.seed)
+
+    customers = []
+    for i in range(1, spec.customers + 1):
+        first_contact = BASE_TIME - timedelta(days=rng.randint(30, 720))
+        last_contact = first_contact + timedelta(days=rng.randint(0, (BASE_TIME - first_contact).days))
+        customers.append({
+            'id': i,
+            'company_name': f"{rng.choice(['Global', 'Prime', 'Urban', 'Nordic', 'Sunny', 'Blue'])} "
+                            f"{rng.choice(['Apparel', 'Textiles', 'Fashion', 'Trading', 'Retail'])} {i}",
+            'contact_name': f"Contact {i}",
+            'email': f"buyer{i}@customer{i}.example.com",
+            'country': rng.choice(COUNTRIES),
+            'industry': rng.choice(INDUSTRIES),
+            'company_size': rng.choice(COMPANY_SIZES),
+            'status': _weighted(rng, CUSTOMER_STATUS_WEIGHTS),
+            'priority': rng.randint(1, 5),
+            'source': rng.choice(SOURCES),
+            'customer_grade': rng.choice(['A', 'B', 'C', 'D', None]),
+            'estimated_annual_value': round(rng.uniform(5000, 500000), 2),
+            'first_contact_date': first_contact,
+            'last_contact_date': last_contact,
+            'created_at': first_contact,
+            'updated_at': last_contact,
+        })
+    _insert(session, Customer, customers)
+
+    emails = []
+    email_id = 0
+    for customer in customers:
+        count = rng.randint(spec.emails_per_customer // 2, spec.emails_per_customer * 3 // 2)
+        for _ in range(count):
+            email_id += 1
+            direction = 'inbound' if rng.random() < 0.5 else 'outbound'
+            if direction == 'outbound':
+                status = _weighted(rng, [('sent', 90), ('draft', 7), ('failed', 3)])
+            else:
+                status = 'sent'
+            body = _paragraphs(rng, rng.randint(1, 6))
+            sent_at = BASE_TIME - timedelta(minutes=rng.randint(0, 720 * 24 * 60))
+            ours, theirs = 'sales@bench.example.com', customer['email']
+            emails.append({
+                'id': email_id,
+                'customer_id': customer['id'],
+                'direction': direction,
+                'subject': _subject(rng),
+                'body': body,
+                'html_body': f"<html><body><p>{body.replace(chr(10) * 2, '</p><p>')}</p></body></html>"
+                             if rng.random() < 0.6 else None,
+                'sent_at': sent_at if status != 'draft' else None,
+                'from_email': theirs if direction == 'inbound' else ours,
+                'to_email': ours if direction == 'inbound' else theirs,
+                'message_id': f"<bench-{email_id}@bench.example.com>",
+                'status': status,
+                'delivery_status': 'delivered',
+                'opened': rng.random() < 0.4,
+                'replied': rng.random() < 0.2,
+                'is_starred': rng.random() < 0.02,
+                'is_deleted': rng.random() < 0.03,
+                'business_stage': rng.choice(BUSINESS_STAGES) if direction == 'inbound' else None,
+                'ai_category': rng.choice(AI_CATEGORIES) if direction == 'inbound' else None,
+                'ai_sentiment': rng.choice(SENTIMENTS) if direction == 'inbound' else None,
+                'created_at': sent_at,
+                'updated_at': sent_at,
+            })
+    _insert(session, EmailHistory, emails)
+
+    orders = []
+    order_id = 0
+    for customer in customers:
+        if customer['status'] not in ('negotiating', 'customer') and rng.random() > 0.1:
+            continue
+        for _ in range(rng.randint(1, spec.orders_per_customer * 2 - 1)):
+            order_id += 1
+            quantity = rng.randint(500, 50000)
+            unit_price = round(rng.uniform(0.8, 12.0), 2)
+            order_date = BASE_TIME - timedelta(days=rng.randint(0, 540))
+            orders.append({
+                'id': order_id,
+                'customer_id': customer['id'],
+                'order_number': f"BENCH-{order_id:07d}",
+                'product_details': rng.choice(PRODUCTS),
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'total_amount': round(quantity * unit_price, 2),
+                'currency': 'USD',
+                'status': rng.choice(ORDER_STATUSES),
+                'order_date': order_date,
+                'created_at': order_date,
+            })
+    _insert(session, Order, orders)
+
+    leads = []
+    for i in range(1, spec.leads + 1):
+        created = BASE_TIME - timedelta(days=rng.randint(0, 365))
+        leads.append({
+            'id': i,
+            'company_name': f"Lead Company {i}",
+            'contact_name': f"Lead Contact {i}",
+            'email': f"lead{i}@lead{i}.example.com",
+            'country': rng.choice(COUNTRIES),
+            'industry': rng.choice(INDUSTRIES),
+            'lead_source': rng.choice(SOURCES),
+            'lead_status': rng.choice(LEAD_STATUSES),
+            'lead_score': rng.randint(0, 100),
+            'priority': rng.choice(['high', 'medium', 'low']),
+            'product_interest': rng.choice(PRODUCTS),
+            'created_at': created,
+            'updated_at': created,
+        })
+    _insert(session, Lead, leads)
+
+    centroids = topic_centroids(spec)
+    documents, chunks = [], []
+    chunk_id = 0
+    for i in range(1, spec.documents + 1):
+        topic = (i - 1) % KNOWLEDGE_TOPICS
+        title = f"{PRODUCTS[topic % len(PRODUCTS)].title()} Guide {i}"
+        documents.append({
+            'id': i,
+            'title': title,
+            'filename': f"guide_{i}.txt",
+            'file_type': 'txt',
+            'category': KNOWLEDGE_CATEGORIES[(i - 1) % len(KNOWLEDGE_CATEGORIES)],
+            'file_hash': hashlib.sha256(f"bench-document-{spec.seed}-{i}".encode()).hexdigest(),
+            'status': 'completed',
+            'chunk_count': spec.chunks_per_document,
+            'is_active': True,
+            'created_at': BASE_TIME,
+        })
+        for index in range(spec.chunks_per_document):
+            chunk_id += 1
+            content = _paragraphs(rng, 2)
+            chunks.append({
+                'id': chunk_id,
+                'document_id': i,
+                'content': content,
+                'chunk_index': index,
+                'embedding': json.dumps([round(x, 6) for x in _near(rng, centroids[topic], 0.8)]),
+                'chunk_metadata': json.dumps({'source': f"guide_{i}.txt", 'section': index}),
+                'token_count': len(content.split()),
+                'char_count': len(content),
+                'is_active': True,
+                'created_at': BASE_TIME,
+            })
+    _insert(session, KnowledgeDocument, documents)
+    _insert(session, KnowledgeChunk, chunks)
+
+    session.commit()
+    return {
+        'customers': len(customers),
+        'emails': len(emails),
+        'orders': len(orders),
+        'leads': len(leads),
+        'knowledge_documents': len(documents),
+        'knowledge_chunks': len(chunks),
+    }
+
+
+def _fix_boundaries(msg: EmailMessage, index: int):
+    """固定 multipart 分隔符（默认随机生成，会导致每次生成的文件不同）"""
+    for n, part in enumerate(msg.walk()):
+        if part.is_multipart():
+            part.set_boundary(f"=_bench_{index}_{n}")
+
+
+def build_eml(rng: random.Random, index: int) -> EmailMessage:
+    """第 index 封样本邮件（按 index % 6 轮换 6 种 MIME 结构）"""
+    kind = index % 6
+    msg = EmailMessage()
+    product = rng.choice(PRODUCTS)
+    sender = f"buyer{index}@customer{index}.example.com"
+    msg['From'] = f"Buyer {index} <{sender}>"
+    msg['To'] = "Sales Team <sales@bench.example.com>"
+    msg['Date'] = format_datetime(BASE_TIME - timedelta(minutes=index * 37))
+    msg['Message-ID'] = f"<eml-{index}@customer{index}.example.com>"
+    body = _paragraphs(rng, rng.randint(2, 6))
+
+    if kind == 0:
+        # 纯文本
+        msg['Subject'] = f"Inquiry about {product}"
+        msg.set_content(body)
+    elif kind == 1:
+        # text + html
+        msg['Subject'] = f"RE: Quotation for {product}"
+        msg.set_content(body)
+        msg.add_alternative(f"<html><body><p>{body.replace(chr(10) * 2, '</p><p>')}</p></body></html>", subtype='html')
+    elif kind == 2:
+        # RFC2047 编码的中文标题和发件人 + GBK 正文
+        del msg['From']
+        msg['From'] = f"采购经理 {index} <{sender}>"
+        msg['Subject'] = f"关于{product}的询价 - 第{index}号"
+        msg.set_content(f"您好，\n\n我们对贵司的{product}很感兴趣，请报价。\n\n{body}", charset='gbk')
+    elif kind == 3:
+        # 带 PDF 附件（文件名为中文）
+        msg['Subject'] = f"PO {rng.randint(10000, 99999)} - {product}"
+        msg.set_content(body)
+        msg.add_attachment(rng.randbytes(rng.randint(20_000, 80_000)), maintype='application',
+                           subtype='pdf', filename=f"采购订单_{index}.pdf")
+    elif kind == 4:
+        # HTML 内嵌图片（cid 引用）
+        msg['Subject'] = f"New design for {product}"
+        msg.set_content(body)
+        msg.add_alternative(
+            f"<html><body><p>{body[:200]}</p><img src=\"cid:design{index}@bench\"></body></html>", subtype='html'
+        )
+        msg.get_payload()[1].add_related(rng.randbytes(rng.randint(5_000, 30_000)), maintype='image',
+                                         subtype='png', cid=f"<design{index}@bench>")
+    else:
+        # 长引用回复（quoted-printable）
+        msg['Subject'] = f"RE: RE: RE: Shipping schedule for {product}"
+        msg['In-Reply-To'] = f"<eml-{index - 1}@customer{index}.example.com>"
+        history = '\n'.join(f"> {line}" for line in _paragraphs(rng, 8).splitlines())
+        msg.set_content(f"{body}\n\nOn Mon, Buyer wrote:\n{history}", cte='quoted-printable')
+
+    _fix_boundaries(msg, index)
+    return msg
+
+
+def generate_eml_corpus(directory: Path, spec: DatasetSpec) -> List[Path]:
+    """生成 .eml 邮件样本"""
+    rng = random.Random(spec.seed * 7919 + 3)
+    directory.mkdir(parents=True, exist_ok=True)
+    for old in directory.glob('*.eml'):
+        old.unlink()
+    paths = []
+    for index in range(spec.eml_count):
+        path = directory / f"{index:04d}.eml"
+        path.write_bytes(build_eml(rng, index).as_bytes(policy=policy.SMTP))
+        paths.append(path)
+    return paths
+
+
+def build_analysis(rng: random.Random) -> Dict:
+    """一份符合分析提示词 JSON 结构的分析结果（取值都在提示词列出的枚举内）"""
+    return {
+        "业务阶段分类": {"primary_stage": rng.choice(BUSINESS_STAGES), "secondary_category": "价格询问"},
+        "客户意图识别": {
+            "purchase_intent": rng.choice(['high', 'medium', 'low']),
+            "purchase_intent_score": rng.randint(0, 100),
+            "budget_level": rng.choice(['高端', '中端', '低端']),
+            "urgency": rng.choice(['急单', '常规', '长期计划']),
+            "decision_authority": rng.choice(['决策者', '采购经理', '采购员', '询价员']),
+            "competition_status": rng.choice(['独家询价', '2-3家比价', '多家比价']),
+            "customer_business_type": rng.choice(['批发商', '零售商', '品牌商', '电商']),
+        },
+        "情感与态度": {"sentiment": rng.choice(SENTIMENTS), "tone": "专业", "satisfaction_level": "中立"},
+        "紧急度评估": {
+            "urgency_level": rng.choice(['high', 'medium', 'low']),
+            "requires_urgent_response": rng.random() < 0.3,
+            "response_deadline": "24小时内",
+            "business_impact": "normal",
+        },
+        "客户画像推断": {
+            "customer_type": "新客户", "customer_grade_suggestion": "C级（潜力客户）",
+            "professionalism": "专业买家", "communication_style": "简洁高效",
+        },
+        "内容分析": {
+            "summary": _sentence(rng, 6, 12),
+            "key_points": [_sentence(rng, 4, 8) for _ in range(3)],
+            "mentioned_products": rng.sample(PRODUCTS, 2),
+            "mentioned_quantities": f"{rng.randint(1, 50) * 1000} pcs",
+            "mentioned_prices": f"USD {rng.uniform(1, 10):.2f}/pc",
+            "mentioned_timeline": f"{rng.randint(2, 12)} weeks",
+            "questions_asked": [_sentence(rng, 5, 10)],
+            "concerns": [_sentence(rng, 4, 8)],
+        },
+        "行动建议": {
+            "next_action": _sentence(rng, 6, 12),
+            "response_template_suggestion": "报价单",
+            "suggested_tags": ["询价", "新客户"],
+            "follow_up_date": "3",
+            "requires_human_review": False,
+            "human_review_reason": "",
+        },
+        "风险与机会": {
+            "risk_level": "low", "risk_factors": [],
+            "opportunity_score": rng.randint(0, 100),
+            "conversion_probability": rng.randint(0, 100),
+            "estimated_order_value": f"USD {rng.randint(1, 100) * 1000}",
+        },
+    }
+
+
+def build_reply_html(rng: random.Random) -> str:
+    """一封 HTML 格式的回复（模拟回复生成的返回内容）"""
+    body = ''.join(f"<p>{p}</p>" for p in _paragraphs(rng, rng.randint(2, 4)).split('\n\n'))
+    return f"<p>Dear customer,</p>{body}<p>Best regards,<br>Sales Team</p>"
+
+
+def generate_analysis_results(spec: DatasetSpec) -> List[str]:
+    """模拟大模型返回的分析结果（部分带 ```json 代码块、部分缺少维度）"""
+    rng = random.Random(spec.seed * 7919 + 4)
+    results = []
+    for index in range(spec.analysis_results):
+        analysis = build_analysis(rng)
+        if index % 5 == 4:
+            # 模型偶尔漏掉部分维度
+            for key in rng.sample(sorted(analysis), 3):
+                del analysis[key]
+        text = json.dumps(analysis, ensure_ascii=False, indent=2)
+        if index % 3 == 0:
+            text = f"```json\n{text}\n```"
+        results.append(text)
+    return results
@@ -0,0 +1,418 @@
+"""
+邮件流水线压测
+
+按目标速率（开环：到达时间固定，不因系统变慢而推迟）回放合成的入站邮件：
+1. 同步：EmailReceiver.parse_message 解析 .eml + store_inbound_email 入库（与 sync_emails_task 相同）
+2. 分析：analyze_email_task（大模型请求发往模拟服务）
+3. 自动回复：匹配规则后由分析任务触发 generate_auto_reply_task，生成审核任务
+
+两种模式：
+- eager（默认）：Celery 任务在本进程内同步执行（task_always_eager），不需要 Redis/worker
+- celery：任务发给真实 worker（worker 需以 AIHUBMIX_BASE_URL 指向模拟服务启动），
+  轮询数据库判断分析完成（ai_category 已写入）和回复完成（审核任务已创建）
+
+SQLite 的写入是串行的，并发较高时请使用 --db postgresql。
+
+延迟从邮件的计划到达时间算起（包含排队等待），输出吞吐量和 p50/p90/p95/p99，
+结果写入 benchmarks/results/loadtest_<时间>.json。
+
+用法：
+    python -m benchmarks.load_test --start-mock --rate 5 --count 200 --ensure-rules
+    python -m benchmarks.load_test --mode celery --mock-url http://127.0.0.1:8900/v1 --rate 10 --duration 60
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+import contextlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email import policy
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.run_benchmarks import RESULTS_DIR, DEFAULT_WORK_DIR, percentile, prepare_environment, git_revision
+from benchmarks.data_generator import build_eml
+
+# --ensure-rules 创建的自动回复规则（对应 新客询盘/报价跟进/样品阶段）
+LOAD_TEST_RULE_CATEGORIES = ('inquiry', 'quotation', 'sample')
+LOAD_TEST_RULE_PREFIX = '[压测] '
+POLL_INTERVAL = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyRecorder:
+    """线程安全的分阶段延迟记录（秒）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def summary(self) -> Dict[str, Dict]:
+        result = {}
+        for stage, values in sorted(self.samples.items()):
+            values_ms = [v * 1000 for v in values]
+            result[stage] = {
+                'count': len(values_ms),
+                'p50_ms': round(percentile(values_ms, 50), 1),
+                'p90_ms': round(percentile(values_ms, 90), 1),
+                'p95_ms': round(percentile(values_ms, 95), 1),
+                'p99_ms': round(percentile(values_ms, 99), 1),
+                'max_ms': round(max(values_ms), 1),
+            }
+        return result
+
+
+def build_corpus(count: int, seed: int, run_id: str) -> List[bytes]:
+    """合成入站邮件（Message-ID 带 run_id，避免被同步去重）"""
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        msg = build_eml(rng, index)
+        del msg['Message-ID']
+        msg['Message-ID'] = f"<load-{run_id}-{index}@loadtest.example.com>"
+        corpus.append(msg.as_bytes(policy=policy.SMTP))
+    return corpus
+
+
+def start_mock_server(args) -> subprocess.Popen:
+    """启动模拟大模型服务并等待就绪"""
+    import httpx
+
+    port = int(args.mock_url.rsplit(':', 1)[-1].split('/')[0])
+    command = [
+        sys.executable, '-m', 'benchmarks.mock_llm_server', '--port', str(port),
+        '--chat-latency', args.chat_latency, '--error-rate', str(args.error_rate),
+        '--rate-limit-rate', str(args.rate_limit_rate),
+    ]
+    process = subprocess.Popen(command, cwd=str(Path(__file__).resolve().parent.parent))
+    health_url = f"{mock_root(args.mock_url)}/health"
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            if httpx.get(health_url, timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"❌ 模拟大模型服务启动失败: {' '.join(command)}")
+
+
+def mock_root(mock_url: str) -> str:
+    return mock_url.rstrip('/').rsplit('/v1', 1)[0]
+
+
+def mock_request(args, method: str, path: str) -> Optional[Dict]:
+    import httpx
+
+    try:
+        response = httpx.request(method, f"{mock_root(args.mock_url)}{path}", timeout=5)
+        return response.json()
+    except Exception as e:
+        print(f"⚠️ 读取模拟服务统计失败: {str(e)}")
+        return None
+
+
+def ensure_rules(db) -> List[str]:
+    """创建压测用自动回复规则（系统内审核，不发企业微信通知），返回启用了自动回复的邮件类型"""
+    from src.crm.database import AutoReplyRule
+
+    for category in LOAD_TEST_RULE_CATEGORIES:
+        name = f"{LOAD_TEST_RULE_PREFIX}{category}"
+        if not db.query(AutoReplyRule).filter(AutoReplyRule.rule_name == name).first():
+            db.add(AutoReplyRule(
+                rule_name=name, email_category=category, is_enabled=True,
+                auto_generate_reply=True, require_approval=True, approval_method='system',
+            ))
+    db.commit()
+    return auto_reply_categories(db)
+
+
+def auto_reply_categories(db) -> List[str]:
+    from src.crm.database import AutoReplyRule
+
+    rows = db.query(AutoReplyRule.email_category).filter(
+        AutoReplyRule.is_enabled == True,
+        AutoReplyRule.auto_generate_reply == True
+    ).distinct().all()
+    return sorted(row[0] for row in rows)
+
+
+class LoadTest:
+    """一次压测（到达调度、各阶段计时、完成判定）"""
+
+    def __init__(self, args, corpus: List[bytes]):
+        from src.email_system.receiver import EmailReceiver
+
+        self.args = args
+        self.corpus = corpus
+        self.receiver = EmailReceiver('loadtest@loadtest.example.com', '', imap_host='localhost')
+        self.latency = LatencyRecorder()
+        self.lock = threading.Lock()
+        self.pending: Dict[int, float] = {}        # celery 模式下等待完成的邮件 email_id -> 计划到达时间
+        self.analyzed: Dict[int, float] = {}
+        self.completed = 0
+        self.failed = 0
+        self.last_completion = None
+        self.auto_reply_categories: List[str] = []
+
+    def sync(self, index: int, scheduled: float) -> Optional[int]:
+        """同步阶段：解析 + 入库"""
+        from src.crm.database import get_session
+        from src.tasks.email_tasks import store_inbound_email
+
+        db = get_session()
+        try:
+            email_data = self.receiver.parse_message(self.corpus[index], f"load{index}")
+            email = store_inbound_email(db, self.receiver, email_data)
+            if email is None:
+                return None
+            db.commit()
+            return email.id
+        finally:
+            db.close()
+            self.latency.add('sync', time.perf_counter() - scheduled)
+
+    def process(self, index: int, scheduled: float):
+        from src.tasks.ai_tasks import analyze_email_task
+
+        try:
+            email_id = self.sync(index, scheduled)
+            if email_id is None:
+                raise RuntimeError("邮件被去重，未入库")
+            if self.args.mode == 'eager':
+                result = analyze_email_task.apply(args=[email_id]).result
+                if not isinstance(result, dict) or not result.get('success'):
+                    raise RuntimeError(f"分析失败: {result}")
+                self.finish(scheduled)
+            else:
+                with self.lock:
+                    self.pending[email_id] = scheduled
+                analyze_email_task.delay(email_id)
+        except Exception as e:
+            logger.warning(f"压测邮件 {index} 处理失败: {str(e)}")
+            with self.lock:
+                self.failed += 1
+
+    def finish(self, scheduled: float):
+        now = time.perf_counter()
+        self.latency.add('end_to_end', now - scheduled)
+        with self.lock:
+            self.completed += 1
+            self.last_completion = now
+
+    def poll(self, stop: threading.Event):
+        """celery 模式：轮询数据库，记录分析完成和审核任务创建的时间"""
+        from src.crm.database import get_session, EmailHistory, ApprovalTask
+
+        while not stop.is_set() or self.pending:
+            with self.lock:
+                ids = list(self.pending)
+            if ids:
+                db = get_session()
+                try:
+                    now = time.perf_counter()
+                    analyzed = db.query(EmailHistory.id, EmailHistory.ai_category).filter(
+                        EmailHistory.id.in_(ids), EmailHistory.ai_category.isnot(None)
+                    ).all()
+                    drafted = {row[0] for row in db.query(ApprovalTask.email_id).filter(ApprovalTask.email_id.in_(ids)).all()}
+                finally:
+                    db.close()
+                for email_id, category in analyzed:
+                    scheduled = self.pending[email_id]
+                    if email_id not in self.analyzed:
+                        self.analyzed[email_id] = now
+                        self.latency.add('analysis', now - scheduled)
+                    if email_id in drafted:
+                        self.latency.add('auto_reply_draft', now - scheduled)
+                    elif category in self.auto_reply_categories:
+                        continue  # 等待自动回复草稿
+                    with self.lock:
+                        self.pending.pop(email_id, None)
+                    self.finish(scheduled)
+                # 超时的邮件计为失败
+                for email_id in ids:
+                    scheduled = self.pending.get(email_id)
+                    if scheduled is not None and now - scheduled > self.args.timeout:
+                        with self.lock:
+                            self.pending.pop(email_id, None)
+                            self.failed += 1
+            if stop.is_set() and not self.pending:
+                break
+            time.sleep(POLL_INTERVAL)
+
+    def run(self) -> float:
+        """按目标速率投递所有邮件，返回实际耗时（秒）"""
+        stop = threading.Event()
+        poller = None
+        if self.args.mode == 'celery':
+            poller = threading.Thread(target=self.poll, args=(stop,), daemon=True)
+            poller.start()
+
+        start = time.perf_counter()
+        interval = 1.0 / self.args.rate
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            for index in range(len(self.corpus)):
+                scheduled = start + index * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.process, index, scheduled)
+                if (index + 1) % max(int(self.args.rate * 10), 1) == 0:
+                    print(f"   已投递 {index + 1}/{len(self.corpus)}，完成 {self.completed}，失败 {self.failed}", file=sys.__stdout__)
+
+        stop.set()
+        if poller is not None:
+            poller.join()
+        return (self.last_completion or time.perf_counter()) - start
+
+
+def connect_task_timing(recorder: LatencyRecorder):
+    """eager 模式下按任务名记录每个 Celery 任务的执行耗时"""
+    from celery.signals import task_prerun, task_postrun
+
+    started = {}
+
+    @task_prerun.connect(weak=False)
+    def _task_started(task_id=None, **kwargs):
+        started[task_id] = time.perf_counter()
+
+    @task_postrun.connect(weak=False)
+    def _task_finished(task_id=None, task=None, **kwargs):
+        start = started.pop(task_id, None)
+        if start is not None and task is not None:
+            recorder.add(f"task:{task.name.rsplit('.', 1)[-1]}", time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="邮件流水线压测（同步 → 分析 → 自动回复）")
+    parser.add_argument("--mode", choices=['eager', 'celery'], default='eager', help="任务执行方式")
+    parser.add_argument("--rate", type=float, default=2.0, help="目标到达速率（封/秒）")
+    parser.add_argument("--count", type=int, default=100, help="邮件数量（与 --duration 二选一）")
+    parser.add_argument("--duration", type=float, default=None, help="压测时长（秒），邮件数 = 速率 × 时长")
+    parser.add_argument("--concurrency", type=int, default=16, help="eager 模式并发处理的线程数")
+    parser.add_argument("--timeout", type=float, default=300, help="celery 模式单封邮件最长等待时间（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="邮件内容种子（默认每次不同，避免命中分析缓存）")
+    parser.add_argument("--mock-url", default="http://127.0.0.1:8900/v1", help="模拟大模型服务地址")
+    parser.add_argument("--start-mock", action="store_true", help="自动启动模拟大模型服务")
+    parser.add_argument("--chat-latency", default="lognormal:800,0.5", help="--start-mock 时的对话延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="--start-mock 时的 500 比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="--start-mock 时的 429 比例")
+    parser.add_argument("--ensure-rules", action="store_true", help="创建压测用自动回复规则")
+    parser.add_argument("--db", choices=['sqlite', 'postgresql'], default='sqlite', help="数据库类型")
+    parser.add_argument("--pg-database", default=os.getenv('BENCH_DB_NAME', 'crm_benchmark'), help="PostgreSQL 库名")
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR, help="SQLite 库和附件的存放目录")
+    args = parser.parse_args()
+
+    if args.duration:
+        args.count = max(int(args.rate * args.duration), 1)
+    seed = args.seed if args.seed is not None else int(time.time())
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+    args.work_dir = args.work_dir.resolve()
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+
+    # 所有大模型/Embedding 请求都发往模拟服务（必须在导入 src 之前设置）
+    prepare_environment(args)
+    os.environ['AIHUBMIX_BASE_URL'] = args.mock_url
+    os.environ['OPENAI_BASE_URL'] = args.mock_url
+    os.environ.setdefault('AIHUBMIX_API_KEY', 'mock')
+    os.environ.setdefault('OPENAI_API_KEY', 'mock')
+
+    mock_process = start_mock_server(args) if args.start_mock else None
+    try:
+        from src.celery_config import celery_app
+        from src.crm.database import Base, engine, get_session
+
+        if args.mode == 'eager':
+            celery_app.conf.task_always_eager = True
+            celery_app.conf.task_eager_propagates = False
+        # 基准测试库可能尚未建表（不会删除已有数据）
+        Base.metadata.create_all(engine)
+
+        db = get_session()
+        try:
+            categories = ensure_rules(db) if args.ensure_rules else auto_reply_categories(db)
+        finally:
+            db.close()
+        if not categories:
+            print("⚠️ 没有启用自动回复的规则，只压测同步和分析（可加 --ensure-rules）")
+
+        corpus = build_corpus(args.count, seed, run_id)
+        mock_request(args, 'POST', '/stats/reset')
+
+        test = LoadTest(args, corpus)
+        test.auto_reply_categories = categories
+        if args.mode == 'eager':
+            connect_task_timing(test.latency)
+
+        print(f"🚀 压测开始: {args.count} 封邮件，目标 {args.rate} 封/秒，模式 {args.mode}，种子 {seed}")
+        # 附件写入 cwd/attachments；流水线的逐封日志不输出
+        cwd = os.getcwd()
+        os.chdir(args.work_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = test.run()
+        finally:
+            os.chdir(cwd)
+    finally:
+        mock_stats = mock_request(args, 'GET', '/stats')
+        if mock_process is not None:
+            mock_process.terminate()
+            mock_process.wait(timeout=10)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'mode': args.mode,
+            'database': args.db,
+            'seed': seed,
+            'target_rate': args.rate,
+            'count': args.count,
+            'concurrency': args.concurrency,
+            'auto_reply_categories': categories,
+        },
+        'elapsed_seconds': round(elapsed, 2),
+        'completed': test.completed,
+        'failed': test.failed,
+        'throughput_per_second': round(test.completed / elapsed, 3) if elapsed > 0 else 0.0,
+        'latency': test.latency.summary(),
+        'mock_llm': mock_stats,
+    }
+
+    print(f"\n📊 完成 {test.completed}/{args.count}，失败 {test.failed}，耗时 {elapsed:.1f}s，"
+          f"吞吐 {report['throughput_per_second']} 封/秒（目标 {args.rate}）")
+    print(f"{'阶段':<36}{'次数':>8}{'p50(ms)':>10}{'p90(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for stage, s in report['latency'].items():
+        print(f"{stage:<36}{s['count']:>8}{s['p50_ms']:>10.0f}{s['p90_ms']:>10.0f}{s['p95_ms']:>10.0f}"
+              f"{s['p99_ms']:>10.0f}{s['max_ms']:>10.0f}")
+    if args.mode == 'eager':
+        print("   注：eager 模式下 analyze_email_task 的耗时包含其同步触发的自动回复任务")
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = RESULTS_DIR / f"loadtest_{run_id}_{args.mode}.json"
+    path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"💾 结果已保存: {path}")
+
+
+if __name__ == "__main__":
+    main()
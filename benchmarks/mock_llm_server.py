@@ -0,0 +1,371 @@
+"""
+本地模拟大模型服务（OpenAI 兼容接口）
+
+压测分析/回复流水线时替代 AIHubMix，不消耗真实额度：
+- POST /v1/chat/completions  支持 stream=true（SSE，逐块返回，结尾 data: [DONE]）
+- POST /v1/embeddings        特征哈希向量：相同文本得到相同向量，共享词越多越相似
+- GET  /v1/models
+- GET  /stats、POST /stats/reset  按接口/请求类型/状态码统计请求数
+- GET  /health
+
+返回内容由提示词哈希决定（同一提示词每次返回相同结果）：
+- 分析提示词（含“业务阶段分类”）返回符合提示词 JSON 结构的分析结果
+- 翻译提示词返回带标记的原文
+- 其他（回复生成等）返回 HTML 回复
+
+延迟分布、错误率、429 限流比例可配置（命令行参数或 MOCK_LLM_* 环境变量）：
+    fixed:200 | uniform:100,500 | normal:300,50 | lognormal:800,0.5（中位数ms, sigma）
+
+用法：
+    python -m benchmarks.mock_llm_server --port 8900 --chat-latency lognormal:800,0.5 --rate-limit-rate 0.02
+    AIHUBMIX_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_BASE_URL=http://127.0.0.1:8900/v1 ./start_celery.sh
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.data_generator import build_analysis, build_reply_html
+
+# 各 Embedding 模型的向量维度（其他模型使用 --embedding-dim）
+EMBEDDING_DIMS = {
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+    'text-embedding-ada-002': 1536,
+}
+# 流式返回时每块的词数
+STREAM_CHUNK_WORDS = 4
+
+_TOKENS = re.compile(r'\w+', re.UNICODE)
+
+
+class LatencyDistribution:
+    """延迟分布（毫秒），spec 形如 fixed:200 / uniform:100,500 / normal:300,50 / lognormal:800,0.5"""
+
+    def __init__(self, spec: str):
+        self.spec = spec or 'fixed:0'
+        kind, _, params = self.spec.partition(':')
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(',') if p.strip()]
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"无效的延迟分布: {spec}（示例: fixed:200, uniform:100,500, normal:300,50, lognormal:800,0.5）")
+
+    def sample(self, rng: random.Random) -> float:
+        """采样一次延迟（秒）"""
+        if self.kind == 'fixed':
+            ms = self.params[0]
+        elif self.kind == 'uniform':
+            ms = rng.uniform(*self.params)
+        elif self.kind == 'normal':
+            ms = rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            ms = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0
+        return max(ms, 0) / 1000
+
+
+class MockConfig:
+    """模拟服务配置"""
+
+    def __init__(self, chat_latency: str = 'lognormal:800,0.5', embedding_latency: str = 'lognormal:80,0.3',
+                 stream_chunk_ms: float = 20, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: int = 1, embedding_dim: int = 1536, seed: int = 42):
+        self.chat_latency = LatencyDistribution(chat_latency)
+        self.embedding_latency = LatencyDistribution(embedding_latency)
+        self.stream_chunk_ms = stream_chunk_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.embedding_dim = embedding_dim
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> 'MockConfig':
+        return cls(
+            chat_latency=os.getenv('MOCK_LLM_CHAT_LATENCY', 'lognormal:800,0.5'),
+            embedding_latency=os.getenv('MOCK_LLM_EMBEDDING_LATENCY', 'lognormal:80,0.3'),
+            stream_chunk_ms=float(os.getenv('MOCK_LLM_STREAM_CHUNK_MS', 20)),
+            error_rate=float(os.getenv('MOCK_LLM_ERROR_RATE', 0)),
+            rate_limit_rate=float(os.getenv('MOCK_LLM_RATE_LIMIT_RATE', 0)),
+            retry_after=int(os.getenv('MOCK_LLM_RETRY_AFTER', 1)),
+            embedding_dim=int(os.getenv('MOCK_LLM_EMBEDDING_DIM', 1536)),
+            seed=int(os.getenv('MOCK_LLM_SEED', 42)),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            'chat_latency': self.chat_latency.spec,
+            'embedding_latency': self.embedding_latency.spec,
+            'stream_chunk_ms': self.stream_chunk_ms,
+            'error_rate': self.error_rate,
+            'rate_limit_rate': self.rate_limit_rate,
+            'retry_after': self.retry_after,
+            'embedding_dim': self.embedding_dim,
+            'seed': self.seed,
+        }
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def classify_prompt(prompt: str) -> str:
+    """按提示词内容判断请求类型：analysis / translate / reply"""
+    if '业务阶段分类' in prompt:
+        return 'analysis'
+    if '翻译' in prompt or 'translate' in prompt.lower():
+        return 'translate'
+    return 'reply'
+
+
+def completion_content(kind: str, prompt: str, user_text: str, seed: int) -> str:
+    """
+    根据提示词生成确定性的返回内容
+
+    Args:
+        prompt: 所有消息拼接的完整提示词（决定随机种子）
+        user_text: 最后一条用户消息（翻译时作为原文）
+    """
+    rng = random.Random(seed ^ _digest(prompt))
+    if kind == 'analysis':
+        return json.dumps(build_analysis(rng), ensure_ascii=False, indent=2)
+    if kind == 'translate':
+        # 翻译路由把原文放在“原文内容：”之后，AI 助手把原文作为单独的用户消息
+        original = user_text.split('原文内容：', 1)[-1].split('翻译结果：', 1)[0].strip()
+        return f"[mock translation] {original}"
+    return build_reply_html(rng)
+
+
+def embed(text: str, dim: int) -> List[float]:
+    """特征哈希向量（单位向量）"""
+    vector = [0.0] * dim
+    tokens = _TOKENS.findall(text.lower()) or [text]
+    for token in tokens:
+        h = _digest(token)
+        vector[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class MockStats:
+    """请求统计"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.time()
+        self.requests = Counter()
+        self.tokens = Counter()
+
+    def record(self, endpoint: str, kind: str, status: int):
+        self.requests[f"{endpoint}|{kind}|{status}"] += 1
+
+    def to_dict(self) -> Dict:
+        requests = {}
+        for key, count in sorted(self.requests.items()):
+            endpoint, kind, status = key.split('|')
+            requests.setdefault(endpoint, {}).setdefault(kind, {})[status] = count
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'total': sum(self.requests.values()),
+            'requests': requests,
+            'tokens': dict(self.tokens),
+        }
+
+
+def _error(status: int, message: str, error_type: str, headers: Dict = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": error_type, "code": status}},
+        headers=headers,
+    )
+
+
+def create_app(config: MockConfig = None) -> FastAPI:
+    config = config or MockConfig.from_env()
+    rng = random.Random(config.seed)
+    stats = MockStats()
+    app = FastAPI(title="Mock LLM Server")
+
+    async def inject_failure(endpoint: str, kind: str, latency: LatencyDistribution):
+        """按配置注入 429 / 500（429 立即返回，500 在正常延迟之后返回）"""
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            stats.record(endpoint, kind, 429)
+            return _error(429, "Rate limit reached (mock)", "rate_limit_error",
+                          headers={"Retry-After": str(config.retry_after)})
+        if roll < config.rate_limit_rate + config.error_rate:
+            await asyncio.sleep(latency.sample(rng))
+            stats.record(endpoint, kind, 500)
+            return _error(500, "Internal server error (mock)", "server_error")
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get('model', 'gpt-4o-mini')
+        messages = body.get('messages') or []
+        contents = [
+            m['content'] if isinstance(m.get('content'), str) else json.dumps(m.get('content'), ensure_ascii=False)
+            for m in messages
+        ]
+        prompt = '\n'.join(contents)
+        user_text = next((c for m, c in zip(reversed(messages), reversed(contents)) if m.get('role') == 'user'), prompt)
+        kind = classify_prompt(prompt)
+
+        failure = await inject_failure('chat', kind, config.chat_latency)
+        if failure is not None:
+            return failure
+
+        content = completion_content(kind, prompt, user_text, config.seed)
+        usage = {
+            'prompt_tokens': _estimate_tokens(prompt),
+            'completion_tokens': _estimate_tokens(content),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        stats.tokens['prompt'] += usage['prompt_tokens']
+        stats.tokens['completion'] += usage['completion_tokens']
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        latency = config.chat_latency.sample(rng)
+
+        if body.get('stream'):
+            include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+
+            def chunk(delta: Dict, finish_reason=None, **extra) -> str:
+                data = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if delta is not None else [],
+                    **extra,
+                }
+                return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+            async def events():
+                # 首字延迟使用配置的分布，之后按块间隔返回
+                await asyncio.sleep(latency)
+                yield chunk({'role': 'assistant', 'content': ''})
+                words = re.split(r'(\s+)', content)
+                for start in range(0, len(words), STREAM_CHUNK_WORDS * 2):
+                    yield chunk({'content': ''.join(words[start:start + STREAM_CHUNK_WORDS * 2])})
+                    await asyncio.sleep(config.stream_chunk_ms / 1000)
+                yield chunk({}, 'stop')
+                if include_usage:
+                    yield chunk(None, usage=usage)
+                yield "data: [DONE]\n\n"
+
+            stats.record('chat_stream', kind, 200)
+            return StreamingResponse(events(), media_type='text/event-stream')
+
+        await asyncio.sleep(latency)
+        stats.record('chat', kind, 200)
+        return {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        model = body.get('model', 'text-embedding-3-small')
+        inputs = body.get('input')
+        texts = [inputs] if isinstance(inputs, str) else list(inputs or [])
+
+        failure = await inject_failure('embeddings', 'embedding', config.embedding_latency)
+        if failure is not None:
+            return failure
+
+        dim = int(body.get('dimensions') or EMBEDDING_DIMS.get(model, config.embedding_dim))
+        await asyncio.sleep(config.embedding_latency.sample(rng))
+        prompt_tokens = sum(_estimate_tokens(str(text)) for text in texts)
+        stats.tokens['embedding'] += prompt_tokens
+        stats.record('embeddings', 'embedding', 200)
+        return {
+            'object': 'list',
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': embed(str(text), dim)}
+                for i, text in enumerate(texts)
+            ],
+            'model': model,
+            'usage': {'prompt_tokens': prompt_tokens, 'total_tokens': prompt_tokens},
+        }
+
+    @app.get("/v1/models")
+    async def models():
+        names = ['gpt-4o-mini', 'gpt-4o', *EMBEDDING_DIMS]
+        return {'object': 'list', 'data': [{'id': name, 'object': 'model', 'owned_by': 'mock'} for name in names]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {**stats.to_dict(), 'config': config.to_dict()}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats.reset()
+        return {'success': True}
+
+    @app.get("/health")
+    async def health():
+        return {'status': 'ok'}
+
+    return app
+
+
+def main():
+    defaults = MockConfig.from_env()
+    parser = argparse.ArgumentParser(description="本地模拟大模型服务（OpenAI 兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv('MOCK_LLM_PORT', 8900)))
+    parser.add_argument("--chat-latency", default=defaults.chat_latency.spec, help="对话接口延迟分布（流式为首字延迟）")
+    parser.add_argument("--embedding-latency", default=defaults.embedding_latency.spec, help="Embedding 接口延迟分布")
+    parser.add_argument("--stream-chunk-ms", type=float, default=defaults.stream_chunk_ms, help="流式返回的块间隔（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=int, default=defaults.retry_after, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--embedding-dim", type=int, default=defaults.embedding_dim, help="未知 Embedding 模型的向量维度")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="随机种子（返回内容、延迟、错误注入）")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        chat_latency=args.chat_latency, embedding_latency=args.embedding_latency,
+        stream_chunk_ms=args.stream_chunk_ms, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        embedding_dim=args.embedding_dim, seed=args.seed,
+    )
+
+    import uvicorn
+
+    print(f"🧪 模拟大模型服务: http://{args.host}:{args.port}/v1  {json.dumps(config.to_dict(), ensure_ascii=False)}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+性能基准测试
+
+在固定种子生成的数据上测量核心路径：
+- list_emails            邮件列表（默认首页、深分页、全文搜索、业务阶段筛选、单客户）
+- search_similar         知识库向量检索（查询向量离线生成，不调用 Embedding API）
+- get_funnel_data        销售漏斗统计
+- grade_all_customers    批量客户分级（会写库，放在最后运行）
+- parse_message          EmailReceiver 解析 .eml 样本（附件写入临时工作目录）
+- parse_analysis_result  EmailAIAnalyzer._parse_analysis_result 解析模型输出
+
+每个基准先预热，再运行 --rounds 轮，记录中位数/p95/最小值和每次调用的 SQL 次数。
+结果写入 benchmarks/results/<时间>.json 和 latest.json，并与 thresholds.json 中的阈值、
+基线（results/baseline.json，用 --save-baseline 生成）比较，超出阈值时退出码为 1。
+
+用法：
+    python -m benchmarks.run_benchmarks [--db sqlite|postgresql] [--customers 1000] [--rounds 10]
+                                        [--only list_emails,search_similar] [--eml-dir 真实邮件目录]
+                                        [--regenerate] [--save-baseline] [--baseline 路径]
+"""
+import os
+import io
+import sys
+import json
+import math
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / 'results'
+THRESHOLDS_PATH = BENCH_DIR / 'thresholds.json'
+DEFAULT_WORK_DIR = BENCH_DIR / '.work'
+
+sys.path.insert(0, str(ROOT))
+
+
+class Benchmark:
+    """一个基准测试：func 每调用一次算一轮，items 为每轮处理的条目数（用于换算单条耗时）"""
+
+    def __init__(self, name: str, func: Callable[[], object], items: int = 1):
+        self.name = name
+        self.func = func
+        self.items = items
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def run_benchmark(benchmark: Benchmark, rounds: int, warmup: int) -> Dict:
+    """运行一个基准，返回耗时统计（毫秒）和每轮 SQL 次数"""
+    from src.crm.query_profiler import start_profile, end_profile
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            benchmark.func()
+
+        timings, queries = [], []
+        for _ in range(rounds):
+            token = start_profile(f"benchmark:{benchmark.name}", force=True)
+            start = time.perf_counter()
+            try:
+                benchmark.func()
+            finally:
+                elapsed = time.perf_counter() - start
+                profile = end_profile(token)
+            timings.append(elapsed * 1000)
+            queries.append(profile.count if profile else 0)
+            n_plus_one = len(profile.n_plus_one_candidates()) if profile else 0
+
+    median = statistics.median(timings)
+    return {
+        'rounds': rounds,
+        'items': benchmark.items,
+        'median_ms': round(median, 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'min_ms': round(min(timings), 3),
+        'stdev_ms': round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0,
+        'per_item_ms': round(median / benchmark.items, 4),
+        'queries': max(queries),
+        'n_plus_one_shapes': n_plus_one,
+    }
+
+
+def prepare_environment(args):
+    """选择基准测试数据库（必须在导入 src.crm.database 之前设置）"""
+    os.environ['DB_TYPE'] = args.db
+    if args.db == 'sqlite':
+        os.environ['SQLITE_DB_PATH'] = str(args.work_dir / 'benchmark.db')
+    else:
+        os.environ['DB_NAME'] = args.pg_database
+    # 基准测试不导出链路追踪
+    os.environ.pop('TRACE_EXPORT_FILE', None)
+    os.environ.pop('OTEL_EXPORTER_OTLP_ENDPOINT', None)
+
+
+def ensure_dataset(args, spec) -> Dict:
+    """数据规模/种子与上次生成的一致时直接复用，否则重建"""
+    from src.crm.database import engine, SessionLocal
+    from benchmarks.data_generator import reset_schema, generate_database, generate_eml_corpus
+
+    manifest_path = args.work_dir / f"manifest_{args.db}.json"
+    wanted = {'spec': spec.to_dict(), 'database': engine.url.render_as_string(hide_password=True)}
+    if not args.regenerate and manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        if manifest.get('spec') == wanted['spec'] and manifest.get('database') == wanted['database']:
+            print(f"♻️ 复用已生成的数据: {manifest['counts']}")
+            return manifest['counts']
+
+    if args.db == 'postgresql' and 'bench' not in args.pg_database:
+        raise SystemExit(f"❌ 拒绝重建数据库 {args.pg_database}：基准测试库名称必须包含 bench")
+
+    print(f"🏗️ 生成基准测试数据（seed={spec.seed}）...")
+    start = time.perf_counter()
+    reset_schema(engine)
+    session = SessionLocal()
+    try:
+        counts = generate_database(session, spec)
+    finally:
+        session.close()
+    counts['eml_files'] = len(generate_eml_corpus(args.work_dir / 'eml', spec))
+    print(f"✅ 数据生成完成（{time.perf_counter() - start:.1f}s）: {counts}")
+
+    manifest_path.write_text(json.dumps({**wanted, 'counts': counts}, ensure_ascii=False, indent=2), encoding='utf-8')
+    return counts
+
+
+def build_benchmarks(args, spec) -> List[Benchmark]:
+    from starlette.responses import Response
+    from src.crm.database import SessionLocal
+    from src.api.routers.emails import list_emails
+    from src.api.schemas import EmailOut
+    from src.api.routers.sales_funnel import get_funnel_data
+    from src.api.routers.customer_grading import grade_all_customers
+    from src.ai.vector_knowledge import VectorKnowledgeService
+    from src.ai.email_analyzer import EmailAIAnalyzer
+    from src.email_system.receiver import EmailReceiver
+    from benchmarks.data_generator import benchmark_queries, generate_analysis_results
+
+    db = SessionLocal()
+    benchmarks = []
+
+    def emails_page(filter_: str = '{}', range_: str = '[0,19]', sort: str = '["sent_at","DESC"]'):
+        # 直接调用路由函数时 Query 默认值不会被解析，所有参数都显式传入；
+        # 每轮清空会话的对象缓存并按 response_model 序列化，与一次真实请求的开销一致
+        def call():
+            db.expire_all()
+            items = list_emails(
+                response=Response(), filter=filter_, range=range_, sort=sort,
+                _start=None, _end=None, _sort=None, _order=None,
+                business_stage=None, direction=None, status=None, is_deleted=None, db=db,
+            )
+            return [EmailOut.model_validate(item) for item in items]
+        return call
+
+    deep_offset = spec.customers * spec.emails_per_customer // 2
+    benchmarks += [
+        Benchmark('list_emails.first_page', emails_page()),
+        Benchmark('list_emails.deep_page', emails_page(range_=f"[{deep_offset},{deep_offset + 19}]")),
+        Benchmark('list_emails.search', emails_page(filter_='{"search": "shipment"}')),
+        Benchmark('list_emails.business_stage', emails_page(filter_='{"business_stage": "报价跟进"}')),
+        Benchmark('list_emails.customer', emails_page(filter_=f'{{"customer_id": "{max(spec.customers // 2, 1)}"}}')),
+    ]
+
+    queries = benchmark_queries(spec)
+    query_vectors = dict(queries)
+
+    class OfflineVectorService(VectorKnowledgeService):
+        """查询向量来自数据生成器，不调用 Embedding API"""
+
+        async def create_embedding(self, text: str) -> List[float]:
+            return query_vectors[text]
+
+    vector_service = OfflineVectorService()
+
+    def search(category: Optional[str] = None):
+        async def run_all():
+            for text, _ in queries:
+                await vector_service.search_similar(text, limit=5, category=category, db_session=db)
+        return lambda: asyncio.run(run_all())
+
+    benchmarks += [
+        Benchmark('search_similar', search(), items=len(queries)),
+        Benchmark('search_similar.category', search('FAQ'), items=len(queries)),
+        Benchmark('get_funnel_data', lambda: get_funnel_data(db=db)),
+    ]
+
+    eml_dir = args.eml_dir or (args.work_dir / 'eml')
+    eml_messages = [path.read_bytes() for path in sorted(eml_dir.glob('*.eml'))]
+    if eml_messages:
+        receiver = EmailReceiver('benchmark@bench.example.com', '', imap_host='localhost')
+        attachments_root = args.work_dir / 'parse_message'
+        attachments_root.mkdir(parents=True, exist_ok=True)
+
+        def parse_corpus():
+            # 附件写入 cwd/attachments，切换到工作目录避免污染项目目录
+            cwd = os.getcwd()
+            os.chdir(attachments_root)
+            try:
+                for index, raw in enumerate(eml_messages):
+                    receiver.parse_message(raw, str(index))
+            finally:
+                os.chdir(cwd)
+
+        benchmarks.append(Benchmark('parse_message', parse_corpus, items=len(eml_messages)))
+    else:
+        print(f"⚠️ {eml_dir} 中没有 .eml 文件，跳过 parse_message")
+
+    analyzer = EmailAIAnalyzer(api_key='benchmark')
+    analysis_results = generate_analysis_results(spec)
+
+    def parse_results():
+        for text in analysis_results:
+            analyzer._parse_analysis_result(text)
+
+    benchmarks.append(Benchmark('parse_analysis_result', parse_results, items=len(analysis_results)))
+
+    # 批量分级会更新客户统计字段，放在最后，不影响前面的基准
+    benchmarks.append(Benchmark('grade_all_customers', lambda: grade_all_customers(db=db)))
+    return benchmarks
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def check_thresholds(results: Dict, baseline: Optional[Dict], thresholds: Dict) -> List[str]:
+    """
+    检查阈值，返回失败原因列表
+
+    thresholds.json:
+        {
+            "default": {"max_regression": 0.25},
+            "benchmarks": {"get_funnel_data": {"max_median_ms": 50, "max_queries": 8, "max_regression": 0.3}}
+        }
+    - max_regression: 中位数相对基线的最大增幅（需要基线；基线必须来自同一台机器、同一数据规模）
+    - max_median_ms / max_p95_ms: 绝对上限
+    - max_queries: 每轮 SQL 次数上限（与机器无关，适合在 CI 中检查 N+1 回归）
+    """
+    failures = []
+    default = thresholds.get('default', {})
+    baseline_results = (baseline or {}).get('benchmarks', {})
+    for name, result in results['benchmarks'].items():
+        limits = {**default, **thresholds.get('benchmarks', {}).get(name, {})}
+        if 'max_median_ms' in limits and result['median_ms'] > limits['max_median_ms']:
+            failures.append(f"{name}: 中位数 {result['median_ms']}ms > {limits['max_median_ms']}ms")
+        if 'max_p95_ms' in limits and result['p95_ms'] > limits['max_p95_ms']:
+            failures.append(f"{name}: p95 {result['p95_ms']}ms > {limits['max_p95_ms']}ms")
+        if 'max_queries' in limits and result['queries'] > limits['max_queries']:
+            failures.append(f"{name}: SQL {result['queries']} 次 > {limits['max_queries']} 次")
+        previous = baseline_results.get(name)
+        if previous and 'max_regression' in limits and previous['median_ms'] > 0:
+            change = result['median_ms'] / previous['median_ms'] - 1
+            result['change_vs_baseline'] = round(change, 4)
+            if change > limits['max_regression']:
+                failures.append(
+                    f"{name}: 比基线慢 {change:.0%}（{previous['median_ms']}ms → {result['median_ms']}ms，"
+                    f"允许 {limits['max_regression']:.0%}）"
+                )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    parser.add_argument("--db", choices=['sqlite', 'postgresql'], default='sqlite', help="数据库类型")
+    parser.add_argument("--pg-database", default=os.getenv('BENCH_DB_NAME', 'crm_benchmark'),
+                        help="PostgreSQL 基准测试库名（连接参数取 DB_USER/DB_HOST 等环境变量）")
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR, help="SQLite 库、.eml 样本等的存放目录")
+    parser.add_argument("--eml-dir", type=Path, default=None, help="使用已有的 .eml 目录代替生成的样本")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--customers", type=int, default=1000, help="客户数量")
+    parser.add_argument("--emails-per-customer", type=int, default=20, help="每个客户的平均邮件数")
+    parser.add_argument("--leads", type=int, default=500, help="线索数量")
+    parser.add_argument("--documents", type=int, default=24, help="知识库文档数量")
+    parser.add_argument("--chunks-per-document", type=int, default=40, help="每个文档的分块数")
+    parser.add_argument("--embedding-dim", type=int, default=1536, help="向量维度")
+    parser.add_argument("--eml-count", type=int, default=120, help=".eml 样本数量")
+    parser.add_argument("--rounds", type=int, default=10, help="每个基准的运行轮数")
+    parser.add_argument("--warmup", type=int, default=2, help="预热轮数")
+    parser.add_argument("--only", default=None, help="只运行名称以这些前缀开头的基准（逗号分隔）")
+    parser.add_argument("--regenerate", action="store_true", help="强制重新生成数据")
+    parser.add_argument("--baseline", type=Path, default=RESULTS_DIR / 'baseline.json', help="基线结果文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--thresholds", type=Path, default=THRESHOLDS_PATH, help="阈值配置文件")
+    args = parser.parse_args()
+
+    # N+1 / 慢查询以统计形式写入结果，不逐轮输出警告
+    logging.getLogger('src.crm.query_profiler').setLevel(logging.ERROR)
+
+    args.work_dir = args.work_dir.resolve()
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    prepare_environment(args)
+
+    from benchmarks.data_generator import DatasetSpec
+
+    spec = DatasetSpec(
+        customers=args.customers, emails_per_customer=args.emails_per_customer, leads=args.leads,
+        documents=args.documents, chunks_per_document=args.chunks_per_document,
+        embedding_dim=args.embedding_dim, eml_count=args.eml_count, seed=args.seed,
+    )
+    counts = ensure_dataset(args, spec)
+
+    benchmarks = build_benchmarks(args, spec)
+    if args.only:
+        prefixes = tuple(p.strip() for p in args.only.split(',') if p.strip())
+        benchmarks = [b for b in benchmarks if b.name.startswith(prefixes)]
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': args.db,
+            'spec': spec.to_dict(),
+            'counts': counts,
+            'rounds': args.rounds,
+            'warmup': args.warmup,
+        },
+        'benchmarks': {},
+    }
+
+    print(f"\n⏱️ 运行 {len(benchmarks)} 个基准（{args.rounds} 轮，预热 {args.warmup} 轮）")
+    print(f"{'基准':<30}{'中位数(ms)':>12}{'p95(ms)':>12}{'单条(ms)':>12}{'SQL':>8}{'N+1':>6}")
+    for benchmark in benchmarks:
+        result = run_benchmark(benchmark, args.rounds, args.warmup)
+        results['benchmarks'][benchmark.name] = result
+        print(f"{benchmark.name:<30}{result['median_ms']:>12.2f}{result['p95_ms']:>12.2f}"
+              f"{result['per_item_ms']:>12.3f}{result['queries']:>8}{result['n_plus_one_shapes']:>6}")
+
+    baseline = None
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        if baseline.get('meta', {}).get('spec') != spec.to_dict():
+            print(f"⚠️ 基线的数据规模与本次不同，不做回归比较: {args.baseline}")
+            baseline = None
+    thresholds = json.loads(args.thresholds.read_text(encoding='utf-8')) if args.thresholds.exists() else {}
+    failures = check_thresholds(results, baseline, thresholds)
+    results['failures'] = failures
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    result_path = RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{args.db}.json"
+    result_path.write_text(output, encoding='utf-8')
+    (RESULTS_DIR / 'latest.json').write_text(output, encoding='utf-8')
+    print(f"\n💾 结果已保存: {result_path}")
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(output, encoding='utf-8')
+        print(f"📌 已保存为基线: {args.baseline}")
+
+    if failures:
+        print(f"\n❌ {len(failures)} 项超出阈值:")
+        for failure in failures:
+            print(f"   - {failure}")
+        sys.exit(1)
+    print("\n✅ 全部基准在阈值内")
+
+
+if __name__ == "__main__":
+    main()
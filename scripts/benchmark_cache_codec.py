@@ -0,0 +1,131 @@
+"""
+缓存编解码基准测试
+对比各序列化格式/压缩算法在真实 analyze_email 结果上的体积和编解码耗时
+
+样本来源（按顺序）：
+1. Redis 中已缓存的 email_analysis:* 结果（线上真实AI分析结果）
+2. 数据库中的入站邮件，经规则引擎生成与 analyze_email 相同结构的结果
+
+用法：
+    python scripts/benchmark_cache_codec.py [--samples 200] [--rounds 20]
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.utils.codec import CacheCodec, SERIALIZERS, COMPRESSORS
+
+
+def load_cached_samples(limit: int) -> list:
+    """读取Redis中已缓存的邮件分析结果"""
+    from src.utils.cache import cache, _entry_value
+
+    if not cache.available:
+        return []
+
+    samples = []
+    for key in cache.client.scan_iter(match="email_analysis:*", count=500):
+        value = _entry_value(cache.get(key))
+        if value is not None:
+            samples.append(value)
+        if len(samples) >= limit:
+            break
+    return samples
+
+
+def load_db_samples(limit: int) -> list:
+    """用数据库中的真实邮件生成 analyze_email 结构的结果（规则引擎，不调用API）"""
+    from src.crm.database import get_session, EmailHistory
+    from src.ai.email_analyzer import get_analyzer
+
+    analyzer = get_analyzer()
+    db = get_session()
+    try:
+        emails = db.query(EmailHistory.subject, EmailHistory.body, EmailHistory.from_email).filter(
+            EmailHistory.direction == 'inbound'
+        ).order_by(EmailHistory.id.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+    return [
+        {
+            "success": True,
+            "analysis": analyzer._rule_based_analysis(subject or '', body or '', from_email),
+            "model": "rule_engine",
+            "fallback": True,
+            "analyzed_at": datetime.utcnow().isoformat()
+        }
+        for subject, body, from_email in emails
+    ]
+
+
+def measure(codec: CacheCodec, samples: list, rounds: int) -> dict:
+    encoded = [codec.encode(sample) for sample in samples]
+    assert [CacheCodec.decode(e) for e in encoded] == samples, "往返结果不一致"
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sample in samples:
+            codec.encode(sample)
+    encode_us = (time.perf_counter() - start) / (rounds * len(samples)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for data in encoded:
+            CacheCodec.decode(data)
+    decode_us = (time.perf_counter() - start) / (rounds * len(samples)) * 1e6
+
+    return {
+        "avg_bytes": sum(len(e) for e in encoded) / len(encoded),
+        "encode_us": encode_us,
+        "decode_us": decode_us,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缓存编解码基准测试")
+    parser.add_argument("--samples", type=int, default=200, help="样本数量")
+    parser.add_argument("--rounds", type=int, default=20, help="每个组合重复次数")
+    parser.add_argument("--compress-min-bytes", type=int, default=1024, help="压缩阈值")
+    args = parser.parse_args()
+
+    samples = load_cached_samples(args.samples)
+    source = "Redis email_analysis 缓存"
+    if len(samples) < args.samples:
+        samples += load_db_samples(args.samples - len(samples))
+        source += " + 数据库邮件(规则引擎)"
+
+    if not samples:
+        print("❌ 没有可用样本（Redis 无缓存且数据库无入站邮件）")
+        return
+
+    print(f"📊 样本: {len(samples)} 条（{source}），每组合 {args.rounds} 轮")
+    print(f"{'序列化':<10}{'压缩':<8}{'平均体积(B)':>14}{'编码(μs)':>12}{'解码(μs)':>12}{'体积比':>10}")
+
+    baseline = None
+    for serializer in SERIALIZERS:
+        for compressor in ['none', *COMPRESSORS]:
+            codec = CacheCodec(serializer, compressor, args.compress_min_bytes)
+            result = measure(codec, samples, args.rounds)
+            if baseline is None:
+                baseline = result["avg_bytes"]
+            print(
+                f"{serializer:<10}{compressor:<8}{result['avg_bytes']:>14.0f}"
+                f"{result['encode_us']:>12.1f}{result['decode_us']:>12.1f}"
+                f"{result['avg_bytes'] / baseline:>10.2f}"
+            )
+
+    print(f"\n当前默认配置: {CacheCodec().describe()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+评估本地邮件分类器
+在留出集（与训练脚本相同的固定划分）上输出：
+1. 各类别精确率 / 召回率
+2. 不同置信度阈值下的本地处理比例和本地结果的准确率，用于选择 EMAIL_CASCADE_THRESHOLD
+3. 单条推理耗时
+
+用法：
+    python scripts/eval_email_classifier.py [--model models/email_classifier.npz] [--stages 垃圾营销]
+"""
+import sys
+import time
+import argparse
+from collections import Counter
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.crm.database import get_session
+from src.ai.local_classifier import (
+    LocalEmailClassifier, EMAIL_CLASSIFIER_PATH, is_holdout, load_labeled_emails,
+)
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评估本地邮件分类器")
+    parser.add_argument("--model", default=str(EMAIL_CLASSIFIER_PATH), help="模型路径")
+    parser.add_argument("--limit", type=int, default=None, help="最多读取的邮件数（默认全部）")
+    parser.add_argument("--stages", default="垃圾营销", help="允许本地处理的业务阶段（逗号分隔，* 表示全部）")
+    args = parser.parse_args()
+
+    classifier = LocalEmailClassifier.load(args.model)
+    allowed = {s.strip() for s in args.stages.split(',') if s.strip()}
+
+    db = get_session()
+    try:
+        rows = [row for row in load_labeled_emails(db, args.limit) if is_holdout(row[0])]
+    finally:
+        db.close()
+
+    if not rows:
+        print("❌ 留出集为空")
+        return
+
+    start = time.perf_counter()
+    predictions = [(classifier.predict(subject, body), stage) for _, subject, body, stage in rows]
+    per_email_ms = (time.perf_counter() - start) / len(rows) * 1000
+
+    correct = sum(predicted == stage for (predicted, _), stage in predictions)
+    print(f"📊 留出集 {len(rows)} 条，整体准确率 {correct / len(rows):.3f}，单条推理 {per_email_ms:.2f}ms")
+
+    # 各类别精确率 / 召回率
+    true_positive, predicted_count, actual_count = Counter(), Counter(), Counter()
+    for (predicted, _), stage in predictions:
+        predicted_count[predicted] += 1
+        actual_count[stage] += 1
+        if predicted == stage:
+            true_positive[stage] += 1
+
+    print(f"\n{'业务阶段':<10}{'样本数':>8}{'精确率':>10}{'召回率':>10}")
+    for stage in sorted(actual_count):
+        precision = true_positive[stage] / predicted_count[stage] if predicted_count[stage] else 0
+        recall = true_positive[stage] / actual_count[stage]
+        print(f"{stage:<10}{actual_count[stage]:>8}{precision:>10.3f}{recall:>10.3f}")
+
+    # 阈值扫描：本地处理比例（= 节省的大模型调用）和本地结果准确率
+    print(f"\n允许本地处理: {', '.join(sorted(allowed))}")
+    print(f"{'阈值':<8}{'本地处理':>10}{'占比':>8}{'本地准确率':>12}")
+    for threshold in THRESHOLDS:
+        local = [
+            (predicted, stage) for (predicted, confidence), stage in predictions
+            if confidence >= threshold and ('*' in allowed or predicted in allowed)
+        ]
+        accuracy = sum(p == s for p, s in local) / len(local) if local else 0
+        print(f"{threshold:<8}{len(local):>10}{len(local) / len(rows):>8.1%}{accuracy:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+训练本地邮件分类器
+用历史入站邮件的 AI 分析结果（business_stage）训练分级分类第一级的本地模型，
+训练完成后在留出集上输出准确率，评估细节见 scripts/eval_email_classifier.py
+
+用法：
+    python scripts/train_email_classifier.py [--limit 50000] [--epochs 5] [--output models/email_classifier.npz]
+"""
+import sys
+import time
+import logging
+import argparse
+from collections import Counter
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.crm.database import get_session
+from src.ai.local_classifier import (
+    LocalEmailClassifier, DEFAULT_N_FEATURES, EMAIL_CLASSIFIER_PATH,
+    email_text, featurize, is_holdout, load_labeled_emails,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练本地邮件分类器")
+    parser.add_argument("--limit", type=int, default=None, help="最多读取的邮件数（默认全部）")
+    parser.add_argument("--epochs", type=int, default=5, help="训练轮数")
+    parser.add_argument("--learning-rate", type=float, default=0.5, help="初始学习率")
+    parser.add_argument("--n-features", type=int, default=DEFAULT_N_FEATURES, help="哈希特征维度")
+    parser.add_argument("--min-class-size", type=int, default=20, help="样本数少于该值的类别不参与训练")
+    parser.add_argument("--output", default=str(EMAIL_CLASSIFIER_PATH), help="模型输出路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    db = get_session()
+    try:
+        rows = load_labeled_emails(db, args.limit)
+    finally:
+        db.close()
+
+    train = [row for row in rows if not is_holdout(row[0])]
+    holdout = [row for row in rows if is_holdout(row[0])]
+
+    class_sizes = Counter(stage for _, _, _, stage in train)
+    labels = sorted(stage for stage, size in class_sizes.items() if size >= args.min_class_size)
+    if len(labels) < 2:
+        print(f"❌ 训练数据不足：可用类别 {dict(class_sizes)}")
+        return
+
+    print(f"📊 样本: 训练 {len(train)} 条 / 留出 {len(holdout)} 条")
+    for stage in labels:
+        print(f"   {stage}: {class_sizes[stage]}")
+
+    label_index = {label: i for i, label in enumerate(labels)}
+    start = time.perf_counter()
+    samples, targets = [], []
+    for _, subject, body, stage in train:
+        if stage in label_index:
+            samples.append(featurize(email_text(subject, body), args.n_features))
+            targets.append(label_index[stage])
+    print(f"🧪 特征提取完成: {len(samples)} 条, {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    classifier = LocalEmailClassifier(labels, args.n_features).fit(
+        samples, targets, epochs=args.epochs, learning_rate=args.learning_rate
+    )
+    print(f"🏋️ 训练完成: {time.perf_counter() - start:.1f}s")
+
+    evaluated = [(subject, body, stage) for _, subject, body, stage in holdout if stage in label_index]
+    if evaluated:
+        correct = sum(classifier.predict(subject, body)[0] == stage for subject, body, stage in evaluated)
+        print(f"🎯 留出集准确率: {correct / len(evaluated):.3f}（{len(evaluated)} 条）")
+
+    classifier.save(args.output)
+    print(f"💾 模型已保存: {args.output}")
+    print("   运行 scripts/eval_email_classifier.py 选择 EMAIL_CASCADE_THRESHOLD")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ AI 邮件分析器
 
 import os
 import json
+import time
 import traceback
 import logging
 from typing import Dict, Optional, List
@@ -13,9 +14,19 @@ from datetime import datetime
 
 # 导入缓存装饰器
 from src.utils.cache import async_cached
+from src.ai.email_compactor import compact_email_body
+from src.utils.keyword_matcher import get_rule_set
+from src.utils.metrics import LLM_REQUEST_DURATION, LLM_TOKENS
+from src.utils.tracing import traced, start_span, SPAN_KIND_CLIENT
 
 logger = logging.getLogger(__name__)
 
+# 分类模式：llm（全部交给大模型）/ cascade（本地分类器置信度足够时直接出结果，其余交给大模型）
+EMAIL_CLASSIFIER_MODE = os.getenv('EMAIL_CLASSIFIER_MODE', 'llm')
+EMAIL_CASCADE_THRESHOLD = float(os.getenv('EMAIL_CASCADE_THRESHOLD', 0.9))
+# 允许在本地出结果的业务阶段（逗号分隔，* 表示全部）；默认只有垃圾营销，其他邮件需要大模型的完整分析
+EMAIL_CASCADE_LOCAL_STAGES = os.getenv('EMAIL_CASCADE_LOCAL_STAGES', '垃圾营销')
+
 
 class CircuitBreaker:
     """简单的熔断器实现"""
@@ -103,7 +114,8 @@ class EmailAIAnalyzer:
         # 初始化熔断器（5次失败后开启，60秒后尝试恢复）
         self.circuit_breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=60)
         
-    @async_cached(prefix="email_analysis", ttl=3600)  # 缓存1小时
+    @traced("ai.analyze_email")
+    @async_cached(prefix="email_analysis", ttl=3600, stale_ttl=600)  # 缓存1小时，过期后10分钟内后台刷新
     async def analyze_email(
         self, 
         subject: str, 
@@ -123,6 +135,11 @@ class EmailAIAnalyzer:
         返回:
             分析结果字典
         """
+        # 分级分类：本地分类器有把握的邮件不调用大模型
+        local_result = self._classify_locally(subject, body, from_email)
+        if local_result:
+            return local_result
+        
         try:
             # 使用熔断器调用API
             result = await self.circuit_breaker.call(
@@ -161,6 +178,60 @@ class EmailAIAnalyzer:
                     "analysis": self._get_default_analysis()
                 }
     
+    def _classify_locally(self, subject: str, body: str, from_email: str = None) -> Optional[Dict]:
+        """
+        本地分类器判断（cascade 模式）
+        
+        返回:
+            置信度达到阈值且业务阶段允许本地处理时返回分析结果，否则返回 None（交给大模型）
+        """
+        if EMAIL_CLASSIFIER_MODE != 'cascade':
+            return None
+        
+        from src.ai.local_classifier import get_local_classifier, LOCAL_SUMMARY_PREFIX
+        
+        classifier = get_local_classifier()
+        if classifier is None:
+            return None
+        
+        try:
+            stage, confidence = classifier.predict(subject, body)
+        except Exception as e:
+            logger.warning(f"本地分类失败，交给大模型: {str(e)}")
+            return None
+        
+        allowed = {s.strip() for s in EMAIL_CASCADE_LOCAL_STAGES.split(',') if s.strip()}
+        if confidence < EMAIL_CASCADE_THRESHOLD or ('*' not in allowed and stage not in allowed):
+            logger.debug(f"本地分类不确定，交给大模型: {stage} ({confidence:.2f})")
+            return None
+        
+        category = self._map_stage_to_category(stage)
+        analysis = self._rule_based_analysis(subject, body, from_email)
+        analysis.update({
+            "business_stage": stage,
+            "category": category,
+            "summary": f"{LOCAL_SUMMARY_PREFIX}: {stage}（置信度 {confidence:.2f}）",
+            "key_points": [],
+            "suggested_tags": [category],
+        })
+        if category == 'spam':
+            analysis.update({
+                "sentiment": "neutral",
+                "urgency_level": "low",
+                "purchase_intent": "low",
+                "requires_urgent_response": False,
+                "next_action": "无需处理",
+            })
+        
+        logger.info(f"本地分类完成（未调用大模型）: {stage} ({confidence:.2f})")
+        return {
+            "success": True,
+            "analysis": analysis,
+            "model": "local_classifier",
+            "confidence": confidence,
+            "analyzed_at": datetime.utcnow().isoformat()
+        }
+    
     async def _analyze_with_api(
         self,
         subject: str,
@@ -169,8 +240,8 @@ class EmailAIAnalyzer:
         model: str = "gpt-4o-mini"
     ) -> Dict:
         """通过API进行分析（内部方法）"""
-        # 构建分析提示词
-        prompt = self._build_analysis_prompt(subject, body, from_email)
+        # 构建分析提示词（正文先去掉引用链/签名/HTML，并按模型预算截断）
+        prompt = self._build_analysis_prompt(subject, compact_email_body(body, model), from_email)
         
         # 调用 AI API
         result = await self._call_api(prompt, model)
@@ -302,12 +373,27 @@ class EmailAIAnalyzer:
             "max_tokens": 2000
         }
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+        with start_span("llm.chat", SPAN_KIND_CLIENT, {"llm.model": model, "llm.prompt_chars": len(prompt)}) as span:
+            start = time.perf_counter()
+            status = "error"
+            try:
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    response = await client.post(url, json=payload, headers=headers)
+                    status = str(response.status_code)
+                    response.raise_for_status()
+                    
+                    data = response.json()
+                    content = data['choices'][0]['message']['content']
+            finally:
+                LLM_REQUEST_DURATION.labels(model, status).observe(time.perf_counter() - start)
             
-            data = response.json()
-            content = data['choices'][0]['message']['content']
+            usage = data.get('usage') or {}
+            LLM_TOKENS.labels(model, 'prompt').inc(usage.get('prompt_tokens') or 0)
+            LLM_TOKENS.labels(model, 'completion').inc(usage.get('completion_tokens') or 0)
+            if span is not None:
+                span.set_attribute("http.status_code", int(status))
+                span.set_attribute("llm.prompt_tokens", usage.get('prompt_tokens'))
+                span.set_attribute("llm.completion_tokens", usage.get('completion_tokens'))
             
             return content
     
@@ -435,49 +521,12 @@ class EmailAIAnalyzer:
     
     def _rule_based_analysis(self, subject: str, body: str, from_email: str = None) -> Dict:
         """基于规则的降级分析"""
-        text = f"{subject} {body}".lower()
-        
-        # 关键词规则库
-        keywords = {
-            'urgent': ['urgent', 'asap', '紧急', '急'],
-            'quotation': ['quote', 'price', '报价', '价格', 'quotation'],
-            'inquiry': ['inquiry', 'interested', 'want to know', '咨询', '询问'],
-            'order': ['order', 'purchase', 'buy', '订单', '购买'],
-            'sample': ['sample', '样品', 'trial'],
-            'complaint': ['complaint', 'problem', 'issue', '投诉', '问题'],
-        }
-        
-        # 情感分析
-        sentiment = "neutral"
-        if any(word in text for word in ['thank', 'great', 'excellent', '满意']):
-            sentiment = "positive"
-        elif any(word in text for word in ['complaint', 'angry', 'disappointed', '投诉']):
-            sentiment = "negative"
-        elif any(word in text for word in keywords['urgent']):
-            sentiment = "urgent"
-        
-        # 分类判断
-        category = "inquiry"
-        if any(word in text for word in keywords['order']):
-            category = "order"
-        elif any(word in text for word in keywords['quotation']):
-            category = "quotation"
-        elif any(word in text for word in keywords['sample']):
-            category = "sample"
-        elif any(word in text for word in keywords['complaint']):
-            category = "complaint"
-        
-        # 紧急度判断
-        urgency_level = "medium"
-        if any(word in text for word in keywords['urgent']):
-            urgency_level = "high"
-        
-        # 购买意向
-        purchase_intent = "medium"
-        if any(word in text for word in keywords['order']):
-            purchase_intent = "high"
-        elif 'price' in text or '价格' in text:
-            purchase_intent = "high"
+        # 关键词规则在 config/keyword_rules.json 中维护，一次扫描得出全部维度
+        result = get_rule_set('email_analyzer').evaluate(f"{subject} {body}")
+        sentiment = result['sentiment']
+        category = result['category']
+        urgency_level = result['urgency_level']
+        purchase_intent = result['purchase_intent']
         
         logger.info(f"规则引擎分析完成: 分类={category}, 情感={sentiment}, 紧急度={urgency_level}")
         
@@ -523,6 +572,7 @@ class EmailAIAnalyzer:
             "requires_urgent_response": False
         }
     
+    @traced("ai.generate_reply")
     async def generate_reply(
         self,
         subject: str,
@@ -549,6 +599,9 @@ class EmailAIAnalyzer:
             回复内容字典
         """
         try:
+            # 正文先去掉引用链/签名/HTML，并按模型预算截断（知识库检索也使用压缩后的正文）
+            body = compact_email_body(body, model)
+            
             # 🔥 新增：如果启用知识库，先检索相关知识
             knowledge_context = None
             if use_knowledge_base:
@@ -0,0 +1,287 @@
+"""
+邮件正文压缩（调用大模型之前）
+
+长邮件线程里大部分内容是引用的历史邮件、签名、免责声明和 HTML 残留，
+直接塞进提示词会浪费大量 token，还会触发模型的长度上限。这里按顺序处理：
+
+1. HTML 转纯文本（去掉 style/script、标签、实体）
+2. 截掉引用链（"On ... wrote:"、"-----Original Message-----"、完整的 Outlook 头、"> " 引用行等）
+3. 去掉签名（"-- " 分隔符、"Sent from my iPhone"、落款之后只剩姓名/联系方式时的联系方式块）
+4. 去掉免责声明段落（命中多个关键词，或位于末尾的长段落）
+5. 按模型的 token 预算截断（安装了 tiktoken 时精确计数，否则按字符估算）
+
+用法：
+    body = compact_email_body(body, model="gpt-4o-mini")
+"""
+import os
+import re
+import html
+import logging
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 各模型允许邮件正文占用的 token 数（提示词模板、知识库内容和输出另算）
+MODEL_BODY_TOKEN_BUDGET = {
+    'gpt-4o-mini': 3000,
+    'gpt-4o': 3000,
+    'gpt-4.1-mini': 3000,
+    'gpt-3.5-turbo': 1500,
+}
+DEFAULT_BODY_TOKEN_BUDGET = int(os.getenv('EMAIL_BODY_TOKEN_BUDGET', 2000))
+
+TRUNCATION_MARKER = "\n[...后续内容已省略...]"
+
+_HTML_HINT = re.compile(r'<(html|body|div|p|br|table|span|font)\b', re.IGNORECASE)
+_HTML_DROP_BLOCKS = re.compile(r'<(style|script|head|title)[^>]*>.*?</\1>', re.IGNORECASE | re.DOTALL)
+_HTML_BLOCKQUOTE = re.compile(r'<blockquote[^>]*>.*?</blockquote>', re.IGNORECASE | re.DOTALL)
+_HTML_BREAKS = re.compile(r'<\s*(br|/p|/div|/tr|/li|/h[1-6])\s*/?>', re.IGNORECASE)
+_HTML_TAGS = re.compile(r'<[^>]+>')
+_HTML_COMMENTS = re.compile(r'<!--.*?-->', re.DOTALL)
+
+# 引用链开始的标志行（匹配到的行及之后的内容全部截掉）
+_QUOTE_HEADERS = [
+    re.compile(r'^\s*On .{0,200}wrote:\s*$', re.IGNORECASE),
+    re.compile(r'^\s*-{2,}\s*(Original|Forwarded) Message\s*-{2,}', re.IGNORECASE),
+    re.compile(r'^\s*_{10,}\s*$'),
+    re.compile(r'^\s*在.{0,200}(写道|wrote)[:：]\s*$'),
+    re.compile(r'^\s*-{2,}\s*原始邮件\s*-{2,}'),
+]
+# Outlook 引用头："From:/发件人:" 之后紧跟的几行里同时出现 Sent/Date 和 Subject 才算，
+# 正文里单独的 "From: ..." "To: ..." 不会被当成引用开始
+_OUTLOOK_FROM = re.compile(r'^\s*(From|发件人)[:：]\s*\S', re.IGNORECASE)
+_OUTLOOK_SENT = re.compile(r'^\s*(Sent|Date|发送时间|日期)[:：]', re.IGNORECASE)
+_OUTLOOK_SUBJECT = re.compile(r'^\s*(Subject|主题)[:：]', re.IGNORECASE)
+_OUTLOOK_HEADER_LINES = 6
+
+_SIGNATURE_DELIMITERS = [
+    re.compile(r'^--\s*$'),
+    re.compile(r'^\s*(Sent from my|Get Outlook for|发自我的)\s*\w+', re.IGNORECASE),
+]
+_SIGN_OFFS = re.compile(
+    r'^\s*(best regards|kind regards|warm regards|regards|best wishes|best|thanks|thank you|'
+    r'many thanks|cheers|sincerely|yours sincerely|yours faithfully|此致|祝好|谢谢)[,，!.。]?\s*$',
+    re.IGNORECASE
+)
+# 落款之后最多保留的行数（通常是姓名），其余联系方式块丢弃
+_SIGN_OFF_KEEP_LINES = 1
+# 落款出现在最后 N 行之内才当作签名处理，避免误删正文
+_SIGN_OFF_TAIL_LINES = 12
+# 落款之前至少要有这么多字符的正文（"Hi Tom,\n\nThanks!" 里的 Thanks 是开场白，不是落款）
+_SIGN_OFF_MIN_BODY_CHARS = 30
+# 落款之后的行必须都像签名：联系方式，或不成句的短行（姓名/职位/公司）
+_CONTACT_LINE = re.compile(
+    r'(@|https?://|www\.|\+?\d[\d\s()\-]{6,}\d|'
+    r'^\s*(tel|phone|mob(ile)?|fax|e-?mail|web(site)?|add(ress)?|skype|wechat|whatsapp|'
+    r'电话|手机|传真|邮箱|网址|地址|微信)\b\s*[:：.]?)',
+    re.IGNORECASE
+)
+_COMPANY_SUFFIX = re.compile(r'\b(ltd|inc|co|corp|llc|gmbh)\.?$', re.IGNORECASE)
+_SIGNATURE_SHORT_LINE_CHARS = 40
+_SIGNATURE_SHORT_LINE_WORDS = 6
+
+_DISCLAIMER_HINTS = re.compile(
+    r'(confidential|intended (solely|only) for|privileged|if you (have )?received this (e-?mail|message) in error|'
+    r'disclaimer|virus|please consider the environment|unsubscribe|免责声明|保密|仅供指定收件人)',
+    re.IGNORECASE
+)
+# 命中这么多个不同关键词的段落才当作免责声明；只命中一个时，须是邮件最后一段且足够长
+_DISCLAIMER_MIN_HINTS = 2
+_DISCLAIMER_TAIL_MIN_CHARS = 200
+
+_CJK_CHARS = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]')
+
+
+def html_to_text(content: str) -> str:
+    """HTML 转纯文本（引用块 <blockquote> 直接丢弃）"""
+    text = _HTML_COMMENTS.sub('', content)
+    text = _HTML_DROP_BLOCKS.sub('', text)
+    text = _HTML_BLOCKQUOTE.sub('', text)
+    text = _HTML_BREAKS.sub('\n', text)
+    text = _HTML_TAGS.sub('', text)
+    return html.unescape(text).replace('\xa0', ' ')
+
+
+def _is_outlook_header(lines, i: int) -> bool:
+    """第 i 行起是否是完整的 Outlook 引用头（From + Sent/Date + Subject）"""
+    if not _OUTLOOK_FROM.match(lines[i]):
+        return False
+    following = lines[i + 1:i + 1 + _OUTLOOK_HEADER_LINES]
+    return (any(_OUTLOOK_SENT.match(line) for line in following)
+            and any(_OUTLOOK_SUBJECT.match(line) for line in following))
+
+
+def _quote_start(lines) -> Optional[int]:
+    """找到引用链开始的行号"""
+    for i, line in enumerate(lines):
+        if any(pattern.match(line) for pattern in _QUOTE_HEADERS) or _is_outlook_header(lines, i):
+            return i
+    return None
+
+
+def strip_quoted(text: str) -> str:
+    """截掉引用的历史邮件"""
+    lines = text.split('\n')
+    start = _quote_start(lines)
+    # 引用头前面没有内容时说明整封都是转发内容，保留原文
+    if start is not None and any(line.strip() for line in lines[:start]):
+        lines = lines[:start]
+    return '\n'.join(line for line in lines if not line.lstrip().startswith('>'))
+
+
+def _is_signature_line(line: str) -> bool:
+    """联系方式行，或不成句的短行（姓名、职位、公司名）"""
+    stripped = line.strip()
+    if _CONTACT_LINE.search(stripped):
+        return True
+    if len(stripped) > _SIGNATURE_SHORT_LINE_CHARS or len(stripped.split()) > _SIGNATURE_SHORT_LINE_WORDS:
+        return False
+    if stripped[-1] in '.?!。？！' and not _COMPANY_SUFFIX.search(stripped):
+        return False
+    return True
+
+
+def _is_sign_off(lines, i: int) -> bool:
+    """第 i 行是否是签名前的落款：前面有足够的正文，后面只剩姓名/联系方式"""
+    if not _SIGN_OFFS.match(lines[i]):
+        return False
+    body = ''.join(line.strip() for line in lines[:i])
+    if len(body) < _SIGN_OFF_MIN_BODY_CHARS:
+        return False
+    return all(_is_signature_line(line) for line in lines[i + 1:] if line.strip())
+
+
+def strip_signature(text: str) -> str:
+    """去掉签名块"""
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        if any(pattern.match(line) for pattern in _SIGNATURE_DELIMITERS) and any(l.strip() for l in lines[:i]):
+            lines = lines[:i]
+            break
+
+    tail_start = max(0, len(lines) - _SIGN_OFF_TAIL_LINES)
+    for i in range(len(lines) - 1, tail_start - 1, -1):
+        if _is_sign_off(lines, i):
+            kept, names = [], 0
+            for following in lines[i + 1:]:
+                if names >= _SIGN_OFF_KEEP_LINES:
+                    break
+                if following.strip():
+                    kept.append(following)
+                    names += 1
+            lines = lines[:i + 1] + kept
+            break
+    return '\n'.join(lines)
+
+
+def _is_disclaimer(paragraph: str, is_last: bool) -> bool:
+    hints = {match.group(0).lower() for match in _DISCLAIMER_HINTS.finditer(paragraph)}
+    if len(hints) >= _DISCLAIMER_MIN_HINTS:
+        return True
+    return bool(hints) and is_last and len(paragraph.strip()) >= _DISCLAIMER_TAIL_MIN_CHARS
+
+
+def strip_disclaimers(text: str) -> str:
+    """去掉免责声明段落（按空行分段，只处理后半部分；"This price is confidential" 这类正文保留）"""
+    paragraphs = re.split(r'\n\s*\n', text)
+    half = len(paragraphs) // 2
+    last = len(paragraphs) - 1
+    kept = [
+        p for i, p in enumerate(paragraphs)
+        if i < max(1, half) or not _is_disclaimer(p, i == last)
+    ]
+    return '\n\n'.join(kept)
+
+
+def _normalize_whitespace(text: str) -> str:
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+@lru_cache(maxsize=16)
+def _encoding_for(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def _estimate_tokens(text: str) -> int:
+    """没有 tiktoken 时的估算：中日韩字符约 1 token/字，其他约 4 字符/token"""
+    cjk = len(_CJK_CHARS.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str, model: str = 'gpt-4o-mini') -> int:
+    """计算文本的 token 数"""
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _estimate_tokens(text)
+
+
+def token_budget(model: str) -> int:
+    """模型对应的正文 token 预算"""
+    return MODEL_BODY_TOKEN_BUDGET.get(model, DEFAULT_BODY_TOKEN_BUDGET)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = 'gpt-4o-mini') -> str:
+    """按 token 数截断（保留开头，新邮件内容总在最前面）"""
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]).rstrip() + TRUNCATION_MARKER
+
+    if _estimate_tokens(text) <= max_tokens:
+        return text
+    # 二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if _estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + TRUNCATION_MARKER
+
+
+def compact_email_body(body: Optional[str], model: str = 'gpt-4o-mini', max_tokens: int = None) -> str:
+    """
+    压缩邮件正文
+
+    Args:
+        body: 原始正文（纯文本或HTML）
+        model: 目标模型（决定分词器和默认预算）
+        max_tokens: 正文 token 上限，默认按模型取 MODEL_BODY_TOKEN_BUDGET
+
+    Returns:
+        压缩后的纯文本正文
+    """
+    if not body:
+        return ''
+
+    text = html_to_text(body) if _HTML_HINT.search(body) else body
+    text = text.replace('\r\n', '\n')
+    text = strip_quoted(text)
+    text = strip_signature(text)
+    text = strip_disclaimers(text)
+    text = _normalize_whitespace(text)
+    if not text:
+        # 全部被当成引用/签名去掉时退回原文，交给截断处理
+        text = _normalize_whitespace(html_to_text(body))
+
+    text = truncate_to_tokens(text, max_tokens or token_budget(model), model)
+    if len(text) < len(body):
+        logger.debug(f"邮件正文压缩: {len(body)} → {len(text)} 字符")
+    return text
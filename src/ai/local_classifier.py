@@ -0,0 +1,227 @@
+"""
+本地邮件分类器（分级分类的第一级）
+
+特征哈希（英文词 + 词二元组、中文字 + 字二元组）+ 多分类逻辑回归，只依赖 numpy：
+- 离线用历史邮件的 AI 分析结果（business_stage）训练：scripts/train_email_classifier.py
+- 在留出集上评估并选择置信度阈值：scripts/eval_email_classifier.py
+- 模型保存为 .npz（不使用 pickle），推理一次约几十微秒
+
+EMAIL_CLASSIFIER_MODE=cascade 时，EmailAIAnalyzer 先用本分类器判断，
+置信度足够高的邮件直接在本地出结果，其余邮件再交给大模型。
+"""
+import os
+import re
+import zlib
+import random
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.ai.email_compactor import compact_email_body
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parents[2] / 'models' / 'email_classifier.npz'
+EMAIL_CLASSIFIER_PATH = Path(os.getenv('EMAIL_CLASSIFIER_PATH', str(DEFAULT_MODEL_PATH)))
+
+DEFAULT_N_FEATURES = 2 ** 17
+# 特征提取前正文压缩到的 token 数（分类只需要开头的新内容）
+FEATURE_MAX_TOKENS = 512
+# 本地分类结果的摘要前缀（训练时据此排除本分类器自己产生的标签）
+LOCAL_SUMMARY_PREFIX = '本地分类器'
+# 留出集比例的分母：id % HOLDOUT_MODULUS == 0 的邮件只用于评估
+HOLDOUT_MODULUS = 5
+
+_WORDS = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+_CJK_RUNS = re.compile(r'[\u4e00-\u9fff]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """英文词 + 相邻词二元组；中文按字 + 相邻字二元组"""
+    text = text.lower()
+    words = _WORDS.findall(text)
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for run in _CJK_RUNS.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def email_text(subject: str, body: str) -> str:
+    """分类器输入：主题重复一次以提高权重，正文先压缩"""
+    subject = subject or ''
+    return f"{subject}\n{subject}\n{compact_email_body(body, max_tokens=FEATURE_MAX_TOKENS)}"
+
+
+def featurize(text: str, n_features: int = DEFAULT_N_FEATURES) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    文本 → 稀疏特征（哈希下标, 权重）
+
+    使用 crc32 而不是内置 hash()，保证训练和推理进程得到相同的下标
+    """
+    counts = Counter(zlib.crc32(token.encode('utf-8')) % n_features for token in tokenize(text))
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+class LocalEmailClassifier:
+    """哈希特征 + 多分类逻辑回归"""
+
+    def __init__(self, labels: Sequence[str], n_features: int = DEFAULT_N_FEATURES,
+                 weights: np.ndarray = None, bias: np.ndarray = None):
+        self.labels = list(labels)
+        self.n_features = n_features
+        self.weights = weights if weights is not None else np.zeros((len(self.labels), n_features), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(self.labels), dtype=np.float32)
+
+    def _logits(self, indices: np.ndarray, values: np.ndarray) -> np.ndarray:
+        return self.weights[:, indices] @ values + self.bias
+
+    def predict_proba(self, subject: str, body: str) -> Dict[str, float]:
+        """各类别概率"""
+        probs = _softmax(self._logits(*featurize(email_text(subject, body), self.n_features)))
+        return {label: float(p) for label, p in zip(self.labels, probs)}
+
+    def predict(self, subject: str, body: str) -> Tuple[str, float]:
+        """返回 (类别, 置信度)"""
+        probs = _softmax(self._logits(*featurize(email_text(subject, body), self.n_features)))
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def fit(
+        self,
+        samples: List[Tuple[np.ndarray, np.ndarray]],
+        targets: List[int],
+        epochs: int = 5,
+        learning_rate: float = 0.5,
+        l2: float = 1e-6,
+        balanced: bool = True,
+        seed: int = 42,
+    ):
+        """
+        SGD 训练（交叉熵 + L2）
+
+        Args:
+            samples: featurize() 的结果列表
+            targets: 类别下标
+            balanced: 按类别频率反比加权，避免大类（通常是垃圾营销）淹没小类
+        """
+        class_counts = np.bincount(targets, minlength=len(self.labels)).astype(np.float32)
+        if balanced:
+            class_weight = class_counts.sum() / (len(self.labels) * np.maximum(class_counts, 1))
+        else:
+            class_weight = np.ones(len(self.labels), dtype=np.float32)
+
+        order = list(range(len(samples)))
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            lr = learning_rate / (1 + epoch)
+            loss = 0.0
+            for i in order:
+                indices, values = samples[i]
+                target = targets[i]
+                probs = _softmax(self._logits(indices, values))
+                loss -= float(np.log(probs[target] + 1e-12))
+                grad = probs
+                grad[target] -= 1.0
+                grad *= class_weight[target]
+                self.weights[:, indices] -= lr * (np.outer(grad, values) + l2 * self.weights[:, indices])
+                self.bias -= lr * grad
+            logger.info(f"训练 epoch {epoch + 1}/{epochs}: loss={loss / max(len(samples), 1):.4f}")
+        return self
+
+    def save(self, path: Path = EMAIL_CLASSIFIER_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            version=np.array(MODEL_VERSION),
+            labels=np.array(self.labels),
+            n_features=np.array(self.n_features),
+            weights=self.weights,
+            bias=self.bias,
+        )
+
+    @classmethod
+    def load(cls, path: Path = EMAIL_CLASSIFIER_PATH) -> 'LocalEmailClassifier':
+        with np.load(Path(path), allow_pickle=False) as data:
+            if int(data['version']) != MODEL_VERSION:
+                raise ValueError(f"模型版本不兼容: {int(data['version'])}，需要重新训练")
+            return cls(
+                labels=[str(label) for label in data['labels']],
+                n_features=int(data['n_features']),
+                weights=data['weights'].astype(np.float32),
+                bias=data['bias'].astype(np.float32),
+            )
+
+
+def is_holdout(email_id: int) -> bool:
+    """训练/评估集划分（按邮件ID固定划分，训练和评估脚本一致）"""
+    return email_id % HOLDOUT_MODULUS == 0
+
+
+def load_labeled_emails(db, limit: Optional[int] = None) -> List[Tuple[int, str, str, str]]:
+    """
+    读取有 AI 分析结果的入站邮件作为训练数据
+
+    规则引擎降级和本分类器自己产生的结果不参与训练
+
+    Returns:
+        [(邮件ID, 主题, 正文, 业务阶段), ...]
+    """
+    from src.crm.database import EmailHistory
+    from src.ai.email_analyzer import get_analyzer
+
+    analyzer = get_analyzer()
+    query = db.query(
+        EmailHistory.id, EmailHistory.subject, EmailHistory.body,
+        EmailHistory.business_stage, EmailHistory.ai_category
+    ).filter(
+        EmailHistory.direction == 'inbound',
+        (EmailHistory.business_stage.isnot(None)) | (EmailHistory.ai_category.isnot(None)),
+        (EmailHistory.ai_summary.is_(None)) | (
+            ~EmailHistory.ai_summary.like('基于规则引擎分析%') & ~EmailHistory.ai_summary.like(f'{LOCAL_SUMMARY_PREFIX}%')
+        ),
+    ).order_by(EmailHistory.id.desc())
+    if limit:
+        query = query.limit(limit)
+
+    rows = []
+    for email_id, subject, body, stage, category in query.all():
+        stage = stage or analyzer._map_category_to_stage(category)
+        if stage:
+            rows.append((email_id, subject or '', body or '', stage))
+    return rows
+
+
+_classifier = None
+_classifier_loaded = False
+
+
+def get_local_classifier() -> Optional[LocalEmailClassifier]:
+    """加载本地分类器（模型文件不存在时返回 None）"""
+    global _classifier, _classifier_loaded
+    if not _classifier_loaded:
+        _classifier_loaded = True
+        try:
+            _classifier = LocalEmailClassifier.load(EMAIL_CLASSIFIER_PATH)
+            logger.info(f"✅ 本地邮件分类器已加载: {EMAIL_CLASSIFIER_PATH}（{len(_classifier.labels)} 类）")
+        except FileNotFoundError:
+            logger.warning(f"本地邮件分类器模型不存在: {EMAIL_CLASSIFIER_PATH}，全部邮件交给大模型分析")
+        except Exception as e:
+            logger.error(f"本地邮件分类器加载失败: {str(e)}")
+    return _classifier
@@ -0,0 +1,235 @@
+"""
+近似重复邮件检测（MinHash + LSH）
+
+群发询盘、自动回复、退信等会带来大量几乎相同的邮件，每封都调用大模型分析是浪费。
+这里为最近分析过的邮件建立近似重复索引：
+
+1. 规范化：压缩正文（去引用/签名/免责声明），小写，邮箱/网址/数字替换为占位符
+2. 分词：英文按词、中文按字，取连续 3 个词/字作为 shingle
+3. MinHash 签名（NEAR_DUP_BANDS × NEAR_DUP_ROWS 个哈希），按 band 分桶存入 Redis
+4. 新邮件只和同桶的候选比较签名，估算的 Jaccard 相似度 ≥ NEAR_DUP_THRESHOLD 时
+   直接复用候选的分析结果（重置与单封邮件相关的字段），不再调用大模型
+
+Redis 键（都在 NEAR_DUP_WINDOW 秒后过期）：
+- neardup:band:{band}:{digest}  集合，桶内的邮件ID
+- neardup:entry:{email_id}      签名 + 分析结果
+- neardup:stats                 命中/未命中计数（多个 worker 共享）
+
+Redis 不可用时索引自动停用，所有邮件照常分析。
+"""
+import os
+import re
+import zlib
+import random
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.ai.email_compactor import compact_email_body
+from src.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_ENABLED = os.getenv('NEAR_DUP_ENABLED', 'true').lower() == 'true'
+# 估算 Jaccard 相似度阈值
+NEAR_DUP_THRESHOLD = float(os.getenv('NEAR_DUP_THRESHOLD', 0.85))
+# 索引保留时间（秒），只和最近分析过的邮件比较
+NEAR_DUP_WINDOW = int(os.getenv('NEAR_DUP_WINDOW', 86400))
+# 16 × 4 的分桶：相似度 0.5 时约 64% 概率成为候选，0.85 时 > 99.9%
+NEAR_DUP_BANDS = int(os.getenv('NEAR_DUP_BANDS', 16))
+NEAR_DUP_ROWS = int(os.getenv('NEAR_DUP_ROWS', 4))
+# shingle 太少（很短的邮件）时相似度不可靠，不参与去重
+NEAR_DUP_MIN_SHINGLES = int(os.getenv('NEAR_DUP_MIN_SHINGLES', 8))
+# 每封邮件最多比较的候选数
+NEAR_DUP_MAX_CANDIDATES = 50
+
+SHINGLE_SIZE = 3
+KEY_PREFIX = 'neardup:'
+STATS_KEY = f'{KEY_PREFIX}stats'
+
+# 复用时清空的字段（具体数量/价格/时间因邮件而异，规范化时已被占位符抹平；
+# 跟进日期和回复时限是模型按源邮件的内容和时间给出的，不能套用到这封邮件）
+PER_EMAIL_FIELDS = (
+    'mentioned_quantities', 'mentioned_prices', 'mentioned_timeline', 'estimated_order_value',
+    'follow_up_date', 'response_deadline',
+)
+
+_EMAILS = re.compile(r'[\w.+-]+@[\w-]+(\.[\w-]+)+')
+_URLS = re.compile(r'(https?://|www\.)\S+')
+_NUMBERS = re.compile(r'\d+([.,]\d+)*')
+_TOKENS = re.compile(r'[a-z_]+|[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_email(subject: str, body: str) -> str:
+    """规范化邮件内容（只保留区分邮件内容的部分）"""
+    text = f"{subject or ''}\n{compact_email_body(body)}".lower()
+    text = _EMAILS.sub(' _email_ ', text)
+    text = _URLS.sub(' _url_ ', text)
+    return _NUMBERS.sub(' _num_ ', text)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """连续 size 个词/字的哈希集合"""
+    tokens = _TOKENS.findall(text)
+    if len(tokens) < size:
+        return {zlib.crc32(' '.join(tokens).encode('utf-8'))} if tokens else set()
+    return {
+        zlib.crc32(' '.join(tokens[i:i + size]).encode('utf-8'))
+        for i in range(len(tokens) - size + 1)
+    }
+
+
+class MinHasher:
+    """MinHash 签名：h(x) = (a·x + b) mod p，参数由固定种子生成，所有进程一致"""
+
+    def __init__(self, num_perm: int, seed: int = 1):
+        rng = random.Random(seed)
+        self.params = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, values: Set[int]) -> List[int]:
+        return [
+            min((a * x + b) % _MERSENNE_PRIME for x in values)
+            for a, b in self.params
+        ]
+
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """两个签名估算的 Jaccard 相似度"""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """基于 Redis 的 MinHash LSH 索引"""
+
+    def __init__(self, bands: int = NEAR_DUP_BANDS, rows: int = NEAR_DUP_ROWS,
+                 threshold: float = NEAR_DUP_THRESHOLD, window: int = NEAR_DUP_WINDOW):
+        self.bands = bands
+        self.rows = rows
+        self.threshold = threshold
+        self.window = window
+        self.hasher = MinHasher(bands * rows)
+
+    @property
+    def available(self) -> bool:
+        return NEAR_DUP_ENABLED and cache.available
+
+    def signature(self, subject: str, body: str) -> Optional[List[int]]:
+        """邮件的 MinHash 签名（内容太短时返回 None）"""
+        values = shingles(normalize_email(subject, body))
+        if len(values) < NEAR_DUP_MIN_SHINGLES:
+            return None
+        return self.hasher.signature(values)
+
+    def _band_keys(self, signature: List[int]) -> List[str]:
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.md5(','.join(map(str, rows)).encode()).hexdigest()[:16]
+            keys.append(f"{KEY_PREFIX}band:{band}:{digest}")
+        return keys
+
+    def find(self, signature: List[int], exclude_id: int = None) -> Optional[Tuple[int, float, Dict]]:
+        """
+        查找最相似的已分析邮件
+
+        Returns:
+            (邮件ID, 相似度, 分析结果)，没有达到阈值的候选时返回 None
+        """
+        if not self.available or not signature:
+            return None
+        try:
+            pipe = cache.client.pipeline(transaction=False)
+            for key in self._band_keys(signature):
+                pipe.smembers(key)
+            candidates = set()
+            for members in pipe.execute():
+                candidates.update(members)
+            candidates.discard(str(exclude_id))
+            candidates = sorted(candidates, key=int, reverse=True)[:NEAR_DUP_MAX_CANDIDATES]
+            if not candidates:
+                return None
+
+            entries = cache.binary_client.mget([f"{KEY_PREFIX}entry:{c}" for c in candidates])
+            best = None
+            for candidate, raw in zip(candidates, entries):
+                if not raw:
+                    continue
+                entry = cache.codec.decode(raw)
+                score = similarity(signature, entry['signature'])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (int(candidate), score, entry['result'])
+            return best
+        except Exception as e:
+            logger.warning(f"近似重复查询失败: {str(e)}")
+            return None
+
+    def add(self, email_id: int, signature: List[int], result: Dict):
+        """把已分析的邮件加入索引"""
+        if not self.available or not signature:
+            return
+        try:
+            pipe = cache.binary_client.pipeline(transaction=False)
+            pipe.setex(
+                f"{KEY_PREFIX}entry:{email_id}", self.window,
+                cache.codec.encode({"signature": signature, "result": result})
+            )
+            for key in self._band_keys(signature):
+                pipe.sadd(key, email_id)
+                pipe.expire(key, self.window)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"近似重复索引写入失败 [{email_id}]: {str(e)}")
+
+    def record(self, hit: bool):
+        """记录去重命中/未命中"""
+        if not self.available:
+            return
+        try:
+            cache.client.hincrby(STATS_KEY, 'hits' if hit else 'misses', 1)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        """去重命中统计"""
+        counts = {}
+        if self.available:
+            try:
+                counts = cache.client.hgetall(STATS_KEY)
+            except Exception as e:
+                logger.warning(f"读取去重统计失败: {str(e)}")
+        hits = int(counts.get('hits', 0))
+        misses = int(counts.get('misses', 0))
+        return {
+            "enabled": self.available,
+            "threshold": self.threshold,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
+
+
+def reuse_analysis(result: Dict, source_email_id: int, score: float) -> Dict:
+    """复用近似重复邮件的分析结果（清空与单封邮件相关的字段）"""
+    analysis = dict(result['analysis'])
+    for field in PER_EMAIL_FIELDS:
+        analysis[field] = None
+    analysis['duplicate_of'] = source_email_id
+    return {
+        "success": True,
+        "analysis": analysis,
+        "model": "near_duplicate",
+        "source_model": result.get('model'),
+        "similarity": round(score, 4),
+        "analyzed_at": datetime.utcnow().isoformat()
+    }
+
+
+near_duplicate_index = NearDuplicateIndex()
@@ -11,6 +11,7 @@
 import os
 import json
 import hashlib
+import inspect
 import numpy as np
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
@@ -24,6 +25,17 @@ from io import BytesIO
 # OpenAI
 from openai import AsyncOpenAI
 
+from sqlalchemy import select
+
+from src.utils.tracing import traced, SPAN_KIND_CLIENT
+
+
+async def _maybe_await(result):
+    """兼容同步 Session 和 AsyncSession：AsyncSession 的方法返回协程，需要 await"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
 
 class VectorKnowledgeService:
     """向量知识库服务"""
@@ -37,6 +49,7 @@ class VectorKnowledgeService:
         )
         self.embedding_model = "text-embedding-3-small"  # 更便宜的embedding模型
     
+    @traced("embedding.create", SPAN_KIND_CLIENT)
     async def create_embedding(self, text: str) -> List[float]:
         """
         创建文本向量
@@ -57,6 +70,7 @@ class VectorKnowledgeService:
             print(f"❌ 创建向量失败: {str(e)}")
             raise
     
+    @traced("embedding.batch_create", SPAN_KIND_CLIENT)
     async def batch_create_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
         批量创建文本向量
@@ -227,7 +241,7 @@ class VectorKnowledgeService:
             title: 文档标题
             category: 分类
             description: 描述
-            db_session: 数据库会话
+            db_session: 数据库会话（Session 或 AsyncSession）
             
         返回:
             文档信息
@@ -240,10 +254,12 @@ class VectorKnowledgeService:
         try:
             # 0. 检查文件是否已存在
             file_hash = self.calculate_file_hash(file_content)
-            existing_doc = db_session.query(KnowledgeDocument).filter(
-                KnowledgeDocument.file_hash == file_hash,
-                KnowledgeDocument.is_active == True
-            ).first()
+            existing_doc = (await _maybe_await(db_session.execute(
+                select(KnowledgeDocument).filter(
+                    KnowledgeDocument.file_hash == file_hash,
+                    KnowledgeDocument.is_active == True
+                )
+            ))).scalars().first()
             
             if existing_doc:
                 raise ValueError(f"该文件已存在于知识库中：'{existing_doc.title}'（文件名：{existing_doc.filename}）")
@@ -271,7 +287,7 @@ class VectorKnowledgeService:
                 created_at=datetime.utcnow()
             )
             db_session.add(document)
-            db_session.flush()
+            await _maybe_await(db_session.flush())
             
             # 4. 向量化所有分块
             print(f"🧪 向量化文本...")
@@ -293,7 +309,7 @@ class VectorKnowledgeService:
                 )
                 db_session.add(chunk)
             
-            db_session.commit()
+            await _maybe_await(db_session.commit())
             
             print(f"✅ 文档上传成功: {title}")
             
@@ -306,13 +322,14 @@ class VectorKnowledgeService:
             }
             
         except Exception as e:
-            db_session.rollback()
+            await _maybe_await(db_session.rollback())
             print(f"❌ 文档上传失败: {str(e)}")
             raise
         finally:
             if db_session:
-                db_session.close()
+                await _maybe_await(db_session.close())
     
+    @traced("vector.search")
     async def search_similar(
         self,
         query: str,
@@ -329,7 +346,7 @@ class VectorKnowledgeService:
             limit: 返回结果数量
             category: 知识库分类（可选）
             min_similarity: 最低相似度阈值（默认0.3，过滤低相关内容）
-            db_session: 数据库会话
+            db_session: 数据库会话（Session 或 AsyncSession）
             
         返回:
             相似文档列表
@@ -343,18 +360,24 @@ class VectorKnowledgeService:
             # 1. 将查询文本向量化
             query_vector = await self.create_embedding(query)
             
-            # 2. 从数据库获取所有活跃的分块
+            # 2. 从数据库获取所有活跃的分块（只取需要的列，文档标题随查询一起取出，
+            #    避免逐条懒加载 chunk.document —— AsyncSession 下懒加载会直接报错）
+            stmt = select(
+                KnowledgeChunk.id,
+                KnowledgeChunk.document_id,
+                KnowledgeChunk.content,
+                KnowledgeChunk.chunk_index,
+                KnowledgeChunk.embedding,
+                KnowledgeChunk.chunk_metadata,
+                KnowledgeDocument.title.label('document_title')
+            ).outerjoin(
+                KnowledgeDocument, KnowledgeChunk.document_id == KnowledgeDocument.id
+            ).filter(
+                KnowledgeChunk.is_active == True
+            )
             if category:
-                chunks = db_session.query(KnowledgeChunk).join(
-                    KnowledgeDocument
-                ).filter(
-                    KnowledgeChunk.is_active == True,
-                    KnowledgeDocument.category == category
-                ).all()
-            else:
-                chunks = db_session.query(KnowledgeChunk).filter(
-                    KnowledgeChunk.is_active == True
-                ).all()
+                stmt = stmt.filter(KnowledgeDocument.category == category)
+            chunks = (await _maybe_await(db_session.execute(stmt))).all()
             
             # 3. 计算每个分块的相似度
             results = []
@@ -373,7 +396,7 @@ class VectorKnowledgeService:
                     results.append({
                         "id": chunk.id,
                         "document_id": chunk.document_id,
-                        "document_title": chunk.document.title if chunk.document else "Unknown",
+                        "document_title": chunk.document_title or "Unknown",
                         "content": chunk.content,
                         "chunk_index": chunk.chunk_index,
                         "metadata": json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {},
@@ -400,7 +423,7 @@ class VectorKnowledgeService:
             raise
         finally:
             if db_session:
-                db_session.close()
+                await _maybe_await(db_session.close())
 
 
 # 全局实例
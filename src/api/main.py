@@ -5,11 +5,17 @@ from sqlalchemy.exc import SQLAlchemyError
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from concurrent.futures import ThreadPoolExecutor
-from src.crm.database import init_db, get_session, EmailAccount
+from src.crm.database import init_db, get_session, dispose_async_engine, EmailAccount
+from src.email_system.smtp_pool import smtp_pool
+from src.utils.cache import cache, async_cache
+from src.utils.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS
+from src.crm.query_profiler import start_profile, end_profile, current_profile, DB_PROFILE_HEADERS
+from src.utils.tracing import create_span, activate, deactivate, SPAN_KIND_SERVER, TRACEPARENT_HEADER
 from datetime import datetime, timedelta
 import logging
 import asyncio
 import uuid
+import time
 import os
 
 # 导入异常处理器
@@ -47,6 +53,7 @@ from .routers import tags  # 🔥 新增：客户标签系统
 from .routers import auto_reply  # 🔥 新增：自动回复与审核系统
 from .routers import translate  # 🔥 新增：翻译功能
 from .routers import health  # 🔥 新增：健康检查
+from .routers import metrics  # 运行指标（Prometheus）
 
 # 配置日志系统
 setup_logging(
@@ -193,6 +200,22 @@ async def lifespan(app: FastAPI):
         id='auto_sync_emails',
         replace_existing=True
     )
+    # 定期关闭超时的空闲SMTP会话
+    scheduler.add_job(
+        smtp_pool.prune,
+        'interval',
+        minutes=1,
+        id='prune_smtp_pool',
+        replace_existing=True
+    )
+    # 定期清理缓存标签集合中已过期的键
+    scheduler.add_job(
+        cache.prune_tags,
+        'interval',
+        hours=1,
+        id='prune_cache_tags',
+        replace_existing=True
+    )
     scheduler.start()
     logger.info("✅ 邮件自动同步调度器已启动（异步模式，每5分钟检查一次）")
     logger.info(f"   线程池大小: {thread_pool._max_workers} 个工作线程")
@@ -202,6 +225,9 @@ async def lifespan(app: FastAPI):
     # 关闭时
     scheduler.shutdown()
     thread_pool.shutdown(wait=True)  # 等待所有同步任务完成
+    smtp_pool.close_all()  # 关闭空闲的SMTP会话
+    await async_cache.close()  # 关闭异步Redis连接池
+    await dispose_async_engine()  # 关闭异步数据库连接池
     logger.info("⏹️ 调度器和线程池已关闭")
 
 
@@ -225,7 +251,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
     allow_headers=["*"],
-    expose_headers=["Content-Range", "X-Total-Count", "X-Request-ID"],
+    expose_headers=["Content-Range", "X-Total-Count", "X-Request-ID", "X-DB-Queries", "X-DB-Time", "traceparent"],
     max_age=3600
 )
 
@@ -249,10 +275,52 @@ async def request_middleware(request: Request, call_next):
     )
     
     # 处理请求
-    response = await call_next(request)
+    in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(request.method)
+    in_progress.inc()
+    started = time.perf_counter()
+    status_code = 500
+    profile_token = start_profile(f"{request.method} {request.url.path}", force=DB_PROFILE_HEADERS)
+    # 链路追踪：沿用调用方的 traceparent，整个请求是一个 server span
+    span = create_span(
+        f"{request.method} {request.url.path}", SPAN_KIND_SERVER,
+        {"http.method": request.method, "http.target": request.url.path, "request_id": request_id},
+        traceparent=request.headers.get(TRACEPARENT_HEADER)
+    )
+    span_token = activate(span)
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    except Exception as e:
+        if span is not None:
+            span.set_error(e)
+        raise
+    finally:
+        in_progress.dec()
+        # 按路由模板（/api/customers/{customer_id}）统计，未匹配的路径归为一类，避免标签基数爆炸
+        route_path = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_DURATION.labels(
+            request.method, route_path, status_code
+        ).observe(time.perf_counter() - started)
+        profile = current_profile()
+        if profile is not None:
+            profile.name = f"{request.method} {route_path}"
+        profile = end_profile(profile_token)
+        deactivate(span_token)
+        if span is not None:
+            span.name = f"{request.method} {route_path}"
+            span.set_attribute("http.route", route_path)
+            span.set_attribute("http.status_code", status_code)
+            if profile is not None:
+                span.set_attribute("db.query_count", profile.count)
+            span.end()
     
     # 添加请求ID到响应头
     response.headers["X-Request-ID"] = request_id
+    if DB_PROFILE_HEADERS and profile is not None:
+        response.headers["X-DB-Queries"] = str(profile.count)
+        response.headers["X-DB-Time"] = f"{profile.total_time * 1000:.1f}ms"
+    if span is not None:
+        response.headers[TRACEPARENT_HEADER] = span.traceparent
     
     # 记录响应
     duration = (datetime.utcnow() - start_time).total_seconds() * 1000
@@ -297,3 +365,4 @@ app.include_router(tags.router, prefix="/api", tags=["客户标签"])  # 🔥 
 app.include_router(auto_reply.router, prefix="/api", tags=["自动回复与审核"])  # 🔥 新增自动回复与审核系统
 # app.include_router(translate.router)  # 🔥 已废弃：使用ai_assistant中的翻译API替代
 app.include_router(health.router, prefix="/api", tags=["健康检查"])  # 🔥 新增健康检查
+app.include_router(metrics.router)  # Prometheus 抓取地址 /metrics
@@ -6,6 +6,7 @@ from datetime import datetime
 
 from src.crm.database import get_session, EmailHistory
 from src.email_system.ai_writer import AIEmailWriter
+from src.utils.rate_limiter import rate_limit
 
 # 🔥 导入Celery任务（用于异步AI分析）
 try:
@@ -182,7 +183,7 @@ async def translate_email(request: TranslateRequest):
 
 
 # 🔥 新增：生成AI回复（支持知识库）
-@router.post("/ai/generate-reply")
+@router.post("/ai/generate-reply", dependencies=[Depends(rate_limit("ai_generate_reply", limit=20, window=60))])
 async def generate_reply(request: GenerateReplyRequest, db: Session = Depends(get_db)):
     """生成AI智能回复，支持知识库增强、模型选择和自定义提示词"""
     try:
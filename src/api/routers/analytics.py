@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import List, Optional
 
-from src.crm.database import get_session
-from src.utils.customer_analytics import CustomerAnalytics
+from src.crm.database import get_session, Customer
+from src.utils.customer_analytics import CustomerAnalytics, MAX_BULK_CUSTOMERS
 
 router = APIRouter()
 
@@ -15,6 +17,12 @@ def get_db():
         db.close()
 
 
+class BulkAnalyticsRequest(BaseModel):
+    customer_ids: Optional[List[int]] = None  # 指定客户ID（优先）
+    filter: Optional[dict] = None  # 或按条件筛选：status/customer_grade/country
+    limit: int = 50
+
+
 @router.get("/customers/{customer_id}/analytics")
 def customer_analytics(customer_id: int, db: Session = Depends(get_db)):
     ca = CustomerAnalytics(db)
@@ -29,3 +37,35 @@ def customer_analytics(customer_id: int, db: Session = Depends(get_db)):
         "churn_risk": churn,
         "next_action": next_action,
     }
+
+
+@router.post("/customers/analytics/batch")
+def batch_customer_analytics(request: BulkAnalyticsRequest, db: Session = Depends(get_db)):
+    """批量获取客户分析指标（用于列表页一次性展示健康度和流失风险）"""
+    limit = max(1, min(request.limit, MAX_BULK_CUSTOMERS))
+    query = db.query(Customer)
+    
+    if request.customer_ids:
+        if len(request.customer_ids) > MAX_BULK_CUSTOMERS:
+            raise HTTPException(status_code=400, detail=f"单次最多分析 {MAX_BULK_CUSTOMERS} 个客户")
+        query = query.filter(Customer.id.in_(request.customer_ids))
+    else:
+        f = request.filter or {}
+        if f.get("status"):
+            query = query.filter(Customer.status == f["status"])
+        if f.get("customer_grade"):
+            query = query.filter(Customer.customer_grade == f["customer_grade"])
+        if f.get("country"):
+            query = query.filter(Customer.country.ilike(f"%{f['country']}%"))
+        query = query.order_by(Customer.id.desc()).limit(limit)
+    
+    customers = query.all()
+    results = CustomerAnalytics(db).get_bulk_analytics(customers)
+    
+    # 保持请求中的顺序
+    if request.customer_ids:
+        ordered = [results[cid] for cid in request.customer_ids if cid in results]
+    else:
+        ordered = [results[c.id] for c in customers if c.id in results]
+    
+    return {"items": ordered, "total": len(ordered)}
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 import json
 import os
+import asyncio
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
@@ -12,7 +13,13 @@ from passlib.context import CryptContext
 from pydantic import BaseModel, validator
 import re
 
-from ...crm.database import get_session, User, Role
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...crm.database import get_session, get_async_db, User, Role
+from ...utils.principal_cache import principal_cache, compile_permissions
+from ...utils.rate_limiter import SlidingWindowLimiter, client_ip
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -27,8 +34,8 @@ REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', 7))  # 7
 MAX_LOGIN_ATTEMPTS = int(os.getenv('MAX_LOGIN_ATTEMPTS', 5))
 LOGIN_ATTEMPT_WINDOW = int(os.getenv('LOGIN_ATTEMPT_WINDOW', 900))  # 15分钟
 
-# 登录失败记录（生产环境应使用Redis）
-login_attempts = {}
+# 登录失败记录
+login_limiter = SlidingWindowLimiter("login", limit=MAX_LOGIN_ATTEMPTS, window=LOGIN_ATTEMPT_WINDOW)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
@@ -165,10 +172,23 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
+    principal = principal_cache.get(token_data.username)
+    if principal is not None:
+        return principal.user
+    
+    # 缓存未命中：预加载角色后关闭会话，缓存脱离会话的用户对象
+    version = principal_cache.version(token_data.username)
     db = get_session()
-    user = db.query(User).filter(User.username == token_data.username).first()
+    try:
+        user = db.query(User).options(selectinload(User.roles)).filter(
+            User.username == token_data.username
+        ).first()
+    finally:
+        db.close()
+    
     if user is None:
         raise credentials_exception
+    principal_cache.put(token_data.username, user, version)
     return user
 
 
@@ -178,39 +198,15 @@ def get_current_active_user(current_user: User = Depends(get_current_user)):
     return current_user
 
 
-# 登录限流
+# 登录限流（Redis 滑动窗口，多个 worker 共享计数）
 def record_failed_login(ip: str, username: str):
     """记录登录失败"""
-    key = f"{ip}:{username}"
-    now = datetime.utcnow().timestamp()
-    
-    if key not in login_attempts:
-        login_attempts[key] = []
-    
-    # 清除过期记录
-    login_attempts[key] = [
-        attempt for attempt in login_attempts[key]
-        if now - attempt < LOGIN_ATTEMPT_WINDOW
-    ]
-    
-    login_attempts[key].append(now)
+    login_limiter.hit(f"{ip}:{username}")
     
 
 def is_login_allowed(ip: str, username: str) -> bool:
     """检查是否允许登录"""
-    key = f"{ip}:{username}"
-    now = datetime.utcnow().timestamp()
-    
-    if key not in login_attempts:
-        return True
-    
-    # 清除过期记录
-    login_attempts[key] = [
-        attempt for attempt in login_attempts[key]
-        if now - attempt < LOGIN_ATTEMPT_WINDOW
-    ]
-    
-    return len(login_attempts[key]) < MAX_LOGIN_ATTEMPTS
+    return login_limiter.peek(f"{ip}:{username}").allowed
 
 
 # 权限验证
@@ -219,37 +215,45 @@ def check_permission(user: User, resource: str, action: str) -> bool:
     if user.is_superuser:
         return True
     
-    for role in user.roles:
-        if not role.is_active:
-            continue
-        permissions = json.loads(role.permissions) if role.permissions else {}
-        if resource in permissions and action in permissions[resource]:
-            return True
+    # 认证依赖返回的用户已带有预编译权限；其他来源的用户对象按需编译一次
+    permissions = getattr(user, '_permission_set', None)
+    if permissions is None:
+        permissions = compile_permissions(user.roles)
+        user._permission_set = permissions
     
-    return False
+    return action in permissions.get(resource, ())
 
 
 # API路由
 @router.post("/login", response_model=Token)
-async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
     """用户登录（带限流和Token刷新）"""
-    client_ip = request.client.host if request.client else "unknown"
+    ip = client_ip(request)
     
-    # 检查登录限流
-    if not is_login_allowed(client_ip, form_data.username):
-        logger.warning(f"登录限流触发: {form_data.username} from {client_ip}")
+    # 检查登录限流（同步 Redis 调用放到线程中，避免阻塞事件循环）
+    if not await asyncio.to_thread(is_login_allowed, ip, form_data.username):
+        logger.warning(f"登录限流触发: {form_data.username} from {ip}")
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"登录失败次数过多，请{LOGIN_ATTEMPT_WINDOW // 60}分钟后再试"
         )
     
-    db = get_session()
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = await db.scalar(
+        select(User).options(selectinload(User.roles)).filter(User.username == form_data.username)
+    )
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # bcrypt 校验是CPU密集操作（约数百毫秒），放到线程中避免阻塞事件循环
+    password_ok = user is not None and await asyncio.to_thread(
+        verify_password, form_data.password, user.hashed_password
+    )
+    if not password_ok:
         # 记录失败
-        record_failed_login(client_ip, form_data.username)
-        logger.warning(f"登录失败: {form_data.username} from {client_ip}")
+        await asyncio.to_thread(record_failed_login, ip, form_data.username)
+        logger.warning(f"登录失败: {form_data.username} from {ip}")
         
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -265,7 +269,7 @@ async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends
     
     # 更新最后登录时间
     user.last_login = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     # 创建访问令牌和刷新令牌
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -299,7 +303,7 @@ async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends
         ]
     }
     
-    logger.info(f"用户登录成功: {user.username} from {client_ip}")
+    logger.info(f"用户登录成功: {user.username} from {ip}")
     
     return {
         "access_token": access_token,
@@ -389,10 +393,15 @@ async def change_password(
             detail="旧密码错误"
         )
     
-    # 更新密码
+    # 更新密码（current_user 来自认证缓存，已脱离会话，需在新会话中重新加载）
     db = get_session()
-    current_user.hashed_password = get_password_hash(password_change.new_password)
-    db.commit()
+    try:
+        user = db.query(User).filter(User.id == current_user.id).first()
+        user.hashed_password = get_password_hash(password_change.new_password)
+        db.commit()
+    finally:
+        db.close()
+    principal_cache.invalidate(current_user.username)
     
     logger.info(f"密码修改成功: {current_user.username}")
     
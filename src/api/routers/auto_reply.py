@@ -3,6 +3,7 @@
 提供规则管理和审核功能的接口
 """
 from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from src.crm.database import get_session, AutoReplyRule, ApprovalTask, EmailHistory, EmailAccount
 from pydantic import BaseModel
@@ -224,6 +225,38 @@ def delete_auto_reply_rule(id: int, db: Session = Depends(get_session)):
 
 # ==================== 审核任务 API ====================
 
+# 列表中原始邮件正文的预览长度（字符）
+APPROVAL_EMAIL_PREVIEW_CHARS = 200
+
+
+def _serialize_approval_task(task: ApprovalTask) -> dict:
+    """审核任务字段转字典（列表和详情共用）"""
+    return {
+        "id": task.id,
+        "email_id": task.email_id,
+        "rule_id": task.rule_id,
+        "draft_subject": task.draft_subject,
+        "draft_body": task.draft_body,
+        "draft_html": task.draft_html,
+        "status": task.status,
+        "approval_method": task.approval_method,
+        "notification_sent_at": task.notification_sent_at.isoformat() if task.notification_sent_at else None,
+        "notification_status": task.notification_status,
+        "approved_by": task.approved_by,
+        "approved_at": task.approved_at.isoformat() if task.approved_at else None,
+        "rejection_reason": task.rejection_reason,
+        "revision_count": task.revision_count,
+        "revision_history": task.revision_history,
+        "auto_send_on_approval": task.auto_send_on_approval,
+        "sent_at": task.sent_at.isoformat() if task.sent_at else None,
+        "sent_email_id": task.sent_email_id,
+        "timeout_at": task.timeout_at.isoformat() if task.timeout_at else None,
+        "ai_analysis_summary": task.ai_analysis_summary,
+        "created_at": task.created_at.isoformat() if task.created_at else None,
+        "updated_at": task.updated_at.isoformat() if task.updated_at else None,
+    }
+
+
 @router.get("/approval_tasks")
 def get_approval_tasks(
     _start: int = 0,
@@ -231,15 +264,41 @@ def get_approval_tasks(
     _sort: str = "created_at",
     _order: str = "DESC",
     status: Optional[str] = None,
+    include: Optional[str] = None,
     db: Session = Depends(get_session)
 ):
-    """获取审核任务列表（React Admin兼容）"""
+    """
+    获取审核任务列表（React Admin兼容）
+    
+    原始邮件只返回摘要信息和正文预览（body_preview），
+    传 include=original_email 时额外返回完整正文（body / html_body）
+    """
     try:
-        query = db.query(ApprovalTask)
+        include_full_email = 'original_email' in (include or '').split(',')
+        
+        # 原始邮件只取需要的列，和审核任务在同一条查询中 LEFT JOIN 取出
+        # 预览多取一个字符，用来判断正文是否被截断
+        email_columns = [
+            EmailHistory.id.label('email_pk'),
+            EmailHistory.from_name,
+            EmailHistory.from_email,
+            EmailHistory.subject,
+            EmailHistory.sent_at.label('email_sent_at'),
+            EmailHistory.ai_category,
+            func.substr(EmailHistory.body, 1, APPROVAL_EMAIL_PREVIEW_CHARS + 1).label('body_preview'),
+        ]
+        if include_full_email:
+            email_columns += [EmailHistory.body, EmailHistory.html_body]
+        
+        query = db.query(ApprovalTask, *email_columns).outerjoin(
+            EmailHistory, EmailHistory.id == ApprovalTask.email_id
+        )
+        count_query = db.query(func.count(ApprovalTask.id))
         
         # 筛选状态
         if status:
             query = query.filter(ApprovalTask.status == status)
+            count_query = count_query.filter(ApprovalTask.status == status)
         
         # 排序
         sort_column = getattr(ApprovalTask, _sort, ApprovalTask.created_at)
@@ -249,50 +308,34 @@ def get_approval_tasks(
             query = query.order_by(sort_column.asc())
         
         # 总数
-        total = query.count()
+        total = count_query.scalar()
         
         # 分页
-        items = query.offset(_start).limit(_end - _start).all()
+        rows = query.offset(_start).limit(_end - _start).all()
         
         # 转换为字典（包含关联的邮件信息）
         result = []
-        for item in items:
-            # 获取关联的原始邮件
-            email = db.query(EmailHistory).filter(EmailHistory.id == item.email_id).first()
+        for row in rows:
+            item_dict = _serialize_approval_task(row.ApprovalTask)
             
-            item_dict = {
-                "id": item.id,
-                "email_id": item.email_id,
-                "rule_id": item.rule_id,
-                "draft_subject": item.draft_subject,
-                "draft_body": item.draft_body,
-                "draft_html": item.draft_html,
-                "status": item.status,
-                "approval_method": item.approval_method,
-                "notification_sent_at": item.notification_sent_at.isoformat() if item.notification_sent_at else None,
-                "notification_status": item.notification_status,
-                "approved_by": item.approved_by,
-                "approved_at": item.approved_at.isoformat() if item.approved_at else None,
-                "rejection_reason": item.rejection_reason,
-                "revision_count": item.revision_count,
-                "revision_history": item.revision_history,
-                "auto_send_on_approval": item.auto_send_on_approval,
-                "sent_at": item.sent_at.isoformat() if item.sent_at else None,
-                "sent_email_id": item.sent_email_id,
-                "timeout_at": item.timeout_at.isoformat() if item.timeout_at else None,
-                "ai_analysis_summary": item.ai_analysis_summary,
-                "created_at": item.created_at.isoformat() if item.created_at else None,
-                "updated_at": item.updated_at.isoformat() if item.updated_at else None,
-                # 关联邮件信息
-                "original_email": {
-                    "from_name": email.from_name if email else None,
-                    "from_email": email.from_email if email else None,
-                    "subject": email.subject if email else None,
-                    "body": email.body if email else None,
-                    "sent_at": email.sent_at.isoformat() if email and email.sent_at else None,
-                    "ai_category": email.ai_category if email else None,
-                } if email else None
-            }
+            original_email = None
+            if row.email_pk is not None:
+                preview = row.body_preview
+                if preview and len(preview) > APPROVAL_EMAIL_PREVIEW_CHARS:
+                    preview = preview[:APPROVAL_EMAIL_PREVIEW_CHARS] + '…'
+                original_email = {
+                    "from_name": row.from_name,
+                    "from_email": row.from_email,
+                    "subject": row.subject,
+                    "body_preview": preview,
+                    "sent_at": row.email_sent_at.isoformat() if row.email_sent_at else None,
+                    "ai_category": row.ai_category,
+                }
+                if include_full_email:
+                    original_email["body"] = row.body
+                    original_email["html_body"] = row.html_body
+            
+            item_dict["original_email"] = original_email
             result.append(item_dict)
         
         # 返回响应
@@ -321,28 +364,7 @@ def get_approval_task(id: int, db: Session = Depends(get_session)):
         
         # 构建响应
         result = {
-            "id": task.id,
-            "email_id": task.email_id,
-            "rule_id": task.rule_id,
-            "draft_subject": task.draft_subject,
-            "draft_body": task.draft_body,
-            "draft_html": task.draft_html,
-            "status": task.status,
-            "approval_method": task.approval_method,
-            "notification_sent_at": task.notification_sent_at.isoformat() if task.notification_sent_at else None,
-            "notification_status": task.notification_status,
-            "approved_by": task.approved_by,
-            "approved_at": task.approved_at.isoformat() if task.approved_at else None,
-            "rejection_reason": task.rejection_reason,
-            "revision_count": task.revision_count,
-            "revision_history": task.revision_history,
-            "auto_send_on_approval": task.auto_send_on_approval,
-            "sent_at": task.sent_at.isoformat() if task.sent_at else None,
-            "sent_email_id": task.sent_email_id,
-            "timeout_at": task.timeout_at.isoformat() if task.timeout_at else None,
-            "ai_analysis_summary": task.ai_analysis_summary,
-            "created_at": task.created_at.isoformat() if task.created_at else None,
-            "updated_at": task.updated_at.isoformat() if task.updated_at else None,
+            **_serialize_approval_task(task),
             # 关联邮件信息（包含正文）
             "original_email": {
                 "from_name": email.from_name if email else None,
@@ -462,14 +484,8 @@ def approve_task(id: int, approved_by: str, db: Session = Depends(get_session)):
                     }
                 
                 # 配置SMTP
-                from src.email_system.sender import EmailSender
-                smtp_config = {
-                    'host': account.smtp_host,
-                    'port': account.smtp_port,
-                    'username': account.smtp_username or account.email_address,
-                    'password': account.smtp_password,
-                    'use_ssl': account.smtp_port == 465
-                }
+                from src.email_system.sender import EmailSender, smtp_config_from_account
+                smtp_config = smtp_config_from_account(account)
                 
                 sender = EmailSender(smtp_config=smtp_config)
                 
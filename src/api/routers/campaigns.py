@@ -101,3 +101,42 @@ def delete_campaign(cid: int, db: Session = Depends(get_db)):
     db.delete(c)
     db.commit()
     return {"deleted": True, "id": cid}
+
+
+@router.post("/email_campaigns/{cid}/send")
+def send_campaign(cid: int, db: Session = Depends(get_db)):
+    """启动或恢复活动发送（后台Celery任务，多账户并发）"""
+    c = db.query(EmailCampaign).filter(EmailCampaign.id == cid).first()
+    if not c:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if not c.template_id:
+        raise HTTPException(status_code=400, detail="活动未设置邮件模板")
+    if c.status == 'Completed':
+        raise HTTPException(status_code=400, detail="活动已完成")
+    
+    from src.tasks.email_tasks import start_campaign_task
+    task = start_campaign_task.delay(cid)
+    return {"success": True, "campaign_id": cid, "task_id": task.id}
+
+
+@router.post("/email_campaigns/{cid}/pause")
+def pause_campaign(cid: int, db: Session = Depends(get_db)):
+    """暂停活动发送（正在发送的任务在当前邮件发完后停止）"""
+    c = db.query(EmailCampaign).filter(EmailCampaign.id == cid).first()
+    if not c:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if c.status == 'Running':
+        c.status = 'Paused'
+        db.commit()
+    return {"success": True, "campaign_id": cid, "status": c.status}
+
+
+@router.get("/email_campaigns/{cid}/progress")
+def get_campaign_progress(cid: int, db: Session = Depends(get_db)):
+    """活动发送进度"""
+    c = db.query(EmailCampaign).filter(EmailCampaign.id == cid).first()
+    if not c:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    
+    from src.email_system.campaign_sender import campaign_progress
+    return campaign_progress(db, c)
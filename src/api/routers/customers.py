@@ -5,6 +5,8 @@ from typing import List
 import logging
 
 from src.crm.database import get_session, Customer
+from src.crm.customer_tags import set_customer_tags, customer_tag_filter, parse_tag_text
+from src.utils.cache import cache
 from ..schemas import CustomerCreate, CustomerUpdate, CustomerOut
 from ..exceptions import BusinessException, DatabaseException, ResourceNotFoundException, ValidationException
 
@@ -55,6 +57,8 @@ def list_customers(
     status = f.get("status", "")
     country = f.get("country", "")
     customer_grade = f.get("customer_grade", "")
+    tags = f.get("tags", "")  # 标签筛选："VIP" / "VIP,大客户" / ["VIP", "大客户"]
+    tags_match = f.get("tags_match", "any")  # any: 任一标签, all: 全部标签
     
     # 通用搜索（在多个字段中搜索）
     if search:
@@ -80,6 +84,10 @@ def list_customers(
         query = query.filter(Customer.country.ilike(f"%{country}%"))
     if customer_grade:
         query = query.filter(Customer.customer_grade == customer_grade)
+    if tags:
+        tag_names = tags if isinstance(tags, list) else parse_tag_text(tags)
+        if tag_names:
+            query = query.filter(customer_tag_filter(tag_names, match_all=(tags_match == "all")))
 
     # 排序
     if sort_field and hasattr(Customer, sort_field):
@@ -113,6 +121,9 @@ def create_customer(customer_in: CustomerCreate, db: Session = Depends(get_db)):
         
         customer = Customer(**customer_in.dict())
         db.add(customer)
+        db.flush()
+        if customer_in.tags:
+            set_customer_tags(db, customer.id, customer_in.tags)
         db.commit()
         db.refresh(customer)
         
@@ -140,10 +151,17 @@ def update_customer(customer_id: int, customer_upd: CustomerUpdate, db: Session
         update_data = customer_upd.dict(exclude_unset=True)
         logger.info(f"更新客户", extra={"customer_id": customer_id, "fields": list(update_data.keys())})
         
+        # 标签通过关联表维护，Customer.tags 由关联表重建
+        tags_changed = "tags" in update_data
+        tags_text = update_data.pop("tags", None)
         for k, v in update_data.items():
             setattr(c, k, v)
+        if tags_changed:
+            db.flush()
+            set_customer_tags(db, customer_id, tags_text)
         db.commit()
         db.refresh(c)
+        cache.invalidate_tags(f"customer:{customer_id}")
         
         logger.info(f"更新客户成功", extra={"customer_id": customer_id})
         return c
@@ -164,6 +182,7 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db)):
         logger.warning(f"删除客户", extra={"customer_id": customer_id, "company_name": c.company_name})
         db.delete(c)
         db.commit()
+        cache.invalidate_tags(f"customer:{customer_id}")
         logger.info(f"删除客户成功", extra={"customer_id": customer_id})
         return {"deleted": True, "id": customer_id}
     except SQLAlchemyError as e:
@@ -3,11 +3,14 @@ from datetime import datetime
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Response, BackgroundTasks
 from pydantic import BaseModel, EmailStr
+from sqlalchemy import select, func
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from ...crm.database import get_session, EmailAccount, User, EmailHistory, Customer
+from ...crm.database import get_session, get_async_db, EmailAccount, User, EmailHistory, Customer
 from ...email_system.receiver import EmailReceiver
+from ...utils.tracing import traced
 from .auth import get_current_active_user
 from ..exceptions import BusinessException, DatabaseException, ResourceNotFoundException
 
@@ -90,17 +93,17 @@ async def get_email_accounts(
     response: Response,
     skip: int = 0,
     limit: int = 100,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取邮箱账户列表"""
-    db = get_session()
-    
     # 获取总数
-    total = db.query(EmailAccount).count()
+    total = await db.scalar(select(func.count()).select_from(EmailAccount))
     
     # 获取分页数据
-    accounts = db.query(EmailAccount).offset(skip).limit(limit).all()
-    db.close()
+    accounts = (await db.scalars(
+        select(EmailAccount).order_by(EmailAccount.id).offset(skip).limit(limit)
+    )).all()
     
     # 设置 Content-Range 头部
     response.headers["Content-Range"] = f"email_accounts {skip}-{skip + len(accounts) - 1}/{total}"
@@ -112,12 +115,11 @@ async def get_email_accounts(
 @router.get("/email_accounts/{account_id}", response_model=EmailAccountResponse)
 async def get_email_account(
     account_id: int,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取单个邮箱账户详情"""
-    db = get_session()
-    account = db.query(EmailAccount).filter(EmailAccount.id == account_id).first()
-    db.close()
+    account = await db.get(EmailAccount, account_id)
     
     if not account:
         logger.warning(f"邮箱账户不存在", extra={"account_id": account_id})
@@ -580,6 +582,7 @@ async def sync_emails(
     }
 
 
+@traced("email.sync_background")
 def sync_emails_background(
     account_id: int,
     limit: int,
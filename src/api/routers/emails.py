@@ -10,7 +10,7 @@ from pathlib import Path  # 🔥 新增
 
 from src.crm.database import get_session, EmailHistory, EmailAccount
 from ..schemas import EmailCreate, EmailUpdate, EmailOut
-from src.email_system.sender import EmailSender
+from src.email_system.sender import EmailSender, smtp_config_from_account
 from ..exceptions import BusinessException, DatabaseException, ResourceNotFoundException
 
 router = APIRouter()
@@ -210,14 +210,7 @@ def create_email(email_in: EmailCreate, db: Session = Depends(get_db)):
             ).first()
             
             if account and account.smtp_host and account.smtp_password:
-                # 配置SMTP
-                smtp_config = {
-                    'host': account.smtp_host,
-                    'port': account.smtp_port,
-                    'username': account.smtp_username or account.email_address,
-                    'password': account.smtp_password,
-                    'use_ssl': account.smtp_port == 465
-                }
+                smtp_config = smtp_config_from_account(account)
                 
                 # 创建发送器
                 sender = EmailSender(smtp_config=smtp_config)
@@ -302,15 +295,9 @@ def update_email(email_id: int, email_upd: EmailUpdate, db: Session = Depends(ge
                 ).first()
                 
                 if account and account.smtp_host and account.smtp_password:
-                    from src.email_system.sender import EmailSender
+                    from src.email_system.sender import EmailSender, smtp_config_from_account
                     
-                    smtp_config = {
-                        'host': account.smtp_host,
-                        'port': account.smtp_port,
-                        'username': account.smtp_username or account.email_address,
-                        'password': account.smtp_password,
-                        'use_ssl': account.smtp_port == 465
-                    }
+                    smtp_config = smtp_config_from_account(account)
                     
                     sender = EmailSender(smtp_config=smtp_config)
                     result = sender.send_email(
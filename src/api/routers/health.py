@@ -12,6 +12,8 @@ from typing import Dict, Any
 from src.crm.database import get_engine, SessionLocal
 from src.crm.session_manager import DatabaseSessionManager
 from src.utils.cache import cache
+from src.email_system.smtp_pool import smtp_pool
+from src.ai.near_duplicate import near_duplicate_index
 
 router = APIRouter(prefix="/health", tags=["健康检查"])
 
@@ -84,6 +86,15 @@ def detailed_health_check() -> Dict[str, Any]:
             "error": str(e)
         }
     
+    # SMTP连接池
+    health_status["components"]["smtp_pool"] = {
+        "status": "healthy",
+        **smtp_pool.snapshot()
+    }
+    
+    # 近似重复邮件去重命中率
+    health_status["components"]["near_duplicate"] = near_duplicate_index.stats()
+    
     # 检查磁盘空间
     try:
         disk = psutil.disk_usage('/')
@@ -1,7 +1,7 @@
 """线索管理路由"""
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Query
 from sqlalchemy import or_, and_
 from ...crm.database import get_session, Lead, Customer, User
 import json
@@ -234,6 +234,39 @@ def create_lead(data: dict):
     }
 
 
+@router.post("/leads/import")
+def import_leads_csv(
+    file: UploadFile = File(...),
+    on_duplicate: str = Query('skip', pattern='^(skip|update)$', description="邮箱已存在时：skip 跳过 / update 更新"),
+):
+    """
+    批量导入线索（CSV）
+    
+    必须包含 company_name 列，其他列按线索字段名匹配（忽略大小写）。
+    返回新增/更新/跳过数量和被拒绝的行（最多返回1000行）。
+    """
+    import pandas as pd
+    from ...crm.bulk_import import import_leads
+    
+    if not (file.filename or '').lower().endswith('.csv'):
+        raise HTTPException(status_code=400, detail="只支持CSV文件")
+    
+    try:
+        df = pd.read_csv(file.file, dtype=str, keep_default_na=False)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"读取CSV失败: {str(e)}")
+    
+    db = get_session()
+    try:
+        report = import_leads(df, db, on_duplicate=on_duplicate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        db.close()
+    
+    return {"success": True, **report.to_dict()}
+
+
 @router.put("/leads/{lead_id}")
 def update_lead(lead_id: int, data: dict):
     """更新线索"""
@@ -0,0 +1,24 @@
+"""
+运行指标API
+Prometheus 抓取 /metrics；/metrics/summary 返回按路由汇总的 p50/p95/p99（便于直接查看）
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src.utils.metrics import registry
+
+router = APIRouter(prefix="/metrics", tags=["运行指标"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus 文本格式指标（多进程部署时合并所有进程）"""
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/summary")
+def metrics_summary():
+    """各直方图指标的次数、平均值和分位数（毫秒）"""
+    return registry.summary()
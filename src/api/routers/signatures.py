@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from src.crm.database import get_session, EmailSignature
+from src.crm.database import get_session, get_async_db, EmailSignature
 from .auth import get_current_user
 
 router = APIRouter(prefix="/api/signatures", tags=["signatures"])
@@ -47,7 +49,7 @@ class SignatureResponse(BaseModel):
 async def get_signatures(
     response: Response,
     current_user=Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取当前用户的所有签名"""
     try:
@@ -55,9 +57,11 @@ async def get_signatures(
         print(f"用户ID: {current_user.id}, 用户名: {current_user.username}")
         
         # 获取签名列表
-        signatures = db.query(EmailSignature).filter(
-            EmailSignature.user_id == current_user.id
-        ).order_by(EmailSignature.display_order, EmailSignature.id).all()
+        signatures = (await db.scalars(
+            select(EmailSignature).filter(
+                EmailSignature.user_id == current_user.id
+            ).order_by(EmailSignature.display_order, EmailSignature.id)
+        )).all()
         
         print(f"查询到 {len(signatures)} 个签名")
         
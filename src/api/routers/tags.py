@@ -7,6 +7,13 @@ from datetime import datetime
 import json
 
 from src.crm.database import get_session, CustomerTag, Customer
+from src.crm.customer_tags import (
+    link_tags,
+    unlink_tags,
+    tagged_customer_ids,
+    refresh_tags_text,
+    refresh_usage_counts,
+)
 
 router = APIRouter()
 
@@ -139,7 +146,8 @@ def update_tag(tag_id: int, tag_in: TagUpdate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="标签不存在")
     
     # 检查名称冲突
-    if tag_in.name and tag_in.name != tag.name:
+    renamed = bool(tag_in.name and tag_in.name != tag.name)
+    if renamed:
         existing = db.query(CustomerTag).filter(CustomerTag.name == tag_in.name).first()
         if existing:
             raise HTTPException(status_code=400, detail="标签名称已存在")
@@ -149,6 +157,12 @@ def update_tag(tag_id: int, tag_in: TagUpdate, db: Session = Depends(get_db)):
         setattr(tag, field, value)
     
     tag.updated_at = datetime.now()
+    
+    # 重命名：只重建拥有该标签的客户的展示字段
+    if renamed:
+        db.flush()
+        refresh_tags_text(db, tagged_customer_ids(db, tag.id))
+    
     db.commit()
     db.refresh(tag)
     return tag
@@ -161,16 +175,13 @@ def delete_tag(tag_id: int, db: Session = Depends(get_db)):
     if not tag:
         raise HTTPException(status_code=404, detail="标签不存在")
     
-    # 从所有客户中移除该标签
-    customers = db.query(Customer).all()
-    for customer in customers:
-        if customer.tags:
-            tags_list = [t.strip() for t in customer.tags.split(',') if t.strip()]
-            if tag.name in tags_list:
-                tags_list.remove(tag.name)
-                customer.tags = ','.join(tags_list) if tags_list else None
+    # 只处理拥有该标签的客户（走 tag_id 索引）
+    affected_ids = tagged_customer_ids(db, tag.id)
+    unlink_tags(db, affected_ids, [tag.id])
     
     db.delete(tag)
+    db.flush()
+    refresh_tags_text(db, affected_ids)
     db.commit()
     
     return {"message": "标签已删除"}
@@ -184,47 +195,31 @@ def batch_tag_customers(request: BatchTagRequest, db: Session = Depends(get_db))
     if not tags:
         raise HTTPException(status_code=400, detail="标签不存在")
     
-    tag_names = [tag.name for tag in tags]
+    tag_ids = [tag.id for tag in tags]
     
     # 获取客户
-    customers = db.query(Customer).filter(Customer.id.in_(request.customer_ids)).all()
-    if not customers:
+    customer_ids = [
+        cid for (cid,) in db.query(Customer.id).filter(Customer.id.in_(request.customer_ids)).all()
+    ]
+    if not customer_ids:
         raise HTTPException(status_code=400, detail="客户不存在")
     
-    updated_count = 0
-    
-    for customer in customers:
-        # 获取现有标签
-        existing_tags = []
-        if customer.tags:
-            existing_tags = [t.strip() for t in customer.tags.split(',') if t.strip()]
-        
-        if request.action == 'add':
-            # 添加标签（去重）
-            for tag_name in tag_names:
-                if tag_name not in existing_tags:
-                    existing_tags.append(tag_name)
-                    updated_count += 1
-        elif request.action == 'remove':
-            # 移除标签
-            for tag_name in tag_names:
-                if tag_name in existing_tags:
-                    existing_tags.remove(tag_name)
-                    updated_count += 1
-        
-        # 更新客户标签
-        customer.tags = ','.join(existing_tags) if existing_tags else None
-    
-    # 更新标签使用次数
     if request.action == 'add':
-        for tag in tags:
-            tag.usage_count += len(customers)
+        updated_count = link_tags(db, customer_ids, tag_ids)
+    elif request.action == 'remove':
+        updated_count = unlink_tags(db, customer_ids, tag_ids)
+    else:
+        raise HTTPException(status_code=400, detail="action 只能是 add 或 remove")
+    
+    # 重建展示字段与使用次数
+    refresh_tags_text(db, customer_ids)
+    refresh_usage_counts(db, tag_ids)
     
     db.commit()
     
     return {
         "message": f"批量操作成功",
         "updated_count": updated_count,
-        "customers_count": len(customers),
-        "tags_count": len(tag_names)
+        "customers_count": len(customer_ids),
+        "tags_count": len(tag_ids)
     }
@@ -1,27 +1,21 @@
 """向量知识库API路由"""
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from datetime import datetime
 import traceback
 import json
 
-from src.crm.database import get_session, KnowledgeDocument, KnowledgeChunk
+from src.crm.database import get_async_db, KnowledgeDocument, KnowledgeChunk
 from src.ai.vector_knowledge import VectorKnowledgeService
+from src.utils.rate_limiter import rate_limit
 
 router = APIRouter()
 
 
-def get_db():
-    db = get_session()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class SearchRequest(BaseModel):
     """向量搜索请求"""
     query: str
@@ -45,7 +39,7 @@ async def upload_document(
     title: str = Form(...),
     category: str = Form("general"),
     description: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     上传文档到知识库
@@ -91,10 +85,14 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 
-@router.post("/knowledge/search", response_model=List[SearchResult])
+@router.post(
+    "/knowledge/search",
+    response_model=List[SearchResult],
+    dependencies=[Depends(rate_limit("knowledge_search", limit=60, window=60))]
+)
 async def search_knowledge(
     request: SearchRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     向量搜索知识库
@@ -136,21 +134,21 @@ async def list_documents(
     category: Optional[str] = None,
     skip: int = 0,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取文档列表"""
     try:
-        query = db.query(KnowledgeDocument).filter(
+        query = select(KnowledgeDocument).filter(
             KnowledgeDocument.is_active == True
         )
         
         if category:
             query = query.filter(KnowledgeDocument.category == category)
         
-        total = query.count()
-        documents = query.order_by(
-            KnowledgeDocument.created_at.desc()
-        ).offset(skip).limit(limit).all()
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+        documents = (await db.scalars(
+            query.order_by(KnowledgeDocument.created_at.desc()).offset(skip).limit(limit)
+        )).all()
         
         return {
             "total": total,
@@ -178,25 +176,29 @@ async def list_documents(
 @router.get("/knowledge/documents/{document_id}")
 async def get_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取文档详情（包括完整内容）"""
     try:
-        document = db.query(KnowledgeDocument).filter(
-            KnowledgeDocument.id == document_id,
-            KnowledgeDocument.is_active == True
-        ).first()
+        document = await db.scalar(
+            select(KnowledgeDocument).filter(
+                KnowledgeDocument.id == document_id,
+                KnowledgeDocument.is_active == True
+            )
+        )
         
         if not document:
             raise HTTPException(status_code=404, detail="文档不存在")
         
         # 获取所有分块内容，按顺序拼接
-        chunks = db.query(KnowledgeChunk).filter(
-            KnowledgeChunk.document_id == document_id
-        ).order_by(KnowledgeChunk.chunk_index).all()
+        chunk_contents = (await db.scalars(
+            select(KnowledgeChunk.content).filter(
+                KnowledgeChunk.document_id == document_id
+            ).order_by(KnowledgeChunk.chunk_index)
+        )).all()
         
         # 拼接完整内容
-        full_content = "\n".join([chunk.content for chunk in chunks])
+        full_content = "\n".join(chunk_contents)
         
         return {
             "id": document.id,
@@ -226,13 +228,11 @@ async def update_document(
     category: str = Form("general"),
     summary: Optional[str] = Form(None),
     content: Optional[str] = Form(None),  # 新增：支持内容编辑
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新文档信息，如果提供了content则重新生成向量"""
     try:
-        document = db.query(KnowledgeDocument).filter(
-            KnowledgeDocument.id == document_id
-        ).first()
+        document = await db.get(KnowledgeDocument, document_id)
         
         if not document:
             raise HTTPException(status_code=404, detail="文档不存在")
@@ -251,13 +251,13 @@ async def update_document(
             # 更新文档内容
             document.content = content[:5000]  # 保存前5000字符作为预览
             document.status = 'processing'
-            db.commit()
+            await db.commit()
             
             # 删除旧的分块
-            db.query(KnowledgeChunk).filter(
-                KnowledgeChunk.document_id == document_id
-            ).delete()
-            db.commit()
+            await db.execute(
+                delete(KnowledgeChunk).where(KnowledgeChunk.document_id == document_id)
+            )
+            await db.commit()
             
             # 重新分块
             vector_service = VectorKnowledgeService()
@@ -286,8 +286,8 @@ async def update_document(
             document.status = 'completed'
             print(f"✅ 向量重新生成完成")
         
-        db.commit()
-        db.refresh(document)
+        await db.commit()
+        await db.refresh(document)
         
         return {
             "success": True,
@@ -306,27 +306,25 @@ async def update_document(
     except Exception as e:
         print(f"❌ 更新文档失败: {str(e)}")
         traceback.print_exc()
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"更新失败: {str(e)}")
 
 
 @router.delete("/knowledge/documents/{document_id}")
 async def delete_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除文档"""
     try:
-        document = db.query(KnowledgeDocument).filter(
-            KnowledgeDocument.id == document_id
-        ).first()
+        document = await db.get(KnowledgeDocument, document_id)
         
         if not document:
             raise HTTPException(status_code=404, detail="文档不存在")
         
         # 软删除
         document.is_active = False
-        db.commit()
+        await db.commit()
         
         return {
             "success": True,
@@ -338,18 +336,18 @@ async def delete_document(
     except Exception as e:
         print(f"❌ 删除文档失败: {str(e)}")
         traceback.print_exc()
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
 
 
 @router.get("/knowledge/categories")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(db: AsyncSession = Depends(get_async_db)):
     """获取所有知识库分类"""
     try:
-        categories = db.query(KnowledgeDocument.category).distinct().all()
+        categories = (await db.scalars(select(KnowledgeDocument.category).distinct())).all()
         
         return {
-            "categories": [cat[0] for cat in categories if cat[0]]
+            "categories": [cat for cat in categories if cat]
         }
         
     except Exception as e:
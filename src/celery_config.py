@@ -72,3 +72,11 @@ celery_app.conf.update(
 
 # 任务自动发现
 celery_app.autodiscover_tasks(['src.tasks'])
+
+# 每个任务的 SQL 查询统计（N+1 检测、慢查询日志）
+from src.crm.query_profiler import connect_celery_signals
+connect_celery_signals()
+
+# 链路追踪：traceparent 通过消息头传给下游任务
+from src.utils.tracing import connect_celery_signals as connect_tracing_signals
+connect_tracing_signals()
@@ -0,0 +1,344 @@
+"""
+CSV 批量导入（客户 / 线索）
+
+流程：
+1. 列名规范化、字段清洗、校验全部用 pandas 向量化完成（不逐行 iterrows）
+2. 文件内按邮箱去重；已存在的邮箱用一次集合查询（分批 IN）从数据库中找出
+3. 分块（IMPORT_CHUNK_SIZE 行）批量写入：
+   - 新记录批量 INSERT（executemany）；客户表 email 唯一，使用 ON CONFLICT (email)
+     DO NOTHING / DO UPDATE，查重之后并发写入的同邮箱记录也不会导致整块失败
+   - 已存在的记录（on_duplicate='update' 时）按主键批量 UPDATE
+   每块一次提交，单块失败只影响该块，整块记为拒绝
+4. 返回导入报告：新增 / 更新 / 跳过数量和被拒绝的行（含原因）
+
+用法：
+    report = import_customers(df, db, on_duplicate='skip', progress=lambda done, total: ...)
+    report.to_dict()
+"""
+import os
+import math
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .database import DB_TYPE, Customer, Lead
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+# 查重时每次 IN 查询的邮箱数量（SQLite 绑定参数数量有限）
+IMPORT_LOOKUP_BATCH = 5000
+# 报告中最多返回的拒绝行数
+MAX_REPORTED_REJECTIONS = 1000
+
+ON_DUPLICATE_OPTIONS = ('skip', 'update')
+
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+# 可导入的列：{列名: 类型}，CSV 中的其他列会被忽略
+CUSTOMER_COLUMNS = {
+    'company_name': 'str', 'contact_name': 'str', 'email': 'str', 'phone': 'str',
+    'website': 'str', 'country': 'str', 'industry': 'str', 'company_size': 'str',
+    'status': 'str', 'source': 'str', 'priority': 'int',
+}
+LEAD_COLUMNS = {
+    'company_name': 'str', 'contact_name': 'str', 'email': 'str', 'phone': 'str',
+    'website': 'str', 'country': 'str', 'industry': 'str', 'company_size': 'str',
+    'lead_source': 'str', 'lead_status': 'str', 'lead_score': 'int', 'priority': 'str',
+    'estimated_budget': 'float', 'decision_timeframe': 'str', 'pain_points': 'str',
+    'competitor_info': 'str', 'product_interest': 'str', 'notes': 'str',
+}
+
+# 受 CheckConstraint 约束的枚举列：{列名: (允许值, 默认值)}
+CUSTOMER_CHOICES = {
+    'status': (('cold', 'contacted', 'replied', 'qualified', 'negotiating', 'customer', 'lost'), 'cold'),
+}
+LEAD_CHOICES = {
+    'lead_status': (('new', 'contacted', 'in_progress', 'qualified', 'unqualified', 'converted'), 'new'),
+    'priority': (('high', 'medium', 'low'), 'medium'),
+}
+
+
+class ImportReport:
+    """导入结果报告"""
+
+    def __init__(self, total_rows: int):
+        self.total_rows = total_rows
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected_total = 0
+        self.rejected: List[Dict] = []
+
+    def reject(self, frame: pd.DataFrame, reason: str):
+        """记录被拒绝的行（row 为数据行号，从1开始，不含表头）"""
+        self.rejected_total += len(frame)
+        room = MAX_REPORTED_REJECTIONS - len(self.rejected)
+        if room <= 0 or frame.empty:
+            return
+        sample = frame.head(room)
+        for index, record in zip(sample.index, _records(sample)):
+            self.rejected.append({
+                "row": int(index) + 1,
+                "company_name": record.get('company_name'),
+                "email": record.get('email'),
+                "reason": reason,
+            })
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_rows": self.total_rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "rejected_total": self.rejected_total,
+            "rejected": self.rejected,
+        }
+
+
+def _to_python(value):
+    """pandas/numpy 标量转为数据库驱动能识别的 Python 类型"""
+    if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def _records(frame: pd.DataFrame, **extra) -> List[Dict]:
+    """DataFrame 转为 executemany 参数列表"""
+    columns = list(frame.columns)
+    return [
+        {**{column: _to_python(value) for column, value in zip(columns, values)}, **extra}
+        for values in frame.itertuples(index=False, name=None)
+    ]
+
+
+def _clean_text(series: pd.Series) -> pd.Series:
+    """去除首尾空白，空字符串/NaN 统一为缺失值"""
+    cleaned = series.astype('string').str.strip()
+    return cleaned.mask(cleaned.isin(['', 'nan', 'None', 'NaN']))
+
+
+def normalize_frame(
+    df: pd.DataFrame,
+    columns: Dict[str, str],
+    choices: Dict[str, tuple],
+    report: ImportReport
+) -> pd.DataFrame:
+    """
+    向量化清洗 CSV 数据，无效行写入报告并从结果中移除
+
+    Returns:
+        只包含可导入列的 DataFrame（索引保留原始行号）
+    """
+    df = df.copy()
+    df.columns = [str(c).strip().lower().replace(' ', '_') for c in df.columns]
+    df = df.loc[:, ~df.columns.duplicated()]
+    if 'company_name' not in df.columns:
+        raise ValueError("CSV 缺少 company_name 列")
+
+    frame = pd.DataFrame(index=df.index)
+    for column, kind in columns.items():
+        if column not in df.columns:
+            continue
+        if kind == 'str':
+            frame[column] = _clean_text(df[column])
+        else:
+            numbers = pd.to_numeric(df[column], errors='coerce')
+            frame[column] = numbers.round().astype('Int64') if kind == 'int' else numbers.astype('Float64')
+
+    if 'email' in frame.columns:
+        frame['email'] = frame['email'].str.lower()
+    else:
+        frame['email'] = pd.Series(pd.NA, index=frame.index, dtype='string')
+
+    # 枚举列：空值用默认值，非法值拒绝
+    for column, (allowed, default) in choices.items():
+        if column in frame.columns:
+            frame[column] = frame[column].str.lower().fillna(default)
+        else:
+            frame[column] = pd.Series(default, index=frame.index, dtype='string')
+
+    invalid = frame['company_name'].isna()
+    report.reject(frame[invalid], "公司名称为空")
+    frame = frame[~invalid]
+
+    valid_email = frame['email'].str.match(EMAIL_PATTERN).fillna(False).astype(bool)
+    invalid = frame['email'].notna() & ~valid_email
+    report.reject(frame[invalid], "邮箱格式无效")
+    frame = frame[~invalid]
+
+    for column, (allowed, _) in choices.items():
+        invalid = ~frame[column].isin(allowed)
+        report.reject(frame[invalid], f"{column} 取值无效（允许: {', '.join(allowed)}）")
+        frame = frame[~invalid]
+
+    # 文件内重复邮箱：保留第一条
+    duplicated = frame['email'].notna() & frame['email'].duplicated(keep='first')
+    report.reject(frame[duplicated], "文件内邮箱重复")
+    return frame[~duplicated]
+
+
+def find_existing_emails(db: Session, model, emails: List[str]) -> Dict[str, int]:
+    """查询已存在的邮箱，返回 {小写邮箱: 记录ID}"""
+    existing: Dict[str, int] = {}
+    for i in range(0, len(emails), IMPORT_LOOKUP_BATCH):
+        batch = emails[i:i + IMPORT_LOOKUP_BATCH]
+        rows = db.execute(
+            select(func.lower(model.email), model.id).where(func.lower(model.email).in_(batch))
+        ).all()
+        for email, record_id in rows:
+            existing.setdefault(email, record_id)
+    return existing
+
+
+def _dialect_insert(model):
+    """返回支持 ON CONFLICT 的方言 insert 构造函数"""
+    if DB_TYPE == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model)
+
+
+def _upsert_statement(model, columns: List[str], on_duplicate: str):
+    """INSERT ... ON CONFLICT (email)：skip 不改动已有记录，update 用非空新值覆盖"""
+    stmt = _dialect_insert(model)
+    if on_duplicate == 'update':
+        table = model.__table__
+        set_ = {
+            column: func.coalesce(stmt.excluded[column], table.c[column])
+            for column in columns if column not in ('email', 'created_at')
+        }
+        return stmt.on_conflict_do_update(index_elements=['email'], set_=set_)
+    return stmt.on_conflict_do_nothing(index_elements=['email'])
+
+
+def _load_chunks(
+    db: Session,
+    frame: pd.DataFrame,
+    write_chunk: Callable[[pd.DataFrame], None],
+    report: ImportReport,
+    progress: Optional[Callable[[int, int], None]],
+    done: int,
+    total: int,
+) -> int:
+    """分块写入，每块一次提交；失败的块整体回滚并记为拒绝"""
+    for start in range(0, len(frame), IMPORT_CHUNK_SIZE):
+        chunk = frame.iloc[start:start + IMPORT_CHUNK_SIZE]
+        try:
+            write_chunk(chunk)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"批量导入分块失败（{len(chunk)} 行）: {str(e)}")
+            report.reject(chunk, f"写入失败: {str(e)[:200]}")
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    return done
+
+
+def _run_import(
+    df: pd.DataFrame,
+    db: Session,
+    model,
+    columns: Dict[str, str],
+    choices: Dict[str, tuple],
+    on_duplicate: str,
+    progress: Optional[Callable[[int, int], None]],
+    use_on_conflict: bool,
+) -> ImportReport:
+    if on_duplicate not in ON_DUPLICATE_OPTIONS:
+        raise ValueError(f"on_duplicate 只能是 {ON_DUPLICATE_OPTIONS}")
+
+    report = ImportReport(len(df))
+    frame = normalize_frame(df, columns, choices, report)
+
+    emails = frame['email'].dropna().unique().tolist()
+    existing = find_existing_emails(db, model, emails) if emails else {}
+    is_existing = frame['email'].isin(list(existing)).fillna(False).astype(bool)
+
+    new_rows = frame[~is_existing]
+    existing_rows = frame[is_existing]
+
+    if on_duplicate == 'skip':
+        report.skipped = len(existing_rows)
+        existing_rows = existing_rows.iloc[0:0]
+
+    total = len(new_rows) + len(existing_rows)
+    logger.info(
+        f"📥 批量导入 {model.__tablename__}: 共 {report.total_rows} 行, "
+        f"新增 {len(new_rows)}, 已存在 {int(is_existing.sum())}, 拒绝 {report.rejected_total}"
+    )
+    now = datetime.utcnow()
+
+    def insert_chunk(chunk: pd.DataFrame):
+        records = _records(chunk, created_at=now, updated_at=now)
+        if use_on_conflict:
+            # ON CONFLICT DO NOTHING 跳过的行不会出现在 RETURNING 中（如查重之后被并发写入的邮箱）
+            stmt = _upsert_statement(model, list(records[0]), on_duplicate).returning(model.id)
+            written = len(db.execute(stmt, records).all())
+            report.inserted += written
+            report.skipped += len(chunk) - written
+        else:
+            db.execute(insert(model), records)
+            report.inserted += len(chunk)
+
+    def update_chunk(chunk: pd.DataFrame):
+        # 按主键批量 UPDATE（executemany），只覆盖CSV中非空的字段
+        # （按主键而不是 ON CONFLICT：库里的邮箱可能大小写不同，查重是按小写匹配的）
+        records = _records(chunk, updated_at=now)
+        db.execute(update(model), [
+            {**{k: v for k, v in record.items() if v is not None and k != 'email'}, "id": existing[record['email']]}
+            for record in records
+        ])
+        report.updated += len(chunk)
+
+    done = _load_chunks(db, new_rows, insert_chunk, report, progress, 0, total)
+    _load_chunks(db, existing_rows, update_chunk, report, progress, done, total)
+
+    logger.info(
+        f"✅ 批量导入完成: 新增 {report.inserted}, 更新 {report.updated}, "
+        f"跳过 {report.skipped}, 拒绝 {report.rejected_total}"
+    )
+    return report
+
+
+def import_customers(
+    df: pd.DataFrame,
+    db: Session,
+    on_duplicate: str = 'skip',
+    progress: Optional[Callable[[int, int], None]] = None
+) -> ImportReport:
+    """
+    批量导入客户
+
+    Args:
+        df: CSV 读取得到的 DataFrame（至少包含 company_name 列）
+        db: 数据库会话
+        on_duplicate: 邮箱已存在时 skip（跳过）或 update（用CSV中的非空值更新）
+        progress: 进度回调 progress(已处理行数, 需写入总行数)
+    """
+    return _run_import(
+        df, db, Customer, CUSTOMER_COLUMNS, CUSTOMER_CHOICES,
+        on_duplicate, progress, use_on_conflict=True
+    )
+
+
+def import_leads(
+    df: pd.DataFrame,
+    db: Session,
+    on_duplicate: str = 'skip',
+    progress: Optional[Callable[[int, int], None]] = None
+) -> ImportReport:
+    """批量导入线索（参数同 import_customers；线索表 email 没有唯一约束，不使用 ON CONFLICT）"""
+    return _run_import(
+        df, db, Lead, LEAD_COLUMNS, LEAD_CHOICES,
+        on_duplicate, progress, use_on_conflict=False
+    )
@@ -0,0 +1,182 @@
+"""
+客户标签索引
+customer_tag_links 关联表是客户标签的数据源，所有增删改都是集合操作；
+Customer.tags 文本列只作为展示字段，由 refresh_tags_text 针对受影响的客户批量重建。
+"""
+from datetime import datetime
+from typing import Iterable, List, Dict, Optional
+
+from sqlalchemy import select, insert, delete, update, func
+from sqlalchemy.orm import Session
+
+from src.crm.database import Customer, CustomerTag, customer_tag_links, DB_TYPE
+
+# 标签名称最大长度（与 CustomerTag.name 一致）
+MAX_TAG_NAME_LENGTH = 50
+
+
+def parse_tag_text(tags_text: Optional[str]) -> List[str]:
+    """解析逗号分隔的标签文本（去空格、去重、保持顺序）"""
+    if not tags_text:
+        return []
+    names = []
+    for part in tags_text.split(','):
+        name = part.strip()[:MAX_TAG_NAME_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _tag_names_agg():
+    """按数据库类型选择字符串聚合函数"""
+    if DB_TYPE == 'postgresql':
+        from sqlalchemy.dialects.postgresql import aggregate_order_by
+        return func.string_agg(CustomerTag.name, aggregate_order_by(',', CustomerTag.name))
+    return func.group_concat(CustomerTag.name, ',')
+
+
+def ensure_tags(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    """
+    确保标签存在（不存在则创建）
+
+    Returns:
+        {标签名: 标签ID}
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+
+    rows = db.execute(
+        select(CustomerTag.name, CustomerTag.id).where(CustomerTag.name.in_(names))
+    ).all()
+    tag_map = {name: tag_id for name, tag_id in rows}
+
+    missing = [name for name in names if name not in tag_map]
+    if missing:
+        now = datetime.now()
+        db.execute(insert(CustomerTag), [
+            {"name": name, "usage_count": 0, "created_at": now, "updated_at": now}
+            for name in missing
+        ])
+        rows = db.execute(
+            select(CustomerTag.name, CustomerTag.id).where(CustomerTag.name.in_(missing))
+        ).all()
+        tag_map.update({name: tag_id for name, tag_id in rows})
+
+    return tag_map
+
+
+def link_tags(db: Session, customer_ids: List[int], tag_ids: List[int]) -> int:
+    """为一批客户添加一批标签，返回新增的关联数量"""
+    if not customer_ids or not tag_ids:
+        return 0
+
+    existing = set(db.execute(
+        select(customer_tag_links.c.customer_id, customer_tag_links.c.tag_id).where(
+            customer_tag_links.c.customer_id.in_(customer_ids),
+            customer_tag_links.c.tag_id.in_(tag_ids)
+        )
+    ).all())
+    rows = [
+        {"customer_id": cid, "tag_id": tid}
+        for cid in customer_ids for tid in tag_ids
+        if (cid, tid) not in existing
+    ]
+    if rows:
+        db.execute(insert(customer_tag_links), rows)
+    return len(rows)
+
+
+def unlink_tags(db: Session, customer_ids: List[int], tag_ids: List[int]) -> int:
+    """为一批客户移除一批标签，返回删除的关联数量"""
+    if not customer_ids or not tag_ids:
+        return 0
+
+    result = db.execute(
+        delete(customer_tag_links).where(
+            customer_tag_links.c.customer_id.in_(customer_ids),
+            customer_tag_links.c.tag_id.in_(tag_ids)
+        )
+    )
+    return result.rowcount or 0
+
+
+def tagged_customer_ids(db: Session, tag_id: int) -> List[int]:
+    """获取拥有某个标签的客户ID（走 tag_id 索引）"""
+    return list(db.execute(
+        select(customer_tag_links.c.customer_id).where(customer_tag_links.c.tag_id == tag_id)
+    ).scalars())
+
+
+def set_customer_tags(db: Session, customer_id: int, tags_text: Optional[str]) -> None:
+    """用逗号分隔的标签文本整体替换某个客户的标签（用于客户编辑表单）"""
+    tag_map = ensure_tags(db, parse_tag_text(tags_text))
+    wanted = set(tag_map.values())
+
+    current = set(db.execute(
+        select(customer_tag_links.c.tag_id).where(customer_tag_links.c.customer_id == customer_id)
+    ).scalars())
+
+    unlink_tags(db, [customer_id], list(current - wanted))
+    link_tags(db, [customer_id], list(wanted - current))
+
+    refresh_tags_text(db, [customer_id])
+    refresh_usage_counts(db, list(current | wanted))
+
+
+def refresh_tags_text(db: Session, customer_ids: List[int]) -> None:
+    """根据关联表重建指定客户的 Customer.tags 展示字段（单条 UPDATE）"""
+    if not customer_ids:
+        return
+
+    names_subquery = (
+        select(_tag_names_agg())
+        .select_from(customer_tag_links.join(CustomerTag, CustomerTag.id == customer_tag_links.c.tag_id))
+        .where(customer_tag_links.c.customer_id == Customer.id)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(Customer)
+        .where(Customer.id.in_(customer_ids))
+        .values(tags=names_subquery)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def refresh_usage_counts(db: Session, tag_ids: List[int]) -> None:
+    """根据关联表重算标签使用次数（单条 UPDATE）"""
+    if not tag_ids:
+        return
+
+    count_subquery = (
+        select(func.count())
+        .select_from(customer_tag_links)
+        .where(customer_tag_links.c.tag_id == CustomerTag.id)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(CustomerTag)
+        .where(CustomerTag.id.in_(tag_ids))
+        .values(usage_count=count_subquery)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def customer_tag_filter(tag_names: List[str], match_all: bool = False):
+    """
+    构造按标签筛选客户的条件（走关联表索引，替代 LIKE 模糊匹配）
+
+    Args:
+        tag_names: 标签名称列表
+        match_all: True 表示必须同时拥有所有标签，False 表示拥有任一标签
+    """
+    subquery = (
+        select(customer_tag_links.c.customer_id)
+        .join(CustomerTag, CustomerTag.id == customer_tag_links.c.tag_id)
+        .where(CustomerTag.name.in_(tag_names))
+    )
+    if match_all:
+        subquery = subquery.group_by(customer_tag_links.c.customer_id).having(
+            func.count(func.distinct(customer_tag_links.c.tag_id)) == len(set(tag_names))
+        )
+    return Customer.id.in_(subquery)
@@ -2,6 +2,10 @@ import streamlit as st
 import pandas as pd
 
 from .database import get_session, Customer, EmailHistory, Order
+from .dashboard_data import (
+    FUNNEL_STAGES, get_kpis, get_funnel_counts, get_due_followups, get_delayed_orders,
+    invalidate_dashboard_data,
+)
 from src.email_system.ai_writer import AIEmailWriter
 
 
@@ -104,25 +108,11 @@ class CRMDashboard:
             unsafe_allow_html=True,
         )
 
-        # 统计数据
-        total_customers = self.session.query(Customer).count()
-        active_status = ["contacted", "replied", "qualified", "negotiating"]
-        active_leads = sum(
-            1 for c in self.session.query(Customer).all() if c.status in active_status
-        )
-        from datetime import datetime
-        month_amount = 0
-        try:
-            from sqlalchemy import extract
-            month_orders = (
-                self.session.query(Order)
-                .filter(extract('year', Order.order_date) == datetime.now().year)
-                .filter(extract('month', Order.order_date) == datetime.now().month)
-                .all()
-            )
-            month_amount = sum(float(o.total_amount or 0) for o in month_orders)
-        except Exception:
-            month_amount = 0
+        # 统计数据（聚合查询 + TTL缓存）
+        kpis = get_kpis()
+        total_customers = kpis["total_customers"]
+        active_leads = kpis["active_leads"]
+        month_amount = kpis["month_amount"]
 
         # 指标卡片
         col1, col2, col3, col4 = st.columns(4)
@@ -158,7 +148,7 @@ class CRMDashboard:
             )
         with col4:
             # 新增：本月订单数
-            month_orders_count = len(month_orders) if 'month_orders' in locals() else 0
+            month_orders_count = kpis["month_orders"]
             st.markdown(
                 f"""
                 <div class='card'>
@@ -169,20 +159,13 @@ class CRMDashboard:
                 unsafe_allow_html=True,
             )
 
-        # 简易漏斗占位图（后续替换为真实数据）
-        st.markdown("<div class='section-title'>销售漏斗（占位）</div>", unsafe_allow_html=True)
-        import pandas as pd
+        # 销售漏斗
+        st.markdown("<div class='section-title'>销售漏斗</div>", unsafe_allow_html=True)
+        funnel_counts = get_funnel_counts()
         funnel = pd.DataFrame(
             {
-                "阶段": ["Cold", "Contacted", "Replied", "Qualified", "Negotiating", "Customer"],
-                "数量": [
-                    sum(1 for c in self.session.query(Customer).all() if (c.status or "cold") == "cold"),
-                    sum(1 for c in self.session.query(Customer).all() if c.status == "contacted"),
-                    sum(1 for c in self.session.query(Customer).all() if c.status == "replied"),
-                    sum(1 for c in self.session.query(Customer).all() if c.status == "qualified"),
-                    sum(1 for c in self.session.query(Customer).all() if c.status == "negotiating"),
-                    sum(1 for c in self.session.query(Customer).all() if c.status == "customer"),
-                ],
+                "阶段": [stage.capitalize() for stage in FUNNEL_STAGES],
+                "数量": [funnel_counts.get(stage, 0) for stage in FUNNEL_STAGES],
             }
         )
         # 使用面积图替代柱状图
@@ -191,41 +174,20 @@ class CRMDashboard:
         # 需要关注的提醒区
         st.markdown("<div class='section-title'>需要关注</div>", unsafe_allow_html=True)
         # 今日需跟进客户（next_followup_date 到期或缺失且非 cold）
-        from datetime import datetime, timedelta
-        customers_all = self.session.query(Customer).all()
-        need_follow = []
-        now = datetime.now()
-        for c in customers_all:
-            if (c.status or 'cold') != 'cold':
-                if c.next_followup_date is None or c.next_followup_date <= now:
-                    need_follow.append({
-                        '公司': c.company_name,
-                        '联系人': c.contact_name or '-',
-                        '邮箱': c.email or '-',
-                        '状态': c.status or 'cold'
-                    })
-        import pandas as pd
-        if need_follow:
-            st.markdown("**今日需跟进客户**")
-            st.dataframe(pd.DataFrame(need_follow), use_container_width=True)
+        need_follow = get_due_followups()
+        if need_follow["rows"]:
+            st.markdown(f"**今日需跟进客户**（共 {need_follow['total']} 位）")
+            st.dataframe(pd.DataFrame(need_follow["rows"]), use_container_width=True)
         else:
             st.info("暂无需跟进客户")
 
         # 延期订单（estimated_completion_date 已过且未完成/未交付）
-        delayed = []
-        orders_all = self.session.query(Order).all()
-        for o in orders_all:
-            if o.estimated_completion_date and o.estimated_completion_date < (now - timedelta(days=int(st.session_state.get("settings", {}).get("delay_tolerance_days", 0)))):
-                if o.status not in ['shipped', 'delivered', 'completed']:
-                    delayed.append({
-                        '订单': o.order_number,
-                        '公司': next((c.company_name for c in customers_all if c.id == o.customer_id), '-'),
-                        '状态': o.status,
-                        '预计完成': o.estimated_completion_date.strftime('%Y-%m-%d')
-                    })
-        if delayed:
-            st.markdown("**延期订单**")
-            st.dataframe(pd.DataFrame(delayed), use_container_width=True)
+        delayed = get_delayed_orders(
+            int(st.session_state.get("settings", {}).get("delay_tolerance_days", 0))
+        )
+        if delayed["rows"]:
+            st.markdown(f"**延期订单**（共 {delayed['total']} 个）")
+            st.dataframe(pd.DataFrame(delayed["rows"]), use_container_width=True)
         else:
             st.info("暂无延期订单")
         st.markdown("---")
@@ -249,38 +211,38 @@ class CRMDashboard:
         if uploaded is not None:
             import pandas as pd
             try:
-                df = pd.read_csv(uploaded)
+                df = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
                 df.columns = [str(c).strip().lower() for c in df.columns]
                 st.caption("预览前10条：")
                 st.dataframe(df.head(10), use_container_width=True)
         
+                on_duplicate = st.radio(
+                    "邮箱已存在时", ["skip", "update"],
+                    format_func=lambda v: "跳过" if v == "skip" else "用CSV中的非空值更新",
+                    horizontal=True
+                )
                 if st.button("开始导入", type="primary"):
-                    added = 0
-                    for _, row in df.iterrows():
-                        company_name = str(row.get("company_name") or "").strip()
-                        if not company_name:
-                            continue
-                        try:
-                            c = Customer(
-                                company_name=company_name,
-                                contact_name=(str(row.get("contact_name") or "").strip() or None),
-                                email=(str(row.get("email") or "").strip() or None),
-                                country=(str(row.get("country") or "").strip() or None),
-                                status=(str(row.get("status") or "cold").strip() or "cold"),
-                                source=(str(row.get("source") or "").strip() or None),
-                                website=(str(row.get("website") or "").strip() or None),
-                                industry=(str(row.get("industry") or "").strip() or None),
-                                phone=(str(row.get("phone") or "").strip() or None),
-                            )
-                            self.session.add(c)
-                            self.session.commit()
-                            added += 1
-                        except Exception:
-                            self.session.rollback()
-                            # 可能是重复邮箱等约束冲突，跳过
-                            continue
-                    st.success(f"导入完成，新增 {added} 条记录")
-                    st.rerun()
+                    from .bulk_import import import_customers
+
+                    bar = st.progress(0.0, text="导入中...")
+                    report = import_customers(
+                        df, self.session, on_duplicate=on_duplicate,
+                        progress=lambda done, total: bar.progress(done / total, text=f"导入中 {done}/{total}")
+                    )
+                    bar.progress(1.0, text="导入完成")
+                    # 批量导入走 Core 批量写入，不会触发 ORM 事件，需要手动失效仪表盘缓存
+                    invalidate_dashboard_data()
+                    st.success(
+                        f"导入完成：新增 {report.inserted} 条，更新 {report.updated} 条，"
+                        f"跳过 {report.skipped} 条，拒绝 {report.rejected_total} 条"
+                    )
+                    if report.rejected:
+                        rejected_df = pd.DataFrame(report.rejected)
+                        st.dataframe(rejected_df, use_container_width=True)
+                        st.download_button(
+                            "下载被拒绝的行", rejected_df.to_csv(index=False).encode("utf-8-sig"),
+                            file_name="rejected_rows.csv", mime="text/csv"
+                        )
             except Exception as e:
                 st.error(f"读取CSV失败：{e}")
 
@@ -0,0 +1,162 @@
+"""
+仪表盘数据服务
+Streamlit 每次交互都会重跑整个页面，这里把仪表盘需要的数据改为：
+- 聚合 SQL（GROUP BY / COUNT / SUM）和带 LIMIT 的索引查询，不再把整张表加载到 Python 里
+- st.cache_data 按 TTL（DASHBOARD_CACHE_TTL 秒）缓存，重跑页面直接命中缓存
+
+失效策略：
+- 客户/订单通过 ORM 新增、修改、删除时自动失效（SQLAlchemy 事件）
+- Core 批量写入（如 CSV 批量导入）不会触发 ORM 事件，写入后需要调用 invalidate_dashboard_data()
+- 其他进程（API / Celery）写入的数据在 TTL 内生效
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict
+
+import streamlit as st
+from sqlalchemy import event, func, or_
+
+from .database import get_session, Customer, Order
+
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', 60))
+# 提醒列表最多显示的行数（总数单独统计）
+DASHBOARD_LIST_LIMIT = 200
+
+FUNNEL_STAGES = ["cold", "contacted", "replied", "qualified", "negotiating", "customer"]
+ACTIVE_STATUSES = ["contacted", "replied", "qualified", "negotiating"]
+FINISHED_ORDER_STATUSES = ["shipped", "delivered", "completed"]
+
+
+def _month_range(now: datetime):
+    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def get_funnel_counts() -> Dict[str, int]:
+    """各状态客户数（一次 GROUP BY，status 为空按 cold 计）"""
+    db = get_session()
+    try:
+        rows = db.query(
+            func.coalesce(Customer.status, 'cold'), func.count(Customer.id)
+        ).group_by(func.coalesce(Customer.status, 'cold')).all()
+    finally:
+        db.close()
+    return {status: count for status, count in rows}
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def get_month_order_stats() -> Dict:
+    """本月订单数和金额（按日期范围过滤，可以使用 order_date 索引）"""
+    start, end = _month_range(datetime.now())
+    db = get_session()
+    try:
+        count, amount = db.query(
+            func.count(Order.id), func.coalesce(func.sum(Order.total_amount), 0)
+        ).filter(Order.order_date >= start, Order.order_date < end).one()
+    finally:
+        db.close()
+    return {"count": int(count or 0), "amount": float(amount or 0)}
+
+
+def get_kpis() -> Dict:
+    """指标卡片数据（由漏斗和订单聚合结果推导，不额外查询）"""
+    funnel = get_funnel_counts()
+    month = get_month_order_stats()
+    return {
+        "total_customers": sum(funnel.values()),
+        "active_leads": sum(funnel.get(status, 0) for status in ACTIVE_STATUSES),
+        "month_amount": month["amount"],
+        "month_orders": month["count"],
+    }
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def get_due_followups(limit: int = DASHBOARD_LIST_LIMIT) -> Dict:
+    """
+    今日需跟进客户（非 cold 且下次跟进时间已到或未设置）
+
+    Returns:
+        {"total": 总数, "rows": 最多 limit 条，按跟进时间升序，未设置的排最前}
+    """
+    now = datetime.now()
+    condition = (
+        Customer.status.isnot(None),
+        Customer.status != 'cold',
+        or_(Customer.next_followup_date.is_(None), Customer.next_followup_date <= now),
+    )
+    db = get_session()
+    try:
+        total = db.query(func.count(Customer.id)).filter(*condition).scalar()
+        rows = db.query(
+            Customer.company_name, Customer.contact_name, Customer.email, Customer.status
+        ).filter(*condition).order_by(
+            Customer.next_followup_date.is_(None).desc(), Customer.next_followup_date.asc()
+        ).limit(limit).all()
+    finally:
+        db.close()
+    return {
+        "total": total,
+        "rows": [
+            {'公司': r.company_name, '联系人': r.contact_name or '-', '邮箱': r.email or '-', '状态': r.status}
+            for r in rows
+        ],
+    }
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def get_delayed_orders(tolerance_days: int = 0, limit: int = DASHBOARD_LIST_LIMIT) -> Dict:
+    """
+    延期订单（预计完成时间已过 tolerance_days 天且未发货/交付/完成），公司名通过 JOIN 取出
+
+    Returns:
+        {"total": 总数, "rows": 最多 limit 条，延期最久的排最前}
+    """
+    deadline = datetime.now() - timedelta(days=tolerance_days)
+    condition = (
+        Order.estimated_completion_date.isnot(None),
+        Order.estimated_completion_date < deadline,
+        or_(Order.status.is_(None), Order.status.notin_(FINISHED_ORDER_STATUSES)),
+    )
+    db = get_session()
+    try:
+        total = db.query(func.count(Order.id)).filter(*condition).scalar()
+        rows = db.query(
+            Order.order_number, Order.status, Order.estimated_completion_date, Customer.company_name
+        ).outerjoin(Customer, Customer.id == Order.customer_id).filter(*condition).order_by(
+            Order.estimated_completion_date.asc()
+        ).limit(limit).all()
+    finally:
+        db.close()
+    return {
+        "total": total,
+        "rows": [
+            {
+                '订单': r.order_number,
+                '公司': r.company_name or '-',
+                '状态': r.status,
+                '预计完成': r.estimated_completion_date.strftime('%Y-%m-%d'),
+            }
+            for r in rows
+        ],
+    }
+
+
+_CACHED_QUERIES = [get_funnel_counts, get_month_order_stats, get_due_followups, get_delayed_orders]
+
+
+def invalidate_dashboard_data():
+    """清空仪表盘缓存（数据写入后调用）"""
+    for query in _CACHED_QUERIES:
+        query.clear()
+
+
+@event.listens_for(Customer, 'after_insert')
+@event.listens_for(Customer, 'after_update')
+@event.listens_for(Customer, 'after_delete')
+@event.listens_for(Order, 'after_insert')
+@event.listens_for(Order, 'after_update')
+@event.listens_for(Order, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_dashboard_data()
@@ -17,10 +17,15 @@ from sqlalchemy import (
     CheckConstraint,
     create_engine,
     Table,
+    Index,
     text,  # 🔥 新增：用于 server_default
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from datetime import datetime
+import time
+
+from src.utils.metrics import registry as metrics_registry, DB_POOL_CHECKOUT_WAIT, DB_POOL_CONNECTIONS
 
 Base = declarative_base()
 
@@ -35,11 +40,35 @@ if DB_TYPE == 'postgresql':
     DB_PORT = os.getenv('DB_PORT', '5432')
     DB_NAME = os.getenv('DB_NAME', 'crm_system')
     DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 else:
-    # SQLite 配置（备用）
-    DB_PATH = Path("data")
-    DB_PATH.mkdir(parents=True, exist_ok=True)
-    DATABASE_URL = f"sqlite:///{DB_PATH / 'customers.db'}"
+    # SQLite 配置（备用；SQLITE_DB_PATH 可指定其他数据库文件，如基准测试库）
+    SQLITE_DB_PATH = Path(os.getenv('SQLITE_DB_PATH', 'data/customers.db'))
+    SQLITE_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    DATABASE_URL = f"sqlite:///{SQLITE_DB_PATH}"
+    ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{SQLITE_DB_PATH}"
+
+
+class TimedQueuePool(QueuePool):
+    """记录取连接等待时间的连接池（/metrics 中的 db_pool_checkout_wait_seconds）"""
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels('sync').observe(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """异步引擎使用的计时连接池"""
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels('async').observe(time.perf_counter() - start)
 
 
 # 数据库连接池配置
@@ -59,6 +88,7 @@ def get_engine():
         pool_timeout=pool_timeout,        # 获取连接的超时时间（秒）
         pool_recycle=pool_recycle,        # 连接回收时间（1小时）
         pool_pre_ping=True,               # 连接前ping测试
+        poolclass=TimedQueuePool,
         connect_args={
             "connect_timeout": 10,
             "options": "-c statement_timeout=30000"  # SQL执行超时(30秒)
@@ -74,6 +104,80 @@ SessionLocal = sessionmaker(
     expire_on_commit=False  # 避免Session外访问对象报错
 )
 
+# 异步引擎（供 async def 路由使用，asyncpg / aiosqlite）
+# 首次使用时才创建：只在 API 进程的事件循环中使用，Celery 任务和同步代码继续使用 SessionLocal
+_async_engine = None
+_async_session_factory = None
+
+
+def get_async_engine():
+    """获取异步数据库引擎（连接池参数与同步引擎一致）"""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        kwargs = {"echo": False, "pool_pre_ping": True}
+        if DB_TYPE == 'postgresql':
+            kwargs.update(
+                poolclass=TimedAsyncQueuePool,
+                pool_size=int(os.getenv('DATABASE_POOL_SIZE', 20)),
+                max_overflow=int(os.getenv('DATABASE_MAX_OVERFLOW', 40)),
+                pool_timeout=int(os.getenv('DATABASE_POOL_TIMEOUT', 30)),
+                pool_recycle=int(os.getenv('DATABASE_POOL_RECYCLE', 3600)),
+                connect_args={
+                    "timeout": 10,
+                    "server_settings": {"statement_timeout": "30000"}  # SQL执行超时(30秒)
+                },
+            )
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, **kwargs)
+    return _async_engine
+
+
+def _collect_pool_metrics():
+    """/metrics 输出前读取连接池状态"""
+    pools = [('sync', engine.pool)]
+    if _async_engine is not None:
+        pools.append(('async', _async_engine.pool))
+    for name, pool in pools:
+        if isinstance(pool, QueuePool):
+            DB_POOL_CONNECTIONS.labels(name, 'size').set(pool.size())
+            DB_POOL_CONNECTIONS.labels(name, 'checked_out').set(pool.checkedout())
+            DB_POOL_CONNECTIONS.labels(name, 'checked_in').set(pool.checkedin())
+            DB_POOL_CONNECTIONS.labels(name, 'overflow').set(max(pool.overflow(), 0))
+
+
+metrics_registry.add_collector(_collect_pool_metrics)
+
+
+def get_async_session_factory():
+    """获取异步会话工厂"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_session_factory = async_sessionmaker(
+            bind=get_async_engine(),
+            autoflush=False,
+            expire_on_commit=False  # 避免Session外访问对象报错
+        )
+    return _async_session_factory
+
+
+async def get_async_db():
+    """FastAPI 依赖：异步数据库会话（请求结束自动关闭）"""
+    async with get_async_session_factory()() as session:
+        yield session
+
+
+async def dispose_async_engine():
+    """关闭异步连接池（应用关闭时调用）"""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+
 # 用户角色关联表（多对多）
 user_roles = Table(
     'user_roles',
@@ -82,9 +186,23 @@ user_roles = Table(
     Column('role_id', Integer, ForeignKey('roles.id'))
 )
 
+# 客户标签关联表（多对多）：客户标签的唯一数据源，Customer.tags 仅作展示冗余
+customer_tag_links = Table(
+    'customer_tag_links',
+    Base.metadata,
+    Column('customer_id', Integer, ForeignKey('customers.id', ondelete='CASCADE'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('customer_tags.id', ondelete='CASCADE'), primary_key=True),
+    Column('created_at', DateTime, server_default=text('CURRENT_TIMESTAMP')),
+    Index('ix_customer_tag_links_tag_id', 'tag_id', 'customer_id'),
+)
+
 
 class Customer(Base):
     __tablename__ = "customers"
+    __table_args__ = (
+        # 仪表盘漏斗统计 / 待跟进客户查询
+        Index('ix_customers_status_followup', 'status', 'next_followup_date'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     company_name = Column(String, nullable=False)
@@ -106,8 +224,8 @@ class Customer(Base):
     priority = Column(Integer, default=3)
     source = Column(String)
     
-    # 新增：客户标签（JSON格式存储）
-    tags = Column(Text)  # ["VIP", "大客户", "快速响应"]
+    # 客户标签（逗号分隔，由 customer_tag_links 重建的展示字段）
+    tags = Column(Text)  # "VIP,大客户,快速响应"
     
     # 新增：客户分级（A/B/C/D）
     customer_grade = Column(String)  # A: 核心客户, B: 重要客户, C: 普通客户, D: 潜在客户
@@ -165,6 +283,7 @@ class Customer(Base):
     email_history = relationship("EmailHistory", back_populates="customer")
     orders = relationship("Order", back_populates="customer")
     followup_records = relationship("FollowupRecord", back_populates="customer")
+    tag_items = relationship("CustomerTag", secondary=customer_tag_links, back_populates="customers")
 
 
 class EmailHistory(Base):
@@ -285,6 +404,11 @@ class PromptTemplate(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # 仪表盘本月订单统计 / 延期订单查询
+        Index('ix_orders_order_date', 'order_date'),
+        Index('ix_orders_estimated_completion', 'estimated_completion_date'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     customer_id = Column(Integer, ForeignKey("customers.id"))
@@ -837,6 +961,9 @@ class CustomerTag(Base):
     # 标准时间字段
     created_at = Column(DateTime, nullable=False, server_default=text('CURRENT_TIMESTAMP'))
     updated_at = Column(DateTime, nullable=False, server_default=text('CURRENT_TIMESTAMP'), onupdate=datetime.now)
+    
+    # 关系
+    customers = relationship("Customer", secondary=customer_tag_links, back_populates="tag_items")
 
 
 class AutoReplyRule(Base):
@@ -0,0 +1,212 @@
+"""
+SQL 查询分析（每个请求 / Celery 任务）
+
+通过 SQLAlchemy 的 before/after_cursor_execute 事件（注册在 Engine 类上，同步和异步引擎都生效）：
+- 统计每个请求/任务的查询次数和数据库总耗时
+- 同一"语句形状"（参数、数字、IN 列表归一化后的 SQL）重复执行超过 DB_N_PLUS_ONE_THRESHOLD 次
+  视为 N+1 候选，请求结束时打印警告
+- 超过 DB_SLOW_QUERY_MS 的语句记录慢查询日志（参数只保留类型，不输出值）
+- DB_PROFILE_HEADERS=true 时在响应头中附带 X-DB-Queries / X-DB-Time（调试用）
+- 当前请求/任务处于链路追踪中时，每条语句生成一个 db.query span
+
+生产环境开销：未被采样的请求只做一次计时（用于慢查询日志），
+按 DB_PROFILE_SAMPLE_RATE 采样的请求才做语句归一化和按形状计数。
+"""
+import os
+import re
+import time
+import random
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.utils.metrics import DB_N_PLUS_ONE
+from src.utils.tracing import create_span, current_span, SPAN_KIND_CLIENT
+
+logger = logging.getLogger(__name__)
+
+DB_PROFILE_ENABLED = os.getenv('DB_PROFILE_ENABLED', 'true').lower() == 'true'
+DB_PROFILE_SAMPLE_RATE = float(os.getenv('DB_PROFILE_SAMPLE_RATE', 0.1))
+DB_PROFILE_HEADERS = os.getenv('DB_PROFILE_HEADERS', 'false').lower() == 'true'
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+DB_N_PLUS_ONE_THRESHOLD = int(os.getenv('DB_N_PLUS_ONE_THRESHOLD', 10))
+# 日志中 SQL 的最大长度
+STATEMENT_LOG_CHARS = 500
+
+_PLACEHOLDER = r'(?:\?|%\(\w+\)s|%s|\$\d+)'
+_IN_LISTS = re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)')
+_PLACEHOLDERS = re.compile(_PLACEHOLDER)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+
+_START_KEY = 'query_profiler_start'
+_SPAN_KEY = 'query_profiler_span'
+
+
+def statement_shape(statement: str) -> str:
+    """归一化 SQL：参数占位符、字符串/数字常量、IN 列表统一替换，同一查询模板得到相同结果"""
+    shape = _STRINGS.sub('?', statement)
+    shape = _IN_LISTS.sub('(?...)', shape)
+    shape = _PLACEHOLDERS.sub('?', shape)
+    shape = _NUMBERS.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def redact_parameters(parameters) -> object:
+    """参数脱敏：只保留参数名和类型"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany
+            return f"<{len(parameters)} 组参数>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class QueryProfile:
+    """一个请求/任务内的查询统计"""
+
+    def __init__(self, name: str, detailed: bool = True):
+        self.name = name
+        self.detailed = detailed
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: Counter = Counter()
+        self.shape_time: Dict[str, float] = {}
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        if self.detailed:
+            shape = statement_shape(statement)
+            self.shapes[shape] += 1
+            self.shape_time[shape] = self.shape_time.get(shape, 0.0) + duration
+
+    def n_plus_one_candidates(self, threshold: int = DB_N_PLUS_ONE_THRESHOLD):
+        """重复次数达到阈值的语句形状 [(形状, 次数, 总耗时秒), ...]"""
+        return [
+            (shape, count, self.shape_time[shape])
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    def report(self):
+        """请求/任务结束时输出 N+1 警告"""
+        for shape, count, elapsed in self.n_plus_one_candidates():
+            DB_N_PLUS_ONE.labels(self.name).inc()
+            logger.warning(
+                f"疑似 N+1 查询: {self.name} 中同一语句执行 {count} 次（共 {elapsed * 1000:.1f}ms）: "
+                f"{shape[:STATEMENT_LOG_CHARS]}",
+                extra={"db_profile": self.name, "repeat_count": count, "statement_shape": shape[:STATEMENT_LOG_CHARS]}
+            )
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar('query_profile', default=None)
+
+
+def start_profile(name: str, force: bool = False):
+    """
+    开始统计（返回 token，结束时交给 end_profile）
+
+    Args:
+        name: 请求路径或任务名
+        force: 忽略采样率（开启调试响应头时使用）
+    """
+    if not DB_PROFILE_ENABLED:
+        return None
+    detailed = force or random.random() < DB_PROFILE_SAMPLE_RATE
+    return _current_profile.set(QueryProfile(name, detailed=detailed))
+
+
+def end_profile(token) -> Optional[QueryProfile]:
+    """结束统计并输出 N+1 警告，返回统计结果"""
+    if token is None:
+        return None
+    profile = _current_profile.get()
+    _current_profile.reset(token)
+    if profile is not None and profile.detailed:
+        profile.report()
+    return profile
+
+
+def current_profile() -> Optional[QueryProfile]:
+    return _current_profile.get()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if DB_PROFILE_ENABLED:
+        conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+    # 只在已有 trace 的请求/任务中创建 db span（不开启新的 trace）
+    parent = current_span()
+    if parent is not None and parent.sampled:
+        span = create_span('db.query', SPAN_KIND_CLIENT, {
+            'db.system': conn.dialect.name,
+            'db.statement': _WHITESPACE.sub(' ', statement)[:STATEMENT_LOG_CHARS],
+        })
+        conn.info.setdefault(_SPAN_KEY, []).append(span)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get(_SPAN_KEY)
+    if spans:
+        spans.pop().end()
+
+    starts = conn.info.get(_START_KEY)
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(statement, duration)
+
+    if duration * 1000 >= DB_SLOW_QUERY_MS:
+        logger.warning(
+            f"慢查询 {duration * 1000:.1f}ms: {_WHITESPACE.sub(' ', statement)[:STATEMENT_LOG_CHARS]} "
+            f"参数={redact_parameters(parameters)}",
+            extra={"db_profile": profile.name if profile else None, "duration": round(duration * 1000, 2)}
+        )
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # 语句执行失败时 after_cursor_execute 不会触发，这里把计时和 span 出栈
+    conn = context.connection
+    if conn is None or context.statement is None:
+        return
+    starts = conn.info.get(_START_KEY)
+    if starts:
+        starts.pop()
+    spans = conn.info.get(_SPAN_KEY)
+    if spans:
+        span = spans.pop()
+        span.set_error(context.original_exception)
+        span.end()
+
+
+def connect_celery_signals():
+    """为每个 Celery 任务统计查询（在 celery_config 中调用）"""
+    from celery.signals import task_prerun, task_postrun
+
+    tokens = {}
+
+    @task_prerun.connect(weak=False)
+    def _start_task_profile(task_id=None, task=None, **kwargs):
+        tokens[task_id] = start_profile(task.name if task else 'celery_task')
+
+    @task_postrun.connect(weak=False)
+    def _end_task_profile(task_id=None, task=None, **kwargs):
+        profile = end_profile(tokens.pop(task_id, None))
+        if profile is not None and profile.count:
+            logger.info(
+                f"任务数据库统计: {profile.name} 查询 {profile.count} 次，耗时 {profile.total_time * 1000:.1f}ms",
+                extra={"db_queries": profile.count, "db_time_ms": round(profile.total_time * 1000, 2)}
+            )
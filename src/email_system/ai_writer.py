@@ -4,6 +4,8 @@ import re
 from typing import Dict, List, Optional
 from openai import OpenAI  # 🔥 引入 OpenAI 客户端
 
+from src.utils.keyword_matcher import get_rule_set
+
 
 class AIEmailWriter:
     """AI邮件智能助手 - 提供邮件分析、生成、润色等功能"""
@@ -55,12 +57,13 @@ class AIEmailWriter:
         body = email_content.get("body", "").lower()
         combined = f"{subject} {body}"
         
-        # 简单规则引擎（实际应用中可接入OpenAI GPT）
+        # 简单规则引擎（实际应用中可接入OpenAI GPT），关键词见 config/keyword_rules.json
+        detected = get_rule_set('ai_writer').evaluate(combined)
         result = {
-            "category": self._detect_category(combined),
-            "sentiment": self._detect_sentiment(combined),
-            "urgency_level": self._detect_urgency(combined),
-            "purchase_intent": self._detect_intent(combined),
+            "category": detected["category"],
+            "sentiment": detected["sentiment"],
+            "urgency_level": detected["urgency_level"],
+            "purchase_intent": detected["purchase_intent"],
             "summary": self._generate_summary(email_content),
             "key_points": self._extract_key_points(combined),
             "suggested_tags": []
@@ -71,53 +74,6 @@ class AIEmailWriter:
         
         return result
     
-    def _detect_category(self, text: str) -> str:
-        """检测邮件类别"""
-        if any(word in text for word in ["quote", "price", "quotation", "询价", "报价"]):
-            return "inquiry"
-        elif any(word in text for word in ["order", "purchase", "buy", "订单", "采购"]):
-            return "order"
-        elif any(word in text for word in ["sample", "样品", "样衣"]):
-            return "sample"
-        elif any(word in text for word in ["complain", "issue", "problem", "投诉", "问题"]):
-            return "complaint"
-        elif any(word in text for word in ["follow", "update", "status", "跟进"]):
-            return "follow_up"
-        else:
-            return "spam"  # 默认为垃圾营销
-    
-    def _detect_sentiment(self, text: str) -> str:
-        """检测情绪"""
-        if any(word in text for word in ["urgent", "asap", "immediately", "紧急", "尽快", "立即"]):
-            return "urgent"
-        elif any(word in text for word in ["angry", "disappointed", "unacceptable", "生气", "失望"]):
-            return "negative"
-        elif any(word in text for word in ["thank", "great", "excellent", "perfect", "感谢", "很好"]):
-            return "positive"
-        else:
-            return "neutral"
-    
-    def _detect_urgency(self, text: str) -> str:
-        """检测紧急程度"""
-        if any(word in text for word in ["urgent", "asap", "emergency", "immediately", "紧急", "马上"]):
-            return "high"
-        elif any(word in text for word in ["soon", "quickly", "尽快"]):
-            return "medium"
-        else:
-            return "low"
-    
-    def _detect_intent(self, text: str) -> str:
-        """检测购买意向"""
-        high_intent_words = ["order", "purchase", "buy", "payment", "deposit", "订单", "购买", "付款"]
-        medium_intent_words = ["quote", "price", "sample", "询价", "报价", "样品"]
-        
-        if any(word in text for word in high_intent_words):
-            return "high"
-        elif any(word in text for word in medium_intent_words):
-            return "medium"
-        else:
-            return "low"
-    
     def _generate_summary(self, email_content: dict) -> str:
         """生成邮件摘要（简化版）"""
         body = email_content.get("body", "")
@@ -358,16 +314,6 @@ class AIEmailWriter:
                 {"task": "准备报价单", "due_date": None}
             ]
         """
-        body = email_content.get("body", "").lower()
-        actions = []
-        
-        if "sample" in body or "样品" in body:
-            actions.append({"task": "发送样品", "due_date": None})
-        
-        if "quote" in body or "price" in body or "报价" in body:
-            actions.append({"task": "准备报价单", "due_date": None})
-        
-        if "call" in body or "meeting" in body or "电话" in body:
-            actions.append({"task": "安排通话/会议", "due_date": None})
-        
-        return actions
+        body = email_content.get("body", "")
+        tasks = get_rule_set('ai_writer_actions').evaluate(body)["action_items"]
+        return [{"task": task, "due_date": None} for task in tasks]
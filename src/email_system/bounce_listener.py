@@ -10,6 +10,33 @@ from email.header import decode_header
 import imaplib
 import email
 
+# 退信特征（发件人是 MAILER-DAEMON / postmaster，或典型退信标题）
+BOUNCE_SEARCH_CRITERIA = [
+    'FROM "MAILER-DAEMON"',
+    'FROM "postmaster"',
+    'FROM "Mail Delivery System"',
+    'SUBJECT "Undelivered"',
+    'SUBJECT "Failure"',
+    'SUBJECT "Returned mail"',
+    'SUBJECT "Delivery Status Notification"',
+]
+
+# 单次检查最多处理的邮件数 / 每次 FETCH 的邮件数
+BOUNCE_FETCH_LIMIT = 200
+BOUNCE_FETCH_BATCH = 25
+
+
+def build_or_criteria(criteria: List[str]) -> str:
+    """
+    把多个搜索条件合并为一个 IMAP OR 表达式（IMAP 的 OR 只接受两个参数，需要嵌套）
+    
+    ['A', 'B', 'C'] -> 'OR OR (A) (B) (C)'
+    """
+    if len(criteria) == 1:
+        return f'({criteria[0]})'
+    return 'OR ' * (len(criteria) - 1) + ' '.join(f'({c})' for c in criteria)
+
+
 class BounceListener:
     """退信邮件监听器"""
     
@@ -30,6 +57,8 @@ class BounceListener:
         self.password = password
         self.use_ssl = use_ssl
         self.connection = None
+        self.last_uid: Optional[int] = None
+        self.uid_validity: Optional[int] = None
     
     def connect(self):
         """连接到IMAP服务器"""
@@ -54,10 +83,17 @@ class BounceListener:
             except:
                 pass
     
-    def check_bounce_emails(self) -> List[Dict]:
+    def check_bounce_emails(self, since_uid: Optional[int] = None, limit: int = BOUNCE_FETCH_LIMIT) -> List[Dict]:
         """
         检查退信邮件
         
+        一次 UID SEARCH（所有特征用 OR 合并）找出候选邮件，再按批 UID FETCH，
+        最后一次 UID STORE 批量标记已读。
+        
+        Args:
+            since_uid: 只检查 UID 大于该值的邮件（增量检查）；None 表示检查全部
+            limit: 单次最多处理的邮件数（取最新的）
+        
         Returns:
             退信邮件列表，每个元素包含：
             {
@@ -67,52 +103,79 @@ class BounceListener:
                 'recipient': '收件人邮箱',
                 'smtp_code': 'SMTP错误码'
             }
+            
+            检查完成后 self.last_uid / self.uid_validity 记录本次看到的最大UID，
+            调用方保存后作为下次的 since_uid。
         """
         if not self.connection:
             if not self.connect():
                 return []
         
         bounce_emails = []
+        self.last_uid = None
         
         try:
             # 选择收件箱
             self.connection.select('INBOX')
+            self.uid_validity = self._get_uid_validity()
+            
+            criteria = build_or_criteria(BOUNCE_SEARCH_CRITERIA)
+            if since_uid:
+                criteria = f'UID {since_uid + 1}:* {criteria}'
+            
+            status, messages = self.connection.uid('SEARCH', None, criteria)
+            if status != 'OK':
+                print(f"⚠️ 搜索退信邮件失败: {messages}")
+                return []
+            
+            uids = sorted(int(uid) for uid in (messages[0] or b'').split())
+            # "UID n:*" 在没有新邮件时会返回当前最大UID，需要过滤掉
+            if since_uid:
+                uids = [uid for uid in uids if uid > since_uid]
+            if not uids:
+                self.last_uid = since_uid
+                return []
+            
+            max_uid = uids[-1]
+            uids = uids[-limit:]
             
-            # 搜索退信邮件的特征
-            # 1. 发件人是 MAILER-DAEMON 或 postmaster
-            search_criteria = [
-                '(FROM "MAILER-DAEMON")',
-                '(FROM "postmaster")',
-                '(FROM "Mail Delivery System")',
-                '(SUBJECT "Undelivered")',
-                '(SUBJECT "Failure")',
-                '(SUBJECT "Returned mail")',
-                '(SUBJECT "Delivery Status Notification")'
-            ]
+            for i in range(0, len(uids), BOUNCE_FETCH_BATCH):
+                batch = uids[i:i + BOUNCE_FETCH_BATCH]
+                for raw_message in self._fetch_batch(batch):
+                    bounce_info = self._parse_bounce_message(raw_message)
+                    if bounce_info:
+                        bounce_emails.append(bounce_info)
             
-            for criteria in search_criteria:
-                try:
-                    status, messages = self.connection.search(None, criteria)
-                    if status == 'OK' and messages[0]:
-                        email_ids = messages[0].split()
-                        # 只处理最近的50封退信邮件
-                        for email_id in email_ids[-50:]:
-                            bounce_info = self._parse_bounce_email(email_id)
-                            if bounce_info:
-                                bounce_emails.append(bounce_info)
-                                # 标记为已读
-                                self.connection.store(email_id, '+FLAGS', '\\Seen')
-                except Exception as e:
-                    print(f"⚠️ 搜索退信邮件失败 ({criteria}): {str(e)}")
-                    continue
+            # 批量标记为已读
+            self.connection.uid('STORE', ','.join(str(uid) for uid in uids), '+FLAGS', '(\\Seen)')
+            # 全部处理成功后才推进增量位置
+            self.last_uid = max_uid
             
-            print(f"📧 检查到 {len(bounce_emails)} 封退信邮件")
+            print(f"📧 检查 {len(uids)} 封候选邮件，识别到 {len(bounce_emails)} 封退信邮件")
             
         except Exception as e:
             print(f"❌ 检查退信邮件失败: {str(e)}")
         
         return bounce_emails
     
+    def _get_uid_validity(self) -> Optional[int]:
+        """读取当前邮箱的 UIDVALIDITY（变化后旧的UID全部失效）"""
+        try:
+            _, data = self.connection.response('UIDVALIDITY')
+            if data and data[0]:
+                return int(data[0])
+        except Exception:
+            pass
+        return None
+    
+    def _fetch_batch(self, uids: List[int]) -> List[bytes]:
+        """一次 UID FETCH 取回一批邮件原文（BODY.PEEK 不会自动标记已读）"""
+        status, msg_data = self.connection.uid('FETCH', ','.join(str(uid) for uid in uids), '(BODY.PEEK[])')
+        if status != 'OK':
+            return []
+        # 响应形如 [(b'1 (UID 10 BODY[] {123}', b'...'), b')', ...]
+        return [part[1] for part in msg_data if isinstance(part, tuple) and len(part) > 1]
+    
     def _parse_bounce_email(self, email_id: bytes) -> Optional[Dict]:
         """
         解析退信邮件
@@ -128,7 +191,23 @@ class BounceListener:
             if status != 'OK':
                 return None
             
-            email_body = msg_data[0][1]
+            return self._parse_bounce_message(msg_data[0][1])
+            
+        except Exception as e:
+            print(f"⚠️ 解析退信邮件失败: {str(e)}")
+            return None
+    
+    def _parse_bounce_message(self, email_body: bytes) -> Optional[Dict]:
+        """
+        解析退信邮件原文
+        
+        Args:
+            email_body: 邮件原文（RFC822）
+            
+        Returns:
+            退信信息字典，如果不是退信邮件则返回None
+        """
+        try:
             email_message = message_from_bytes(email_body)
             
             # 提取邮件内容
@@ -0,0 +1,358 @@
+"""
+营销活动发送引擎
+将一个 EmailCampaign 的收件人分配到所有可用的 EmailAccount 上并发发送：
+- 每个账户一条 Celery 任务链，任务内复用同一个已登录的 SMTP 会话
+- 按账户（发送间隔 + 每日上限）和按收件域名（每分钟上限）限速
+- 每封邮件的结果写入 EmailHistory(campaign_id=...)，中断后重新启动只发送剩余收件人
+"""
+import os
+import re
+import time
+import uuid
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, exists, func, true
+
+from src.crm.database import Customer, EmailAccount, EmailCampaign, EmailHistory, EmailTemplate
+from src.crm.customer_tags import customer_tag_filter
+from src.email_system.sender import EmailSender, smtp_config_from_account
+from src.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 同一账户两封邮件之间的最小间隔（秒）
+CAMPAIGN_ACCOUNT_INTERVAL = float(os.getenv('CAMPAIGN_ACCOUNT_INTERVAL', 5))
+# 单个账户每日最多发送数量
+CAMPAIGN_ACCOUNT_DAILY_LIMIT = int(os.getenv('CAMPAIGN_ACCOUNT_DAILY_LIMIT', 500))
+# 同一收件域名每分钟最多发送数量（所有账户合计）
+CAMPAIGN_DOMAIN_PER_MINUTE = int(os.getenv('CAMPAIGN_DOMAIN_PER_MINUTE', 20))
+# 单个任务的发送时长预算（秒），需低于 Celery 软超时（240秒）
+CAMPAIGN_TIME_BUDGET = int(os.getenv('CAMPAIGN_TIME_BUDGET', 200))
+
+_PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')
+
+
+class SendThrottle:
+    """
+    发送限速器
+    使用 Redis 计数器在多个 worker 之间共享限额；Redis 不可用时退化为进程内计数
+    """
+
+    def __init__(self, client=None):
+        self.client = client if client is not None else (cache.client if cache.available else None)
+        self._local: Dict[str, int] = {}
+
+    def _incr(self, key: str, ttl: int) -> int:
+        if self.client is not None:
+            try:
+                pipe = self.client.pipeline()
+                pipe.incr(key)
+                pipe.expire(key, ttl)
+                count, _ = pipe.execute()
+                return int(count)
+            except Exception as e:
+                logger.warning(f"限速计数失败，使用本地计数 [{key}]: {str(e)}")
+        self._local[key] = self._local.get(key, 0) + 1
+        return self._local[key]
+
+    def _decr(self, key: str):
+        if self.client is not None:
+            try:
+                self.client.decr(key)
+                return
+            except Exception:
+                pass
+        self._local[key] = max(0, self._local.get(key, 0) - 1)
+
+    def acquire_account(self, account_id: int) -> bool:
+        """占用账户当日发送额度"""
+        key = f"campaign:account:{account_id}:{datetime.utcnow():%Y%m%d}"
+        if self._incr(key, 86400) > CAMPAIGN_ACCOUNT_DAILY_LIMIT:
+            self._decr(key)
+            return False
+        return True
+
+    def acquire_domain(self, domain: str) -> bool:
+        """占用收件域名当前分钟的发送额度"""
+        key = f"campaign:domain:{domain.lower()}:{int(time.time() // 60)}"
+        if self._incr(key, 120) > CAMPAIGN_DOMAIN_PER_MINUTE:
+            self._decr(key)
+            return False
+        return True
+
+    def release_account(self, account_id: int):
+        """归还账户额度（发送失败时）"""
+        self._decr(f"campaign:account:{account_id}:{datetime.utcnow():%Y%m%d}")
+
+
+def start_campaign_run(campaign_id: int) -> str:
+    """
+    生成新的运行ID
+    旧的任务链发现运行ID变化后自行退出，避免暂停/重启后重复发送
+    """
+    run_id = uuid.uuid4().hex
+    cache.set(f"campaign:{campaign_id}:run", run_id, ttl=7 * 86400)
+    return run_id
+
+
+def is_current_run(campaign_id: int, run_id: str) -> bool:
+    """判断任务链是否属于当前运行"""
+    current = cache.get(f"campaign:{campaign_id}:run")
+    # Redis 不可用时无法判断，依赖 campaign.status 控制
+    return current is None or current == run_id
+
+
+def segment_filter(segment: Optional[str]):
+    """目标群体 -> 客户筛选条件"""
+    if segment == 'VIP':
+        return or_(customer_tag_filter(['VIP']), Customer.customer_grade == 'A')
+    if segment == 'New Leads':
+        return Customer.status == 'cold'
+    return true()
+
+
+def pending_recipient_ids(db, campaign: EmailCampaign) -> List[int]:
+    """尚未在本次活动中处理过（成功或失败）的收件客户ID"""
+    already_sent = exists().where(and_(
+        EmailHistory.campaign_id == campaign.id,
+        EmailHistory.customer_id == Customer.id
+    ))
+    rows = db.query(Customer.id).filter(
+        Customer.email.isnot(None),
+        Customer.email != '',
+        Customer.status != 'lost',
+        segment_filter(campaign.target_segment),
+        ~already_sent
+    ).order_by(Customer.id).all()
+    return [row[0] for row in rows]
+
+
+def sending_accounts(db) -> List[EmailAccount]:
+    """所有可用于发送的邮箱账户"""
+    return db.query(EmailAccount).filter(
+        EmailAccount.is_active == True,
+        EmailAccount.smtp_host.isnot(None),
+        EmailAccount.smtp_password.isnot(None)
+    ).order_by(EmailAccount.id).all()
+
+
+def plan_campaign(db, campaign: EmailCampaign) -> Dict[int, List[int]]:
+    """
+    将剩余收件人轮询分配到各个发送账户
+
+    Returns:
+        {account_id: [customer_id, ...]}
+    """
+    accounts = sending_accounts(db)
+    if not accounts:
+        return {}
+
+    plan = {account.id: [] for account in accounts}
+    account_ids = list(plan.keys())
+    for index, customer_id in enumerate(pending_recipient_ids(db, campaign)):
+        plan[account_ids[index % len(account_ids)]].append(customer_id)
+
+    return {account_id: ids for account_id, ids in plan.items() if ids}
+
+
+def render_template(text: Optional[str], customer: Customer, account: EmailAccount) -> str:
+    """替换模板变量，如 {company_name}、{contact_name}、{sender_name}"""
+    if not text:
+        return ''
+    values = {
+        'company_name': customer.company_name or '',
+        'contact_name': customer.contact_name or 'there',
+        'country': customer.country or '',
+        'industry': customer.industry or '',
+        'sender_name': account.account_name or '',
+        'sender_email': account.email_address or '',
+    }
+    return _PLACEHOLDER_PATTERN.sub(lambda m: values.get(m.group(1), m.group(0)), text)
+
+
+def send_campaign_batch(db, campaign_id: int, account_id: int, customer_ids: List[int],
+                        throttle: Optional[SendThrottle] = None,
+                        time_budget: int = CAMPAIGN_TIME_BUDGET) -> Dict:
+    """
+    用一个账户发送一批活动邮件（单个 SMTP 会话）
+
+    在时间预算内尽量发送；被限速或超出预算的收件人放入 remaining，由调用方重新排队。
+
+    Returns:
+        {
+            'sent': int, 'failed': int,
+            'remaining': [customer_id, ...],
+            'retry_after': 秒数（建议的重新排队延迟）,
+            'stopped': 停止原因（None 表示正常）
+        }
+    """
+    throttle = throttle or SendThrottle()
+    result = {'sent': 0, 'failed': 0, 'remaining': [], 'retry_after': 0, 'stopped': None}
+
+    campaign = db.query(EmailCampaign).filter(EmailCampaign.id == campaign_id).first()
+    account = db.query(EmailAccount).filter(EmailAccount.id == account_id).first()
+    if not campaign or not account:
+        result['stopped'] = 'not_found'
+        return result
+
+    template = db.query(EmailTemplate).filter(EmailTemplate.id == campaign.template_id).first()
+    if not template:
+        result['stopped'] = 'template_missing'
+        return result
+
+    # 一次查询出本批客户，并排除已处理的（任务重试/重复投递时保证幂等）
+    done_ids = {
+        row[0] for row in db.query(EmailHistory.customer_id).filter(
+            EmailHistory.campaign_id == campaign_id,
+            EmailHistory.customer_id.in_(customer_ids)
+        ).all()
+    }
+    customers = {
+        c.id: c for c in db.query(Customer).filter(Customer.id.in_(customer_ids)).all()
+    }
+    queue = [cid for cid in customer_ids if cid in customers and cid not in done_ids]
+
+    sender = EmailSender(smtp_config=smtp_config_from_account(account))
+    sender.daily_limit = CAMPAIGN_ACCOUNT_DAILY_LIMIT
+    deadline = time.monotonic() + time_budget
+    deferred = []
+    last_sent_at = 0.0
+
+    try:
+        sender.open()
+    except Exception as e:
+        logger.error(f"活动发送账户连接失败: {account.email_address} - {str(e)}")
+        result['remaining'] = queue
+        result['retry_after'] = 300
+        result['stopped'] = 'smtp_connect_failed'
+        return result
+
+    try:
+        while queue:
+            if time.monotonic() >= deadline:
+                result['stopped'] = 'time_budget'
+                break
+
+            # 每轮检查一次活动状态，支持暂停
+            db.refresh(campaign)
+            if campaign.status != 'Running':
+                result['stopped'] = 'paused'
+                break
+
+            customer_id = queue.pop(0)
+            customer = customers[customer_id]
+            domain = customer.email.rsplit('@', 1)[-1]
+
+            if not throttle.acquire_domain(domain):
+                deferred.append(customer_id)
+                continue
+            if not throttle.acquire_account(account_id):
+                queue.insert(0, customer_id)
+                result['retry_after'] = 3600
+                result['stopped'] = 'daily_limit'
+                break
+
+            # 账户发送间隔
+            wait = CAMPAIGN_ACCOUNT_INTERVAL - (time.monotonic() - last_sent_at)
+            if wait > 0:
+                time.sleep(wait)
+
+            subject = render_template(template.subject, customer, account)
+            body = render_template(template.body, customer, account)
+            send_result = sender.send_email(
+                to_email=customer.email,
+                subject=subject,
+                body=body,
+                from_email=account.email_address,
+                from_name=account.account_name
+            )
+            last_sent_at = time.monotonic()
+
+            db.add(EmailHistory(
+                customer_id=customer.id,
+                direction='outbound',
+                subject=subject,
+                body=body,
+                from_email=account.email_address,
+                from_name=account.account_name,
+                to_email=customer.email,
+                to_name=customer.contact_name,
+                status='sent' if send_result['success'] else 'failed',
+                delivery_status='pending' if send_result['success'] else 'failed',
+                bounce_reason=None if send_result['success'] else send_result['message'],
+                campaign_id=campaign_id,
+                template_id=template.id,
+                sent_at=datetime.now()
+            ))
+
+            if send_result['success']:
+                result['sent'] += 1
+                db.query(EmailCampaign).filter(EmailCampaign.id == campaign_id).update(
+                    {EmailCampaign.total_sent: func.coalesce(EmailCampaign.total_sent, 0) + 1},
+                    synchronize_session=False
+                )
+                db.query(EmailAccount).filter(EmailAccount.id == account_id).update(
+                    {EmailAccount.total_sent: func.coalesce(EmailAccount.total_sent, 0) + 1},
+                    synchronize_session=False
+                )
+            else:
+                result['failed'] += 1
+                throttle.release_account(account_id)
+                # 连接可能已失效，重建会话后继续
+                if send_result['error'] == 'SMTP_ERROR':
+                    sender.close()
+                    try:
+                        sender.open()
+                    except Exception as e:
+                        logger.error(f"活动发送账户重连失败: {account.email_address} - {str(e)}")
+                        db.commit()
+                        result['retry_after'] = 300
+                        result['stopped'] = 'smtp_connect_failed'
+                        break
+
+            # 逐封提交：中断后重启不会重复发送
+            db.commit()
+    finally:
+        sender.close()
+
+    result['remaining'] = queue + deferred
+    if deferred and not result['retry_after']:
+        result['retry_after'] = 60
+    return result
+
+
+def finalize_campaign_if_done(db, campaign_id: int) -> bool:
+    """所有收件人都已处理时，将活动标记为已完成"""
+    campaign = db.query(EmailCampaign).filter(EmailCampaign.id == campaign_id).first()
+    if not campaign or campaign.status != 'Running':
+        return False
+    if pending_recipient_ids(db, campaign):
+        return False
+
+    campaign.status = 'Completed'
+    campaign.completed_at = datetime.now()
+    db.commit()
+    return True
+
+
+def campaign_progress(db, campaign: EmailCampaign) -> Dict:
+    """活动发送进度"""
+    rows = db.query(EmailHistory.status, func.count(EmailHistory.id)).filter(
+        EmailHistory.campaign_id == campaign.id
+    ).group_by(EmailHistory.status).all()
+    counts = {status: count for status, count in rows}
+    pending = len(pending_recipient_ids(db, campaign))
+    processed = sum(counts.values())
+
+    return {
+        'campaign_id': campaign.id,
+        'status': campaign.status,
+        'sent': counts.get('sent', 0),
+        'failed': counts.get('failed', 0),
+        'pending': pending,
+        'total': processed + pending,
+        'started_at': campaign.started_at,
+        'completed_at': campaign.completed_at,
+    }
@@ -8,6 +8,8 @@ import re
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
 
+from src.utils.tracing import traced, SPAN_KIND_CLIENT
+
 
 class EmailReceiver:
     """邮件接收器 - 使用IMAP协议"""
@@ -475,6 +477,66 @@ class EmailReceiver:
         
         return processed_html
     
+    def parse_message(self, raw_email: bytes, email_id: str) -> Dict:
+        """
+        解析一封原始邮件（RFC822）
+        
+        参数:
+            raw_email: 邮件原始字节
+            email_id: IMAP 邮件ID（用于附件目录）
+        
+        返回:
+            邮件数据字典
+        """
+        msg = email.message_from_bytes(raw_email)
+        
+        # 提取邮件信息
+        subject = self._decode_str(msg.get('Subject', ''))
+        
+        # 解析发件人（同时提取名称和邮箱）
+        from_str = self._decode_str(msg.get('From', ''))
+        from_name, from_addr = self._parse_email_name_and_address(from_str)
+        
+        # 解析收件人（同时提取名称和邮箱）
+        to_str = self._decode_str(msg.get('To', ''))
+        to_name, to_addr = self._parse_email_name_and_address(to_str)
+        
+        date_str = msg.get('Date', '')
+        
+        # 解析日期
+        email_date = None
+        try:
+            email_date = email.utils.parsedate_to_datetime(date_str)
+        except:
+            email_date = datetime.now()
+        
+        # 解析正文
+        text_body, html_body = self._parse_email_body(msg)
+        
+        # 🔥 解析附件和内嵌图片
+        attachments, inline_images = self._parse_attachments(msg, email_id)
+        
+        # 🔥 不在这里处理图片，等保存到数据库后使用正确的 DB ID 处理
+        # 将 inline_images 映射传递给调用方，供后续处理
+        
+        return {
+            'email_id': email_id,
+            'subject': subject,
+            'from_name': from_name,  # 新增：发件人名称
+            'from_email': from_addr,
+            'to_name': to_name,  # 新增：收件人名称
+            'to_email': to_addr,
+            'date': email_date,
+            'body': text_body,
+            'html_body': html_body,
+            'attachments': attachments,
+            'inline_images': inline_images,  # 🔥 新增：传递 CID 映射
+            'has_attachments': len(attachments) > 0,
+            'message_id': msg.get('Message-ID', ''),
+            'in_reply_to': msg.get('In-Reply-To', '')
+        }
+    
+    @traced("imap.fetch", SPAN_KIND_CLIENT)
     def fetch_new_emails(self, mailbox: str = "INBOX", limit: int = 100, 
                          only_unseen: bool = False, since_date: str = None) -> List[Dict]:
         """
@@ -538,55 +600,7 @@ class EmailReceiver:
                     if status != 'OK':
                         continue
                     
-                    # 解析邮件
-                    raw_email = msg_data[0][1]
-                    msg = email.message_from_bytes(raw_email)
-                    
-                    # 提取邮件信息
-                    subject = self._decode_str(msg.get('Subject', ''))
-                    
-                    # 解析发件人（同时提取名称和邮箱）
-                    from_str = self._decode_str(msg.get('From', ''))
-                    from_name, from_addr = self._parse_email_name_and_address(from_str)
-                    
-                    # 解析收件人（同时提取名称和邮箱）
-                    to_str = self._decode_str(msg.get('To', ''))
-                    to_name, to_addr = self._parse_email_name_and_address(to_str)
-                    
-                    date_str = msg.get('Date', '')
-                    
-                    # 解析日期
-                    email_date = None
-                    try:
-                        email_date = email.utils.parsedate_to_datetime(date_str)
-                    except:
-                        email_date = datetime.now()
-                    
-                    # 解析正文
-                    text_body, html_body = self._parse_email_body(msg)
-                    
-                    # 🔥 解析附件和内嵌图片
-                    attachments, inline_images = self._parse_attachments(msg, email_id.decode())
-                    
-                    # 🔥 不在这里处理图片，等保存到数据库后使用正确的 DB ID 处理
-                    # 将 inline_images 映射传递给调用方，供后续处理
-
-                    email_data = {
-                        'email_id': email_id.decode(),
-                        'subject': subject,
-                        'from_name': from_name,  # 新增：发件人名称
-                        'from_email': from_addr,
-                        'to_name': to_name,  # 新增：收件人名称
-                        'to_email': to_addr,
-                        'date': email_date,
-                        'body': text_body,
-                        'html_body': html_body,
-                        'attachments': attachments,
-                        'inline_images': inline_images,  # 🔥 新增：传递 CID 映射
-                        'has_attachments': len(attachments) > 0,
-                        'message_id': msg.get('Message-ID', ''),
-                        'in_reply_to': msg.get('In-Reply-To', '')
-                    }
+                    email_data = self.parse_message(msg_data[0][1], email_id.decode())
                     
                     emails.append(email_data)
                     
@@ -1,5 +1,4 @@
 import smtplib
-import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
@@ -9,6 +8,19 @@ from email.utils import formataddr
 from typing import Optional, List, Dict
 import os
 
+from src.email_system.smtp_pool import smtp_pool
+
+
+def smtp_config_from_account(account) -> Dict[str, any]:
+    """根据 EmailAccount 构建 SMTP 配置字典"""
+    return {
+        'host': account.smtp_host,
+        'port': account.smtp_port,
+        'username': account.smtp_username or account.email_address,
+        'password': account.smtp_password,
+        'use_ssl': account.smtp_port == 465
+    }
+
 
 class EmailSender:
     """邮件发送器 - 集成SMTP服务"""
@@ -22,6 +34,7 @@ class EmailSender:
         self.smtp_config = smtp_config or {}
         self.sent_count = 0
         self.daily_limit = 500  # 提高限制到500
+        self._lease = None  # 通过 open 持有的连接池会话
     
     def send_email(
         self, 
@@ -71,105 +84,23 @@ class EmailSender:
             }
         
         try:
-            # 创建邮件消息
-            message = MIMEMultipart('alternative')
-            message['Subject'] = Header(subject, 'utf-8')
-            
-            # 正确格式化 From 头部，符合 RFC5322 标准
-            sender_email = from_email or self.smtp_config['username']
-            if from_name:
-                # 使用 formataddr 和 Header 正确编码中文名称
-                message['From'] = formataddr((str(Header(from_name, 'utf-8')), sender_email))
-            else:
-                message['From'] = sender_email
-            
-            message['To'] = to_email
+            message = self._build_message(
+                to_email, subject, body, from_email, from_name, cc_email, bcc_email,
+                attachments, html_body, priority, need_receipt
+            )
             
+            # 构建所有收件人列表
+            all_recipients = [email.strip() for email in to_email.split(',')]
             if cc_email:
-                message['Cc'] = cc_email
+                all_recipients.extend([email.strip() for email in cc_email.split(',')])
             if bcc_email:
-                message['Bcc'] = bcc_email
-            
-            # 设置优先级
-            if priority == 'high':
-                message['X-Priority'] = '1'
-                message['X-MSMail-Priority'] = 'High'
-                message['Importance'] = 'High'
-            elif priority == 'low':
-                message['X-Priority'] = '5'
-                message['X-MSMail-Priority'] = 'Low'
-                message['Importance'] = 'Low'
-            
-            # 设置已读回执
-            if need_receipt:
-                message['Disposition-Notification-To'] = from_email or self.smtp_config['username']
-                message['Return-Receipt-To'] = from_email or self.smtp_config['username']
-            
-            # 添加正文
-            if html_body:
-                # 添加纯文本和HTML两个版本
-                part1 = MIMEText(body, 'plain', 'utf-8')
-                part2 = MIMEText(html_body, 'html', 'utf-8')
-                message.attach(part1)
-                message.attach(part2)
-            else:
-                # 只有纯文本
-                part = MIMEText(body, 'plain', 'utf-8')
-                message.attach(part)
-            
-            # 添加附件
-            if attachments:
-                for file_path in attachments:
-                    if os.path.exists(file_path):
-                        with open(file_path, 'rb') as file:
-                            part = MIMEBase('application', 'octet-stream')
-                            part.set_payload(file.read())
-                            encoders.encode_base64(part)
-                            part.add_header(
-                                'Content-Disposition',
-                                f'attachment; filename= {os.path.basename(file_path)}'
-                            )
-                            message.attach(part)
+                all_recipients.extend([email.strip() for email in bcc_email.split(',')])
             
-            # 连接SMTP服务器并发送
-            use_ssl = self.smtp_config.get('use_ssl', True)
-            
-            if use_ssl and self.smtp_config['port'] == 465:
-                # SSL连接
-                context = ssl.create_default_context()
-                with smtplib.SMTP_SSL(self.smtp_config['host'], self.smtp_config['port'], context=context) as server:
-                    server.login(self.smtp_config['username'], self.smtp_config['password'])
-                    
-                    # 构建所有收件人列表
-                    all_recipients = [email.strip() for email in to_email.split(',')]
-                    if cc_email:
-                        all_recipients.extend([email.strip() for email in cc_email.split(',')])
-                    if bcc_email:
-                        all_recipients.extend([email.strip() for email in bcc_email.split(',')])
-                    
-                    server.sendmail(
-                        from_email or self.smtp_config['username'],
-                        all_recipients,
-                        message.as_string()
-                    )
-            else:
-                # TLS连接
-                with smtplib.SMTP(self.smtp_config['host'], self.smtp_config['port']) as server:
-                    server.starttls()
-                    server.login(self.smtp_config['username'], self.smtp_config['password'])
-                    
-                    # 构建所有收件人列表
-                    all_recipients = [email.strip() for email in to_email.split(',')]
-                    if cc_email:
-                        all_recipients.extend([email.strip() for email in cc_email.split(',')])
-                    if bcc_email:
-                        all_recipients.extend([email.strip() for email in bcc_email.split(',')])
-                    
-                    server.sendmail(
-                        from_email or self.smtp_config['username'],
-                        all_recipients,
-                        message.as_string()
-                    )
+            self._deliver(
+                from_email or self.smtp_config['username'],
+                all_recipients,
+                message.as_string()
+            )
             
             self.sent_count += 1
             print(f"✅ 邮件发送成功: {to_email}")
@@ -205,27 +136,169 @@ class EmailSender:
                 'error': 'UNKNOWN_ERROR'
             }
     
-    def send_bulk(self, email_list):
+    def _build_message(
+        self,
+        to_email, subject, body, from_email, from_name, cc_email, bcc_email,
+        attachments, html_body, priority, need_receipt
+    ) -> MIMEMultipart:
+        """构建MIME邮件消息"""
+        message = MIMEMultipart('alternative')
+        message['Subject'] = Header(subject, 'utf-8')
+        
+        # 正确格式化 From 头部，符合 RFC5322 标准
+        sender_email = from_email or self.smtp_config['username']
+        if from_name:
+            # 使用 formataddr 和 Header 正确编码中文名称
+            message['From'] = formataddr((str(Header(from_name, 'utf-8')), sender_email))
+        else:
+            message['From'] = sender_email
+        
+        message['To'] = to_email
+        
+        if cc_email:
+            message['Cc'] = cc_email
+        if bcc_email:
+            message['Bcc'] = bcc_email
+        
+        # 设置优先级
+        if priority == 'high':
+            message['X-Priority'] = '1'
+            message['X-MSMail-Priority'] = 'High'
+            message['Importance'] = 'High'
+        elif priority == 'low':
+            message['X-Priority'] = '5'
+            message['X-MSMail-Priority'] = 'Low'
+            message['Importance'] = 'Low'
+        
+        # 设置已读回执
+        if need_receipt:
+            message['Disposition-Notification-To'] = from_email or self.smtp_config['username']
+            message['Return-Receipt-To'] = from_email or self.smtp_config['username']
+        
+        # 添加正文
+        if html_body:
+            # 添加纯文本和HTML两个版本
+            part1 = MIMEText(body, 'plain', 'utf-8')
+            part2 = MIMEText(html_body, 'html', 'utf-8')
+            message.attach(part1)
+            message.attach(part2)
+        else:
+            # 只有纯文本
+            part = MIMEText(body, 'plain', 'utf-8')
+            message.attach(part)
+        
+        # 添加附件
+        if attachments:
+            for file_path in attachments:
+                if os.path.exists(file_path):
+                    with open(file_path, 'rb') as file:
+                        part = MIMEBase('application', 'octet-stream')
+                        part.set_payload(file.read())
+                        encoders.encode_base64(part)
+                        part.add_header(
+                            'Content-Disposition',
+                            f'attachment; filename= {os.path.basename(file_path)}'
+                        )
+                        message.attach(part)
+        
+        return message
+    
+    def _deliver(self, from_addr: str, recipients: List[str], message: str):
+        """
+        通过连接池中的会话发送
+        池中的会话可能已被服务器断开，遇到断开时换一个新会话重试一次
+        """
+        held = self._lease is not None
+        
+        for attempt in range(2):
+            conn = self._lease if held else smtp_pool.acquire(self.smtp_config)
+            try:
+                conn.server.sendmail(from_addr, recipients, message)
+            except smtplib.SMTPServerDisconnected:
+                smtp_pool.release(conn, broken=True)
+                self._lease = None
+                if attempt == 1:
+                    raise
+                if held:
+                    self._lease = smtp_pool.acquire(self.smtp_config)
+                continue
+            except smtplib.SMTPException:
+                # 协议层错误（如收件人被拒）后会话仍可用
+                if not held:
+                    smtp_pool.release(conn)
+                raise
+            except Exception:
+                if held:
+                    self._lease = None
+                smtp_pool.release(conn, broken=True)
+                raise
+            
+            conn.messages_sent += 1
+            if not held:
+                smtp_pool.release(conn)
+            elif conn.exhausted:
+                # 长时间持有的会话达到发送上限后换新
+                smtp_pool.release(conn)
+                self._lease = smtp_pool.acquire(self.smtp_config)
+            return
+    
+    def open(self):
+        """
+        从连接池租用一个SMTP会话并在 close 前一直持有
+        适合连续发送多封邮件（如营销活动）；不调用 open 时每封邮件自动借还会话
+        """
+        if self._lease is None:
+            self._lease = smtp_pool.acquire(self.smtp_config)
+        return self
+    
+    def close(self):
+        """归还持有的SMTP会话到连接池"""
+        if self._lease is not None:
+            smtp_pool.release(self._lease)
+            self._lease = None
+    
+    def __enter__(self):
+        return self.open()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def send_bulk(self, email_list, min_interval: float = 30, max_interval: float = 60):
         """
-        批量发送邮件
+        批量发送邮件（复用同一个SMTP会话）
         参数:
             email_list: 邮件列表 [{to, subject, body, attachments}]
+            min_interval/max_interval: 两封邮件之间的随机间隔（秒）
         返回:
             成功数量
+        
+        大批量营销邮件请使用 src.email_system.campaign_sender（多账户并发 + 限速 + 可恢复）
         """
+        import time
+        import random
+        
         success_count = 0
-        for email_data in email_list:
-            if self.send_email(
-                email_data.get('to'),
-                email_data.get('subject'),
-                email_data.get('body'),
-                email_data.get('attachments')
-            ):
-                success_count += 1
+        try:
+            self.open()
+        except Exception as e:
+            print(f"❌ SMTP连接失败: {str(e)}")
+            return 0
+        
+        try:
+            for index, email_data in enumerate(email_list):
+                result = self.send_email(
+                    to_email=email_data.get('to'),
+                    subject=email_data.get('subject'),
+                    body=email_data.get('body'),
+                    attachments=email_data.get('attachments')
+                )
+                if result['success']:
+                    success_count += 1
                 # 间隔发送
-                import time
-                import random
-                time.sleep(random.randint(30, 60))
+                if index < len(email_list) - 1 and max_interval > 0:
+                    time.sleep(random.uniform(min_interval, max_interval))
+        finally:
+            self.close()
         
         return success_count
     
@@ -0,0 +1,197 @@
+"""
+SMTP连接池
+进程级复用已登录的SMTP会话，避免每封邮件都重新进行 DNS/TCP/TLS/登录握手。
+
+策略：
+- 按账户（host, port, username, 密码指纹）分组保存空闲会话
+- 空闲超过 SMTP_POOL_IDLE_TIMEOUT 秒的会话直接关闭
+- 空闲超过 SMTP_POOL_NOOP_AFTER 秒的会话在复用前先发送 NOOP 做健康检查
+- 单个会话发送 SMTP_POOL_MAX_MESSAGES 封后关闭重建（很多服务商限制单连接发送数量）
+"""
+import os
+import ssl
+import time
+import hashlib
+import logging
+import smtplib
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Deque, Tuple
+
+logger = logging.getLogger(__name__)
+
+SMTP_POOL_MAX_MESSAGES = int(os.getenv('SMTP_POOL_MAX_MESSAGES', 100))
+SMTP_POOL_IDLE_TIMEOUT = float(os.getenv('SMTP_POOL_IDLE_TIMEOUT', 60))
+SMTP_POOL_NOOP_AFTER = float(os.getenv('SMTP_POOL_NOOP_AFTER', 10))
+SMTP_POOL_MAX_IDLE = int(os.getenv('SMTP_POOL_MAX_IDLE', 2))  # 每个账户最多保留的空闲会话
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 30))
+
+
+class PooledSMTPConnection:
+    """连接池中的一个已登录SMTP会话"""
+
+    def __init__(self, key: Tuple, server: smtplib.SMTP):
+        self.key = key
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.messages_sent = 0
+
+    @property
+    def exhausted(self) -> bool:
+        return self.messages_sent >= SMTP_POOL_MAX_MESSAGES
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """进程级SMTP会话池（线程安全）"""
+
+    def __init__(self):
+        self._idle: Dict[Tuple, Deque[PooledSMTPConnection]] = {}
+        self._lock = threading.Lock()
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    @staticmethod
+    def make_key(smtp_config: dict) -> Tuple:
+        """连接分组键（密码只保留指纹，修改密码后自动使用新连接）"""
+        password_hash = hashlib.sha256((smtp_config.get('password') or '').encode()).hexdigest()[:16]
+        return (
+            smtp_config['host'],
+            int(smtp_config['port']),
+            smtp_config['username'],
+            bool(smtp_config.get('use_ssl', True)),
+            password_hash,
+        )
+
+    def _connect(self, smtp_config: dict) -> smtplib.SMTP:
+        """建立并登录新的SMTP连接"""
+        use_ssl = smtp_config.get('use_ssl', True)
+
+        if use_ssl and int(smtp_config['port']) == 465:
+            # SSL连接
+            context = ssl.create_default_context()
+            server = smtplib.SMTP_SSL(smtp_config['host'], smtp_config['port'], context=context, timeout=SMTP_TIMEOUT)
+        else:
+            # TLS连接
+            server = smtplib.SMTP(smtp_config['host'], smtp_config['port'], timeout=SMTP_TIMEOUT)
+            server.starttls()
+
+        try:
+            server.login(smtp_config['username'], smtp_config['password'])
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    @staticmethod
+    def _is_alive(conn: PooledSMTPConnection) -> bool:
+        """NOOP 健康检查"""
+        try:
+            return conn.server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self, smtp_config: dict) -> PooledSMTPConnection:
+        """获取一个可用会话（优先复用空闲会话）"""
+        key = self.make_key(smtp_config)
+
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+
+            if conn is None:
+                break
+
+            idle_for = time.monotonic() - conn.last_used_at
+            if idle_for > SMTP_POOL_IDLE_TIMEOUT or conn.exhausted:
+                self._discard(conn)
+                continue
+            if idle_for > SMTP_POOL_NOOP_AFTER and not self._is_alive(conn):
+                self._discard(conn)
+                continue
+
+            self.stats['reused'] += 1
+            return conn
+
+        conn = PooledSMTPConnection(key, self._connect(smtp_config))
+        self.stats['created'] += 1
+        logger.debug(f"新建SMTP会话 [{key[0]}:{key[1]} {key[2]}]")
+        return conn
+
+    def release(self, conn: PooledSMTPConnection, broken: bool = False):
+        """归还会话；已损坏或达到发送上限的会话直接关闭"""
+        if broken or conn.exhausted:
+            self._discard(conn)
+            return
+
+        conn.last_used_at = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(conn.key, deque())
+            if len(idle) < SMTP_POOL_MAX_IDLE:
+                idle.append(conn)
+                return
+        self._discard(conn)
+
+    def _discard(self, conn: PooledSMTPConnection):
+        self.stats['discarded'] += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self, smtp_config: dict):
+        """
+        以上下文方式使用一个会话
+
+        Example:
+            with smtp_pool.connection(config) as conn:
+                conn.server.sendmail(...)
+                conn.messages_sent += 1
+        """
+        conn = self.acquire(smtp_config)
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, broken=True)
+            raise
+        else:
+            self.release(conn)
+
+    def prune(self):
+        """关闭所有超时的空闲会话"""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                alive = deque(c for c in idle if now - c.last_used_at <= SMTP_POOL_IDLE_TIMEOUT)
+                expired.extend(c for c in idle if now - c.last_used_at > SMTP_POOL_IDLE_TIMEOUT)
+                self._idle[key] = alive
+        for conn in expired:
+            self._discard(conn)
+
+    def snapshot(self) -> dict:
+        """连接池状态（用于健康检查）"""
+        with self._lock:
+            idle = sum(len(q) for q in self._idle.values())
+            accounts = len([q for q in self._idle.values() if q])
+        return {"idle_sessions": idle, "accounts": accounts, **self.stats}
+
+    def close_all(self):
+        """关闭所有空闲会话（进程退出时调用）"""
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+
+# 全局连接池实例
+smtp_pool = SMTPConnectionPool()
@@ -4,9 +4,10 @@ Google搜索客户挖掘 - 使用Google Custom Search API
 
 import os
 import re
+import asyncio
 import httpx
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, AsyncIterator
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -139,3 +140,85 @@ class GoogleScraper:
         
         logger.info(f"🎯 搜索完成，共获得 {len(all_results)} 条唯一结果")
         return all_results[:limit]
+    
+    async def _search_page_async(self, client: httpx.AsyncClient, keyword: str, page: int) -> List[Dict]:
+        """异步请求单页搜索结果"""
+        start_index = page * 10 + 1  # Google的start从1开始
+        params = {
+            'key': self.api_key,
+            'cx': self.search_engine_id,
+            'q': keyword,
+            'num': 10,  # 每页10条
+            'start': start_index
+        }
+        
+        try:
+            response = await client.get(self.base_url, params=params)
+        except Exception as e:
+            logger.error(f"❌ 搜索失败 '{keyword}' 第{page+1}页: {str(e)}")
+            return []
+        
+        if response.status_code != 200:
+            logger.error(f"❌ '{keyword}' 第{page+1}页请求失败: {response.status_code}")
+            return []
+        
+        items = response.json().get('items', [])
+        logger.info(f"✅ '{keyword}' 第{page+1}页找到 {len(items)} 条结果")
+        return [
+            {
+                'title': item.get('title', ''),
+                'url': item.get('link', ''),
+                'snippet': item.get('snippet', ''),
+                'keyword': keyword
+            }
+            for item in items
+        ]
+    
+    async def iter_prospects_async(
+        self,
+        client: httpx.AsyncClient,
+        keywords: List[str],
+        limit: int = 50,
+        results_per_keyword: int = 10,
+        concurrency: int = 4
+    ) -> AsyncIterator[Dict]:
+        """
+        并发搜索所有关键词的所有分页，按完成顺序逐条产出去重后的结果
+        
+        参数:
+            client: 共享的异步HTTP客户端
+            keywords: 关键词列表
+            limit: 总结果数量限制
+            results_per_keyword: 每个关键词的结果数量
+            concurrency: 同时进行的搜索请求数
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        pages_needed = (results_per_keyword + 9) // 10  # 向上取整
+        
+        async def search(keyword: str, page: int) -> List[Dict]:
+            async with semaphore:
+                return await self._search_page_async(client, keyword, page)
+        
+        tasks = [
+            asyncio.ensure_future(search(keyword, page))
+            for keyword in keywords
+            for page in range(pages_needed)
+        ]
+        logger.info(f"🔍 并发搜索 {len(keywords)} 个关键词, 共 {len(tasks)} 个请求")
+        
+        seen_urls = set()
+        produced = 0
+        try:
+            for future in asyncio.as_completed(tasks):
+                for result in await future:
+                    url = result.get('url', '')
+                    if not url or url in seen_urls:
+                        continue
+                    seen_urls.add(url)
+                    produced += 1
+                    yield result
+                    if produced >= limit:
+                        return
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,298 @@
+"""
+异步流量获取流水线
+搜索 → 关键词过滤 → 查重 →（可选）网站抓取+AI评分 → 保存线索
+
+- 所有关键词、所有分页的搜索请求并发执行（search_concurrency 控制并发数）
+- 搜索结果一边产出一边进入处理队列，由 concurrency 个 worker 并发处理
+- 所有HTTP请求共享同一个带连接池的 AsyncClient
+- 每处理完一条就写入状态字典，状态接口可以实时看到进度和结果
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Dict, Optional
+
+import httpx
+
+from src.prospecting.google_scraper import GoogleScraper
+from src.prospecting.website_analyzer import WebsiteAnalyzer
+from src.utils.keyword_matcher import get_rule_set
+
+logger = logging.getLogger(__name__)
+
+PROSPECTING_CONCURRENCY = int(os.getenv('PROSPECTING_CONCURRENCY', 10))
+PROSPECTING_SEARCH_CONCURRENCY = int(os.getenv('PROSPECTING_SEARCH_CONCURRENCY', 4))
+
+# Google Custom Search API 单个关键词最多返回100条
+MAX_RESULTS_PER_KEYWORD = 100
+
+
+def build_http_client(proxy_url: Optional[str] = None, concurrency: int = PROSPECTING_CONCURRENCY) -> httpx.AsyncClient:
+    """创建流水线共享的HTTP客户端（连接池大小与并发数匹配）"""
+    limits = httpx.Limits(
+        max_connections=concurrency * 2,
+        max_keepalive_connections=concurrency
+    )
+    kwargs = {
+        "limits": limits,
+        "timeout": httpx.Timeout(30.0, connect=10.0),
+        "follow_redirects": True,
+        "headers": {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"},
+    }
+    if proxy_url:
+        # httpx 0.28.x 版本使用mounts参数
+        kwargs["mounts"] = {
+            "http://": httpx.AsyncHTTPTransport(proxy=proxy_url, limits=limits),
+            "https://": httpx.AsyncHTTPTransport(proxy=proxy_url, limits=limits),
+        }
+    return httpx.AsyncClient(**kwargs)
+
+
+def is_relevant(result: Dict) -> bool:
+    """关键词过滤：标题/摘要/URL 中必须包含内裤相关关键词（config/keyword_rules.json 的 prospecting 规则集）"""
+    combined_text = f"{result.get('title', '')} {result.get('snippet', '')} {result.get('url', '')}"
+    return get_rule_set('prospecting').evaluate(combined_text)['relevant']
+
+
+def _lead_exists(url: str) -> bool:
+    """检查线索是否已存在（在线程中执行）"""
+    from src.crm.database import get_session, Lead
+
+    db = get_session()
+    try:
+        return db.query(Lead.id).filter(Lead.website == url).first() is not None
+    finally:
+        db.close()
+
+
+def _save_lead(result: Dict, analysis: Optional[Dict] = None) -> bool:
+    """
+    保存一条线索（在线程中执行，每条独立会话，失败不影响其他结果）
+
+    Returns:
+        True 表示新建成功，False 表示重复
+    """
+    from src.crm.database import get_session, Lead
+
+    title = result.get('title', '')
+    snippet = result.get('snippet', '')
+
+    if analysis and analysis.get('success'):
+        emails = analysis.get('emails') or []
+        phones = analysis.get('phones') or []
+        reasons = '\n'.join(f"- {r}" for r in analysis.get('match_reasons', []))
+        lead_kwargs = {
+            "company_name": (analysis.get('brand_name') or title or 'Unknown')[:200],
+            "email": emails[0] if emails else None,
+            "phone": phones[0] if phones else None,
+            "lead_source": 'Google搜索+AI分析',
+            "lead_score": analysis.get('quality_score', 0),
+            "priority": 'high' if analysis.get('quality_score', 0) >= 70 else 'medium',
+            "notes": (
+                f"🔍 搜索结果:\n{snippet}\n\n"
+                f"🤖 AI评估: {analysis.get('recommendation', '')} "
+                f"(DTC: {'是' if analysis.get('is_dtc') else '否'}, 内裤占比: {analysis.get('underwear_ratio', 0)}%)\n"
+                f"{reasons}"
+            ),
+        }
+    else:
+        lead_kwargs = {
+            "company_name": title[:200] if title else 'Unknown',
+            "email": None,
+            "phone": None,
+            "lead_source": 'Google搜索+关键词过滤',
+            "lead_score": 50,  # 基础分
+            "priority": 'medium',
+            "notes": f"🔍 搜索结果:\n{snippet}\n\n⚠️ 需要人工验证",
+        }
+
+    db = get_session()
+    try:
+        lead = Lead(
+            website=result['url'],
+            country=None,
+            industry='内衣/内裤',
+            lead_status='new',
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow(),
+            **lead_kwargs
+        )
+        db.add(lead)
+        db.commit()
+        return True
+    except Exception as db_error:
+        db.rollback()
+        if 'duplicate key' in str(db_error).lower() or 'unique' in str(db_error).lower():
+            logger.warning(f"跳过重复（ID冲突）: {title[:30]}")
+            return False
+        raise
+    finally:
+        db.close()
+
+
+class ProspectingPipeline:
+    """异步流量获取流水线"""
+
+    def __init__(
+        self,
+        keywords: List[str],
+        limit: int = 50,
+        proxy_url: Optional[str] = None,
+        ai_analysis: bool = False,
+        concurrency: int = PROSPECTING_CONCURRENCY,
+        search_concurrency: int = PROSPECTING_SEARCH_CONCURRENCY,
+        min_quality_score: int = 30,
+        status: Optional[Dict] = None
+    ):
+        """
+        Args:
+            keywords: 搜索关键词
+            limit: 搜索结果总数上限
+            proxy_url: 代理地址（如 socks5://127.0.0.1:10808）
+            ai_analysis: 是否抓取网站并用AI评分（关闭时只做关键词过滤）
+            concurrency: 网站处理并发数
+            search_concurrency: 搜索请求并发数
+            min_quality_score: AI评分低于该值的网站被拒绝
+            status: 状态字典，处理过程中实时更新（供状态接口读取）
+        """
+        self.keywords = [k for k in keywords if k and k.strip()]
+        self.limit = limit
+        self.proxy_url = proxy_url
+        self.ai_analysis = ai_analysis
+        self.concurrency = max(1, concurrency)
+        self.search_concurrency = max(1, search_concurrency)
+        self.min_quality_score = min_quality_score
+        self.status = status if status is not None else {}
+
+        self.scraper = GoogleScraper()
+        self.analyzer = WebsiteAnalyzer() if ai_analysis else None
+
+    def _reset_status(self):
+        self.status.update({
+            "running": True,
+            "progress": 0,
+            "total": self.limit,
+            "total_found": 0,
+            "results": [],
+            "error": None,
+            "phase": "搜索中",
+            "leads_created": 0,
+            "leads_skipped": 0,
+            "leads_rejected": 0,
+        })
+
+    def _record(self, result: Dict, outcome: str, counter: str, **extra):
+        """记录一条处理结果（立即对状态接口可见）"""
+        self.status[counter] += 1
+        self.status["progress"] += 1
+        self.status["results"].append({**result, "outcome": outcome, **extra})
+
+    async def _process(self, client: httpx.AsyncClient, result: Dict):
+        """处理单条搜索结果"""
+        url = result.get('url', '')
+        title = result.get('title', '')
+
+        if not is_relevant(result):
+            logger.info(f"❌ 拒绝（无关）: {title[:50]}")
+            self._record(result, 'rejected', 'leads_rejected')
+            return
+
+        if await asyncio.to_thread(_lead_exists, url):
+            logger.info(f"⏭️ 跳过重复: {url}")
+            self._record(result, 'skipped', 'leads_skipped')
+            return
+
+        analysis = None
+        if self.analyzer:
+            analysis = await self.analyzer.analyze_website(url, client=client)
+            score = analysis.get('quality_score', 0)
+            if not analysis.get('success') or score < self.min_quality_score:
+                logger.info(f"❌ 拒绝（评分 {score}）: {title[:50]}")
+                self._record(result, 'rejected', 'leads_rejected', quality_score=score)
+                return
+
+        created = await asyncio.to_thread(_save_lead, result, analysis)
+        if created:
+            logger.info(f"💾 保存线索: {title[:30]}")
+            self._record(
+                result, 'created', 'leads_created',
+                quality_score=analysis.get('quality_score') if analysis else None
+            )
+        else:
+            self._record(result, 'skipped', 'leads_skipped')
+
+    async def _worker(self, client: httpx.AsyncClient, queue: asyncio.Queue):
+        while True:
+            result = await queue.get()
+            try:
+                if result is None:
+                    return
+                await self._process(client, result)
+            except Exception as e:
+                logger.error(f"处理失败 {result.get('url', '')}: {str(e)}")
+                self._record(result, 'failed', 'leads_skipped', error=str(e))
+            finally:
+                queue.task_done()
+
+    async def run(self) -> Dict:
+        """执行流水线，返回汇总结果"""
+        self._reset_status()
+        if not self.keywords:
+            self.status.update({"running": False, "phase": "完成"})
+            return self.summary()
+
+        results_per_keyword = min(
+            MAX_RESULTS_PER_KEYWORD,
+            max(10, -(-self.limit // len(self.keywords)))
+        )
+        logger.info(
+            f"🔍 开始搜索，关键词: {self.keywords}, 目标: {self.limit}条, "
+            f"每个关键词 {results_per_keyword} 条, 并发 {self.concurrency}"
+        )
+
+        # 队列有界：处理跟不上时搜索自动放缓
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async with build_http_client(self.proxy_url, self.concurrency) as client:
+            workers = [
+                asyncio.create_task(self._worker(client, queue))
+                for _ in range(self.concurrency)
+            ]
+            try:
+                async for result in self.scraper.iter_prospects_async(
+                    client,
+                    self.keywords,
+                    limit=self.limit,
+                    results_per_keyword=results_per_keyword,
+                    concurrency=self.search_concurrency
+                ):
+                    self.status["total_found"] += 1
+                    await queue.put(result)
+
+                self.status["phase"] = "分析中" if self.ai_analysis else "关键词过滤中"
+                self.status["total"] = self.status["total_found"]
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+
+        logger.info(
+            f"🎉 任务完成: 创建 {self.status['leads_created']} 条, "
+            f"跳过 {self.status['leads_skipped']} 条, 拒绝 {self.status['leads_rejected']} 条"
+        )
+        self.status.update({"running": False, "phase": "完成"})
+        return self.summary()
+
+    def summary(self) -> Dict:
+        total_found = self.status.get("total_found", 0)
+        leads_created = self.status.get("leads_created", 0)
+        return {
+            "total_found": total_found,
+            "leads_created": leads_created,
+            "leads_skipped": self.status.get("leads_skipped", 0),
+            "leads_rejected": self.status.get("leads_rejected", 0),
+            "conversion_rate": f"{(leads_created / total_found * 100):.1f}%" if total_found else "0%"
+        }
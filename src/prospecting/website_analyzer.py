@@ -4,11 +4,12 @@ AI驱动的网站分析器 - 精准识别DTC品牌和产品占比
 
 import os
 import json
+import asyncio
 import re
 import httpx
 from typing import Dict, Optional, List
 from bs4 import BeautifulSoup
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 
 class WebsiteAnalyzer:
@@ -20,15 +21,26 @@ class WebsiteAnalyzer:
             api_key=self.api_key,
             base_url=os.getenv('AIHUBMIX_BASE_URL', 'https://aihubmix.com/v1')
         )
+        # 异步客户端：AI评分在事件循环中并发执行，不阻塞其他站点的抓取
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=os.getenv('AIHUBMIX_BASE_URL', 'https://aihubmix.com/v1')
+        )
         self.timeout = 30.0
     
-    async def analyze_website(self, url: str, proxy: Optional[str] = None) -> Dict:
+    async def analyze_website(
+        self,
+        url: str,
+        proxy: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Dict:
         """
         完整分析网站
         
         Args:
             url: 网站URL
             proxy: SOCKS5代理地址
+            client: 共享的HTTP客户端（批量分析时复用连接池，传入后忽略proxy）
             
         Returns:
             {
@@ -43,13 +55,13 @@ class WebsiteAnalyzer:
         """
         try:
             # 第1步：获取网页内容
-            html_content = await self._fetch_website(url, proxy)
+            html_content = await self._fetch_website(url, proxy, client)
             
             if not html_content:
                 return self._get_failed_result("无法访问网站")
             
             # 第2步：提取页面信息
-            page_info = self._extract_page_info(html_content, url)
+            page_info = await asyncio.to_thread(self._extract_page_info, html_content, url)
             
             # 第3步：AI深度分析
             ai_analysis = await self._ai_analyze_website(page_info, url)
@@ -63,11 +75,20 @@ class WebsiteAnalyzer:
             print(f"❌ 网站分析失败 {url}: {str(e)}")
             return self._get_failed_result(str(e))
     
-    async def _fetch_website(self, url: str, proxy: Optional[str] = None) -> Optional[str]:
+    async def _fetch_website(
+        self,
+        url: str,
+        proxy: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Optional[str]:
         """获取网页内容"""
         try:
+            if client is not None:
+                response = await client.get(url, headers={
+                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+                })
             # 配置代理
-            if proxy:
+            elif proxy:
                 # httpx 0.28.x 版本使用mounts参数
                 mounts = {
                     "http://": httpx.AsyncHTTPTransport(proxy=f"socks5://{proxy}"),
@@ -209,7 +230,7 @@ URL: {url}
 """
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.async_client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,
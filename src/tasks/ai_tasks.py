@@ -6,8 +6,10 @@ AI相关异步任务
 from src.celery_config import celery_app
 from src.crm.database import get_session, EmailHistory, AutoReplyRule, ApprovalTask
 from src.ai.email_analyzer import get_analyzer
+from src.ai.near_duplicate import near_duplicate_index, reuse_analysis
+from src.utils.tracing import set_attributes, traced
+from src.utils.cache import run_async
 import traceback
-import asyncio
 import json
 from datetime import datetime, timedelta
 
@@ -29,24 +31,36 @@ def analyze_email_task(self, email_id: int):
             return {"error": "邮件不存在", "email_id": email_id}
         
         print(f"🤖 开始AI分析邮件: {email.subject}")
-        
-        # 获取 AI 分析器
-        analyzer = get_analyzer()
-        
-        # 异步调用 AI 分析（在同步函数中运行异步代码）
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            result = loop.run_until_complete(
+        set_attributes(**{"email.id": email_id})
+        
+        # 近似重复检测：最近分析过几乎相同的邮件时直接复用结果，不调用大模型
+        signature = near_duplicate_index.signature(email.subject or "", email.body or "")
+        duplicate = near_duplicate_index.find(signature, exclude_id=email.id)
+        if signature is not None:
+            # 内容太短不参与去重，不计入命中率
+            near_duplicate_index.record(duplicate is not None)
+        
+        if duplicate:
+            source_id, score, source_result = duplicate
+            result = reuse_analysis(source_result, source_id, score)
+            set_attributes(**{"email.duplicate_of": source_id, "email.similarity": score})
+            print(f"♻️ 近似重复邮件（相似度 {score:.2f}），复用邮件 {source_id} 的分析结果")
+        else:
+            # 获取 AI 分析器
+            analyzer = get_analyzer()
+            
+            # 异步调用 AI 分析（在同步函数中运行异步代码）
+            result = run_async(
                 analyzer.analyze_email(
                     subject=email.subject or "",
                     body=email.body or "",
                     from_email=email.from_email
                 )
             )
-        finally:
-            loop.close()
+            
+            # 降级（规则引擎）结果不进入索引，避免被后续邮件复用
+            if result['success'] and not result.get('fallback'):
+                near_duplicate_index.add(email.id, signature, result)
         
         if result['success']:
             analysis = result['analysis']
@@ -184,27 +198,21 @@ def generate_reply_task(self, email_id: int, tone: str = "professional"):
         # 获取 AI 分析器
         analyzer = get_analyzer()
         
+        # 准备上下文信息
+        context = {}
+        if email.customer:
+            context['customer_name'] = email.customer.contact_name
+            context['company_name'] = email.customer.company_name
+        
         # 异步调用 AI 生成回复
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # 准备上下文信息
-            context = {}
-            if email.customer:
-                context['customer_name'] = email.customer.contact_name
-                context['company_name'] = email.customer.company_name
-            
-            result = loop.run_until_complete(
-                analyzer.generate_reply(
-                    subject=email.subject or "",
-                    body=email.body or "",
-                    context=context,
-                    tone=tone
-                )
+        result = run_async(
+            analyzer.generate_reply(
+                subject=email.subject or "",
+                body=email.body or "",
+                context=context,
+                tone=tone
             )
-        finally:
-            loop.close()
+        )
         
         if result['success']:
             print(f"✅ AI回复生成完成: {email.subject}")
@@ -233,6 +241,7 @@ def generate_reply_task(self, email_id: int, tone: str = "professional"):
         db.close()
 
 
+@traced("auto_reply.match")
 def trigger_auto_reply_if_matched(email_id: int, email_category: str, db):
     """
     检查是否匹配自动回复规则，如果匹配则触发自动回复
@@ -291,6 +300,7 @@ def generate_auto_reply_task(self, email_id: int, rule_id: int):
             return {"error": "邮件或规则不存在"}
         
         print(f"\n🤖 开始生成自动回复: {email.subject}")
+        set_attributes(**{"email.id": email_id, "auto_reply.rule_id": rule_id})
         print(f"   触发规则: {rule.rule_name}")
         print(f"   邮件类型: {email.ai_category}")
         
@@ -330,21 +340,15 @@ def generate_auto_reply_task(self, email_id: int, rule_id: int):
             print(f"⚠️ 未找到默认模板，使用硬编码默认提示词")
         
         # 调用AI生成回复
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            result = loop.run_until_complete(
-                analyzer.generate_reply(
-                    subject=email.subject or "",
-                    body=email.body or "",
-                    context=context,
-                    tone="professional",
-                    custom_prompt=custom_prompt  # 🔥 传入自定义提示词
-                )
+        result = run_async(
+            analyzer.generate_reply(
+                subject=email.subject or "",
+                body=email.body or "",
+                context=context,
+                tone="professional",
+                custom_prompt=custom_prompt  # 🔥 传入自定义提示词
             )
-        finally:
-            loop.close()
+        )
         
         if not result.get('success'):
             print(f"❌ AI生成回复失败: {result.get('error')}")
@@ -384,6 +388,11 @@ def generate_auto_reply_task(self, email_id: int, rule_id: int):
         db.commit()
         
         print(f"✅ 审核任务已创建: ID={approval_task.id}")
+        # 端到端耗时：邮件发出（Date 头）到回复草稿生成
+        set_attributes(**{"approval_task.id": approval_task.id})
+        if email.sent_at:
+            now = datetime.now(email.sent_at.tzinfo) if email.sent_at.tzinfo else datetime.utcnow()
+            set_attributes(**{"email.inbound_to_draft_ms": int((now - email.sent_at).total_seconds() * 1000)})
         print(f"   审核方式: {approval_task.approval_method}")
         print(f"   超时时间: {approval_task.timeout_at}")
         
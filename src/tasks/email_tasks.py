@@ -4,9 +4,10 @@
 """
 
 from src.celery_config import celery_app
-from src.crm.database import get_session, EmailHistory, EmailAccount
+from src.crm.database import get_session, EmailHistory, EmailAccount, EmailCampaign
 from src.email_system.receiver import EmailReceiver
 from src.email_system.bounce_listener import BounceListener  # 🔥 新增
+from src.utils.tracing import set_attributes
 from datetime import datetime
 import traceback
 
@@ -14,6 +15,64 @@ import traceback
 from src.tasks.ai_tasks import analyze_email_task
 
 
+def store_inbound_email(db, receiver: EmailReceiver, email_data: dict):
+    """
+    保存一封收到的邮件（按 Message-ID 去重，处理正文内嵌图片）
+    
+    参数:
+        db: 数据库会话（只 flush，由调用方提交）
+        receiver: 邮件接收器（用于处理正文图片）
+        email_data: EmailReceiver.parse_message 的结果
+    
+    返回:
+        新建的 EmailHistory；重复邮件返回 None
+    """
+    # 去重检查
+    message_id = email_data.get('message_id', '').strip()
+    if message_id:
+        existing = db.query(EmailHistory).filter(
+            EmailHistory.message_id == message_id
+        ).first()
+        if existing:
+            return None
+
+    # 创建邮件记录
+    email_history = EmailHistory(
+        customer_id=None,
+        direction='inbound',
+        subject=email_data['subject'],
+        body=email_data['body'],
+        html_body=email_data.get('html_body'),
+        sent_at=email_data['date'],
+        from_name=email_data.get('from_name'),  # 🔥 新增：发件人名称
+        from_email=email_data['from_email'],
+        to_name=email_data.get('to_name'),  # 🔥 新增：收件人名称
+        to_email=email_data['to_email'],
+        message_id=message_id if message_id else None,
+        attachments=str(email_data['attachments']) if email_data['attachments'] else None
+    )
+
+    db.add(email_history)
+    db.flush()  # 确保获取到数据库生成的自增 ID (email_history.id)
+
+    # 🔥 新增：使用正确的数据库 ID 处理正文图片
+    if email_history.html_body and email_data.get('inline_images'):
+        print(f"🖼️ 处理正文图片: 使用数据库ID={email_history.id}")
+        try:
+            # 调用 receiver 的图片处理方法，使用正确的数据库 ID
+            processed_html = receiver._process_html_images(
+                email_history.html_body, 
+                str(email_history.id),  # 使用数据库 ID，而不是 IMAP ID
+                email_data.get('inline_images', {})
+            )
+            email_history.html_body = processed_html
+            print(f"✅ 图片路径处理完成: 邮件ID={email_history.id}")
+        except Exception as img_err:
+            print(f"⚠️ 图片处理失败: {str(img_err)}")
+
+    return email_history
+
+
 @celery_app.task(bind=True, max_retries=3, default_retry_delay=60)
 def sync_emails_task(self, account_id: int, limit: int = 100, only_unseen: bool = True):
     """
@@ -32,6 +91,8 @@ def sync_emails_task(self, account_id: int, limit: int = 100, only_unseen: bool
         if not account:
             return {"error": "邮箱账户不存在", "account_id": account_id}
         
+        set_attributes(**{"email.account_id": account_id})
+        
         # 更新同步状态
         account.sync_status = 'syncing'
         db.commit()
@@ -62,50 +123,11 @@ def sync_emails_task(self, account_id: int, limit: int = 100, only_unseen: bool
         # 保存邮件
         for email_data in emails:
             try:
-                # 去重检查
-                message_id = email_data.get('message_id', '').strip()
-                if message_id:
-                    existing = db.query(EmailHistory).filter(
-                        EmailHistory.message_id == message_id
-                    ).first()
-                    if existing:
-                        emails_duplicated += 1
-                        continue
-                
-                # 创建邮件记录
-                email_history = EmailHistory(
-                    customer_id=None,
-                    direction='inbound',
-                    subject=email_data['subject'],
-                    body=email_data['body'],
-                    html_body=email_data.get('html_body'),
-                    sent_at=email_data['date'],
-                    from_name=email_data.get('from_name'),  # 🔥 新增：发件人名称
-                    from_email=email_data['from_email'],
-                    to_name=email_data.get('to_name'),  # 🔥 新增：收件人名称
-                    to_email=email_data['to_email'],
-                    message_id=message_id if message_id else None,
-                    attachments=str(email_data['attachments']) if email_data['attachments'] else None
-                )
+                email_history = store_inbound_email(db, receiver, email_data)
+                if email_history is None:
+                    emails_duplicated += 1
+                    continue
                 
-                db.add(email_history)
-                db.flush()  # 确保获取到数据库生成的自增 ID (email_history.id)
-
-                # 🔥 新增：使用正确的数据库 ID 处理正文图片
-                if email_history.html_body and email_data.get('inline_images'):
-                    print(f"🖼️ 处理正文图片: 使用数据库ID={email_history.id}")
-                    try:
-                        # 调用 receiver 的图片处理方法，使用正确的数据库 ID
-                        processed_html = receiver._process_html_images(
-                            email_history.html_body, 
-                            str(email_history.id),  # 使用数据库 ID，而不是 IMAP ID
-                            email_data.get('inline_images', {})
-                        )
-                        email_history.html_body = processed_html
-                        print(f"✅ 图片路径处理完成: 邮件ID={email_history.id}")
-                    except Exception as img_err:
-                        print(f"⚠️ 图片处理失败: {str(img_err)}")
-
                 emails_saved += 1
                 
                 # 🔥 关键：自动触发AI分析（异步）
@@ -156,22 +178,220 @@ def send_email_task(self, email_data: dict):
     
     参数:
         email_data: 邮件数据字典
+            {from_email, to_email, subject, body, html_body, cc_email, bcc_email, priority, need_receipt}
+    
+    同一 worker 进程内的连续发送会复用连接池中已登录的SMTP会话
     """
-    # TODO: 实现邮件发送逻辑
+    from src.email_system.sender import EmailSender, smtp_config_from_account
+    
+    db = get_session()
+    
     try:
         print(f"📧 发送邮件: {email_data.get('subject')}")
-        # 这里添加实际的发送逻辑
-        return {"success": True, "message": "邮件已发送"}
+        
+        query = db.query(EmailAccount).filter(EmailAccount.is_active == True)
+        if email_data.get('from_email'):
+            query = query.filter(EmailAccount.email_address == email_data['from_email'])
+        account = query.first()
+        
+        if not account or not account.smtp_host or not account.smtp_password:
+            return {"success": False, "message": "未找到发件人账户的SMTP配置", "error": "SMTP_CONFIG_MISSING"}
+        
+        sender = EmailSender(smtp_config=smtp_config_from_account(account))
+        result = sender.send_email(
+            to_email=email_data['to_email'],
+            subject=email_data.get('subject', '(无主题)'),
+            body=email_data.get('body', ''),
+            from_email=account.email_address,
+            from_name=account.account_name,
+            cc_email=email_data.get('cc_email'),
+            bcc_email=email_data.get('bcc_email'),
+            html_body=email_data.get('html_body'),
+            priority=email_data.get('priority', 'normal'),
+            need_receipt=email_data.get('need_receipt', False)
+        )
+        
+        # 连接类错误重试，认证/配置错误直接返回
+        if not result['success'] and result['error'] in ('SMTP_ERROR', 'UNKNOWN_ERROR'):
+            raise RuntimeError(result['message'])
+        
+        if result['success']:
+            account.total_sent = (account.total_sent or 0) + 1
+            db.commit()
+        
+        return result
     except Exception as e:
         print(f"❌ 发送邮件失败: {str(e)}")
         raise self.retry(exc=e)
+    finally:
+        db.close()
 
 
-@celery_app.task(bind=True, max_retries=3)
-def check_bounce_emails_task(self, account_id: int):
+@celery_app.task
+def start_campaign_task(campaign_id: int):
+    """
+    🔥 启动/恢复营销活动发送
+    
+    将剩余收件人分配到所有可用邮箱账户，每个账户一条 send_campaign_batch_task 任务链并发发送。
+    重复调用是安全的：已处理的收件人不会重复发送，旧任务链会因运行ID变化而退出。
+    """
+    from src.email_system.campaign_sender import plan_campaign, start_campaign_run, finalize_campaign_if_done
+    
+    db = get_session()
+    
+    try:
+        campaign = db.query(EmailCampaign).filter(EmailCampaign.id == campaign_id).first()
+        if not campaign:
+            return {"error": "活动不存在", "campaign_id": campaign_id}
+        
+        plan = plan_campaign(db, campaign)
+        
+        campaign.status = 'Running'
+        if not campaign.started_at:
+            campaign.started_at = datetime.now()
+        db.commit()
+        
+        if not plan:
+            finalize_campaign_if_done(db, campaign_id)
+            return {"success": True, "campaign_id": campaign_id, "accounts": 0, "recipients": 0}
+        
+        run_id = start_campaign_run(campaign_id)
+        for account_id, customer_ids in plan.items():
+            send_campaign_batch_task.delay(campaign_id, account_id, customer_ids, run_id)
+        
+        recipients = sum(len(ids) for ids in plan.values())
+        print(f"📤 活动 {campaign_id} 开始发送: {recipients} 个收件人, {len(plan)} 个账户")
+        
+        return {
+            "success": True,
+            "campaign_id": campaign_id,
+            "accounts": len(plan),
+            "recipients": recipients
+        }
+        
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True, max_retries=3, default_retry_delay=60)
+def send_campaign_batch_task(self, campaign_id: int, account_id: int, customer_ids: list, run_id: str):
+    """
+    🔥 使用单个账户发送一批活动邮件
+    
+    在时间预算内复用同一个SMTP会话发送；剩余收件人（限速、超出预算）以新任务重新排队，
+    直到全部发送完成或活动被暂停。
+    """
+    from src.email_system.campaign_sender import send_campaign_batch, is_current_run, finalize_campaign_if_done
+    
+    if not is_current_run(campaign_id, run_id):
+        return {"skipped": True, "reason": "stale_run", "campaign_id": campaign_id}
+    
+    db = get_session()
+    
+    try:
+        result = send_campaign_batch(db, campaign_id, account_id, customer_ids)
+        
+        if result['stopped'] in ('paused', 'not_found', 'template_missing'):
+            print(f"⏸️ 活动 {campaign_id} 账户 {account_id} 停止发送: {result['stopped']}")
+        elif result['remaining']:
+            self.apply_async(
+                args=(campaign_id, account_id, result['remaining'], run_id),
+                countdown=result['retry_after']
+            )
+        else:
+            finalize_campaign_if_done(db, campaign_id)
+        
+        print(f"✅ 活动 {campaign_id} 账户 {account_id}: 发送 {result['sent']}, 失败 {result['failed']}, 剩余 {len(result['remaining'])}")
+        
+        return {
+            "success": True,
+            "campaign_id": campaign_id,
+            "account_id": account_id,
+            "sent": result['sent'],
+            "failed": result['failed'],
+            "remaining": len(result['remaining']),
+            "stopped": result['stopped']
+        }
+        
+    except Exception as e:
+        db.rollback()
+        print(f"❌ 活动发送任务失败: {str(e)}")
+        traceback.print_exc()
+        raise self.retry(exc=e)
+        
+    finally:
+        db.close()
+
+
+# 退信检查：单个账户的时间上限，以及一轮检查的锁（防止上一轮未结束时重叠执行）
+BOUNCE_TASK_SOFT_LIMIT = 120
+BOUNCE_CYCLE_LOCK_KEY = 'bounce:cycle_lock'
+BOUNCE_CYCLE_INTERVAL = 300
+
+
+def _bounce_uid_key(account_id: int, uid_validity) -> str:
+    return f"bounce:last_uid:{account_id}:{uid_validity}"
+
+
+def apply_bounces(db, bounces: list) -> list:
+    """
+    把退信结果批量写回 EmailHistory
+    
+    一次 SELECT 取出受影响的邮件，一次 UPDATE ... WHERE message_id IN (...) 更新，一次提交。
+    
+    Returns:
+        更新明细列表
+    """
+    from sqlalchemy import update, case
+    
+    # 同一封邮件可能收到多封退信，保留最后一条
+    by_message_id = {b['message_id']: b for b in bounces if b.get('message_id')}
+    if not by_message_id:
+        return []
+    
+    rows = db.query(EmailHistory.id, EmailHistory.message_id, EmailHistory.delivery_status).filter(
+        EmailHistory.message_id.in_(list(by_message_id))
+    ).all()
+    if not rows:
+        return []
+    
+    reasons = {
+        message_id: f"[{b['bounce_type'].upper()}] {b['smtp_code']}: {b['bounce_reason']}"
+        for message_id, b in by_message_id.items()
+    }
+    db.execute(
+        update(EmailHistory)
+        .where(EmailHistory.message_id.in_([row.message_id for row in rows]))
+        .values(
+            delivery_status='bounced',
+            bounce_reason=case(reasons, value=EmailHistory.message_id)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    
+    return [
+        {
+            'email_id': row.id,
+            'recipient': by_message_id[row.message_id].get('recipient'),
+            'old_status': row.delivery_status,
+            'new_status': 'bounced',
+            'bounce_type': by_message_id[row.message_id]['bounce_type'],
+            'smtp_code': by_message_id[row.message_id].get('smtp_code')
+        }
+        for row in rows
+    ]
+
+
+@celery_app.task(soft_time_limit=BOUNCE_TASK_SOFT_LIMIT, time_limit=BOUNCE_TASK_SOFT_LIMIT + 30)
+def check_bounce_emails_task(account_id: int):
     """
     🔥 检查退信邮件任务
     
+    按账户记录上次检查到的最大UID，只检查新邮件。
+    失败时返回错误信息而不是重试：下一轮定时检查会从同一个UID位置继续，
+    同时保证汇总任务（chord回调）总能执行。
+    
     参数:
         account_id: 邮箱账户ID
     
@@ -184,7 +404,10 @@ def check_bounce_emails_task(self, account_id: int):
             'details': list
         }
     """
+    from src.utils.cache import cache
+    
     db = get_session()
+    bounce_listener = None
     
     try:
         # 获取邮箱账户
@@ -207,108 +430,115 @@ def check_bounce_emails_task(self, account_id: int):
         if not bounce_listener.connect():
             return {"error": "连接IMAP失败", "account_id": account_id}
         
-        # 检查退信邮件
-        bounces = bounce_listener.check_bounce_emails()
-        bounce_listener.disconnect()
+        # 先 SELECT 一次拿到 UIDVALIDITY，再读取对应的增量位置
+        bounce_listener.connection.select('INBOX')
+        uid_key = _bounce_uid_key(account_id, bounce_listener._get_uid_validity())
+        since_uid = cache.get(uid_key)
         
-        emails_updated = 0
-        update_details = []
+        # 检查退信邮件
+        bounces = bounce_listener.check_bounce_emails(since_uid=since_uid)
+        if bounce_listener.last_uid:
+            cache.set(uid_key, bounce_listener.last_uid, ttl=30 * 24 * 3600)
         
-        # 更新数据库中对应邮件的投递状态
-        for bounce in bounces:
-            try:
-                message_id = bounce.get('message_id')
-                if not message_id:
-                    continue
-                
-                # 查找原始邮件
-                email = db.query(EmailHistory).filter(
-                    EmailHistory.message_id == message_id
-                ).first()
-                
-                if email:
-                    # 更新投递状态
-                    old_status = email.delivery_status
-                    email.delivery_status = 'bounced'
-                    email.bounce_reason = f"[{bounce['bounce_type'].upper()}] {bounce['smtp_code']}: {bounce['bounce_reason']}"
-                    
-                    db.commit()
-                    emails_updated += 1
-                    
-                    update_details.append({
-                        'email_id': email.id,
-                        'recipient': bounce.get('recipient'),
-                        'old_status': old_status,
-                        'new_status': 'bounced',
-                        'bounce_type': bounce['bounce_type'],
-                        'smtp_code': bounce.get('smtp_code')
-                    })
-                    
-                    print(f"✅ 更新邮件投递状态: ID={email.id}, {old_status} -> bounced")
-                
-            except Exception as e:
-                print(f"⚠️ 更新邮件失败: {str(e)}")
-                continue
+        # 批量更新数据库中对应邮件的投递状态
+        update_details = apply_bounces(db, bounces)
         
         result = {
             'success': True,
             'account_id': account_id,
             'bounces_found': len(bounces),
-            'emails_updated': emails_updated,
+            'emails_updated': len(update_details),
             'details': update_details
         }
         
-        print(f"✅ 退信检查完成: 发现 {len(bounces)} 封退信, 更新 {emails_updated} 封邮件")
+        print(f"✅ 退信检查完成: 发现 {len(bounces)} 封退信, 更新 {len(update_details)} 封邮件")
         return result
         
     except Exception as e:
-        print(f"❌ 检查退信任务失败: {str(e)}")
+        db.rollback()
+        print(f"❌ 检查退信任务失败 (account_id={account_id}): {str(e)}")
         traceback.print_exc()
-        raise self.retry(exc=e)
+        return {'success': False, 'account_id': account_id, 'error': str(e)}
         
     finally:
+        if bounce_listener:
+            bounce_listener.disconnect()
         db.close()
 
 
+@celery_app.task
+def aggregate_bounce_results(results: list):
+    """
+    汇总所有账户的退信检查结果（chord回调），并释放本轮检查锁
+    """
+    from src.utils.cache import cache
+    
+    results = [r for r in results if isinstance(r, dict)]
+    total_bounces = sum(r.get('bounces_found', 0) for r in results if r.get('success'))
+    total_updated = sum(r.get('emails_updated', 0) for r in results if r.get('success'))
+    failed = [r.get('account_id') for r in results if not r.get('success')]
+    
+    if failed:
+        print(f"⚠️ {len(failed)} 个账户检查失败: {failed}")
+    print(f"✅ 所有账户退信检查完成: 发现 {total_bounces} 封退信, 更新 {total_updated} 封邮件")
+    
+    cache.delete(BOUNCE_CYCLE_LOCK_KEY)
+    
+    return {
+        'success': True,
+        'accounts_checked': len(results),
+        'accounts_failed': failed,
+        'total_bounces': total_bounces,
+        'total_updated': total_updated
+    }
+
+
 @celery_app.task
 def check_all_accounts_bounce_emails():
     """
     🔥 检查所有活跃邮箱账户的退信邮件
     该任务由定时调度器触发（每5分钟）
+    
+    每个账户作为独立子任务并行执行，chord 回调汇总结果。
+    上一轮还没结束时跳过本轮；子任务设置过期时间，积压的任务不会拖到下一轮。
     """
+    from celery import chord
+    from src.utils.cache import cache
+    
     db = get_session()
     
     try:
         # 查找所有活跃的邮箱账户
-        accounts = db.query(EmailAccount).filter(
-            EmailAccount.is_active == True
-        ).all()
+        account_ids = [
+            account_id for (account_id,) in db.query(EmailAccount.id).filter(
+                EmailAccount.is_active == True
+            ).all()
+        ]
         
-        print(f"🔍 开始检查 {len(accounts)} 个邮箱账户的退信邮件")
+        if not account_ids:
+            return {'success': True, 'accounts_checked': 0, 'total_bounces': 0, 'total_updated': 0}
         
-        total_bounces = 0
-        total_updated = 0
+        # 本轮检查锁：锁的有效期即最长允许的一轮时长，回调执行后提前释放
+        if cache.client and not cache.client.set(BOUNCE_CYCLE_LOCK_KEY, '1', nx=True, ex=BOUNCE_CYCLE_INTERVAL):
+            print("⏭️ 上一轮退信检查尚未完成，跳过本轮")
+            return {'success': True, 'skipped': True}
         
-        for account in accounts:
-            try:
-                result = check_bounce_emails_task(account.id)
-                if result.get('success'):
-                    total_bounces += result.get('bounces_found', 0)
-                    total_updated += result.get('emails_updated', 0)
-            except Exception as e:
-                print(f"⚠️ 账户 {account.email_address} 检查失败: {str(e)}")
-                continue
+        print(f"🔍 开始并行检查 {len(account_ids)} 个邮箱账户的退信邮件")
         
-        print(f"✅ 所有账户退信检查完成: 发现 {total_bounces} 封退信, 更新 {total_updated} 封邮件")
+        header = [
+            check_bounce_emails_task.s(account_id).set(expires=BOUNCE_CYCLE_INTERVAL - 20)
+            for account_id in account_ids
+        ]
+        result = chord(header)(aggregate_bounce_results.s())
         
         return {
             'success': True,
-            'accounts_checked': len(accounts),
-            'total_bounces': total_bounces,
-            'total_updated': total_updated
+            'accounts_dispatched': len(account_ids),
+            'chord_id': result.id
         }
         
     except Exception as e:
+        cache.delete(BOUNCE_CYCLE_LOCK_KEY)
         print(f"❌ 检查所有账户退信失败: {str(e)}")
         traceback.print_exc()
         return {'success': False, 'error': str(e)}
@@ -3,20 +3,80 @@ Redis缓存工具
 提供统一的缓存接口和装饰器
 """
 import os
-import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import inspect
 import hashlib
 import logging
-from typing import Optional, Any, Callable
+import weakref
+from typing import Optional, Any, Callable, Dict, Awaitable, Iterable, List, Union
 from functools import wraps
 import redis
+import redis.asyncio as aioredis
+
+from src.utils.codec import CacheCodec, default_codec
+from src.utils.metrics import CACHE_REQUESTS, cache_key_prefix
 
 logger = logging.getLogger(__name__)
 
+# 缓存标签：每个标签是一个 Redis 集合，记录打了该标签的缓存键
+TAG_KEY_PREFIX = 'cachetag:'
+# 批量删除/扫描时每批处理的键数量
+SCAN_BATCH_SIZE = 500
+
+TagsSpec = Optional[Union[Iterable[str], Callable[..., Iterable[str]]]]
+
+
+def tag_key(tag: str) -> str:
+    """标签集合的键名"""
+    return f"{TAG_KEY_PREFIX}{tag}"
+
+
+# 只删除自己持有的锁（比较token后删除），同时写入/清除结果标记
+# KEYS[1] = 锁, KEYS[2] = 结果标记; ARGV[1] = token, ARGV[2] = 结果（空字符串表示已写入缓存）, ARGV[3] = 标记过期秒数
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    if ARGV[2] ~= '' then
+        redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+    else
+        redis.call('DEL', KEYS[2])
+    end
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 锁持有者没有写入缓存时留下的结果标记，等待者看到后立即结束等待
+LOCK_OUTCOME_NONE = 'none'    # 结果为 None 且不缓存空结果（negative_ttl=0）
+LOCK_OUTCOME_ERROR = 'error'  # 计算抛出异常
+LOCK_OUTCOME_TTL = 5
+# lock_status 的返回值
+LOCK_HELD = 'held'
+LOCK_RELEASED = ''
+
+
+def _lock_keys(name: str) -> List[str]:
+    return [f"lock:{name}", f"lockdone:{name}"]
+
+
+def _lock_status(held: Any, outcome: Any) -> str:
+    if isinstance(outcome, bytes):
+        outcome = outcome.decode()
+    if held:
+        return LOCK_HELD
+    if outcome in (LOCK_OUTCOME_NONE, LOCK_OUTCOME_ERROR):
+        return outcome
+    return LOCK_RELEASED
+
 
 class RedisCache:
     """Redis缓存管理器"""
     
-    def __init__(self, host: str = None, port: int = None, db: int = 1, password: str = None):
+    def __init__(self, host: str = None, port: int = None, db: int = 1, password: str = None,
+                 codec: CacheCodec = None):
         """
         初始化Redis连接
         
@@ -25,17 +85,21 @@ class RedisCache:
             port: Redis端口
             db: 数据库编号（默认db1用于缓存）
             password: Redis密码
+            codec: 缓存值编解码器（默认按已安装依赖选择 msgpack/orjson/json + 压缩）
         """
+        self.codec = codec or default_codec
         try:
-            self.client = redis.Redis(
+            connection_kwargs = dict(
                 host=host or os.getenv('REDIS_HOST', 'localhost'),
                 port=port or int(os.getenv('REDIS_PORT', 6379)),
                 db=db,
                 password=password or os.getenv('REDIS_PASSWORD'),
-                decode_responses=True,
                 socket_connect_timeout=5,
                 socket_timeout=5
             )
+            # client 返回字符串，供计数器/锁/标签等使用；缓存值是二进制信封，使用 binary_client 读写
+            self.client = redis.Redis(decode_responses=True, **connection_kwargs)
+            self.binary_client = redis.Redis(**connection_kwargs)
             # 测试连接
             self.client.ping()
             self.available = True
@@ -44,6 +108,7 @@ class RedisCache:
             logger.warning(f"Redis连接失败，缓存功能将降级: {str(e)}")
             self.available = False
             self.client = None
+            self.binary_client = None
     
     def get(self, key: str) -> Optional[Any]:
         """获取缓存值"""
@@ -51,15 +116,17 @@ class RedisCache:
             return None
         
         try:
-            value = self.client.get(key)
+            value = self.binary_client.get(key)
+            CACHE_REQUESTS.labels('sync', cache_key_prefix(key), 'hit' if value else 'miss').inc()
             if value:
-                return json.loads(value)
+                return self.codec.decode(value)
             return None
         except Exception as e:
+            CACHE_REQUESTS.labels('sync', cache_key_prefix(key), 'error').inc()
             logger.warning(f"获取缓存失败 [{key}]: {str(e)}")
             return None
     
-    def set(self, key: str, value: Any, ttl: int = 300) -> bool:
+    def set(self, key: str, value: Any, ttl: int = 300, tags: Optional[Iterable[str]] = None) -> bool:
         """
         设置缓存值
         
@@ -67,18 +134,71 @@ class RedisCache:
             key: 缓存键
             value: 缓存值
             ttl: 过期时间（秒），默认5分钟
+            tags: 缓存标签（如 "customer:12"），invalidate_tags 时一并删除
         """
         if not self.available:
             return False
         
         try:
-            serialized = json.dumps(value, ensure_ascii=False)
-            self.client.setex(key, ttl, serialized)
+            serialized = self.codec.encode(value)
+            pipe = self.binary_client.pipeline(transaction=False)
+            pipe.setex(key, ttl, serialized)
+            for tag in tags or ():
+                pipe.sadd(tag_key(tag), key)
+            pipe.execute()
             return True
         except Exception as e:
             logger.warning(f"设置缓存失败 [{key}]: {str(e)}")
             return False
-    
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量获取缓存值（一次 MGET），只返回命中的键"""
+        if not self.available or not keys:
+            return {}
+
+        try:
+            values = self.binary_client.mget(keys)
+        except Exception as e:
+            for key in keys:
+                CACHE_REQUESTS.labels('sync', cache_key_prefix(key), 'error').inc()
+            logger.warning(f"批量获取缓存失败 [{len(keys)}个键]: {str(e)}")
+            return {}
+
+        result = {}
+        for key, value in zip(keys, values):
+            CACHE_REQUESTS.labels('sync', cache_key_prefix(key), 'hit' if value else 'miss').inc()
+            if value:
+                try:
+                    result[key] = self.codec.decode(value)
+                except Exception as e:
+                    logger.warning(f"解码缓存失败 [{key}]: {str(e)}")
+        return result
+
+    def set_many(self, items: Dict[str, Any], ttl: int = 300,
+                 tags: Optional[Callable[[str], Iterable[str]]] = None) -> bool:
+        """
+        批量设置缓存值（一个 pipeline 内 SETEX）
+
+        Args:
+            items: {缓存键: 缓存值}
+            ttl: 过期时间（秒）
+            tags: 按缓存键返回其标签的函数
+        """
+        if not self.available or not items:
+            return False
+
+        try:
+            pipe = self.binary_client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.setex(key, ttl, self.codec.encode(value))
+                for tag in (tags(key) if tags else ()):
+                    pipe.sadd(tag_key(tag), key)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"批量设置缓存失败 [{len(items)}个键]: {str(e)}")
+            return False
+
     def delete(self, key: str) -> bool:
         """删除缓存"""
         if not self.available:
@@ -91,10 +211,77 @@ class RedisCache:
             logger.warning(f"删除缓存失败 [{key}]: {str(e)}")
             return False
     
+    def acquire_lock(self, name: str, ttl: float = 30) -> Optional[str]:
+        """
+        获取分布式锁
+        
+        Returns:
+            锁token（释放时使用）；锁被占用返回None；Redis不可用时返回空字符串（视为获得锁）
+        """
+        if not self.available:
+            return ''
+        token = uuid.uuid4().hex
+        try:
+            if self.client.set(f"lock:{name}", token, nx=True, px=int(ttl * 1000)):
+                return token
+            return None
+        except Exception as e:
+            logger.warning(f"获取锁失败 [{name}]: {str(e)}")
+            return ''
+    
+    def release_lock(self, name: str, token: Optional[str], outcome: str = ''):
+        """
+        释放分布式锁
+        
+        Args:
+            outcome: 没有写入缓存时的结果（LOCK_OUTCOME_NONE / LOCK_OUTCOME_ERROR），
+                     短时保留供等待者读取；空字符串表示结果已写入缓存
+        """
+        if not token or not self.available:
+            return
+        try:
+            self.client.eval(_RELEASE_LOCK_LUA, 2, *_lock_keys(name), token, outcome, LOCK_OUTCOME_TTL)
+        except Exception as e:
+            logger.warning(f"释放锁失败 [{name}]: {str(e)}")
+    
+    def lock_status(self, name: str) -> str:
+        """
+        查询锁状态（不计入缓存命中统计）
+        
+        Returns:
+            LOCK_HELD 仍被持有 / LOCK_OUTCOME_NONE / LOCK_OUTCOME_ERROR / LOCK_RELEASED 已释放（或Redis不可用）
+        """
+        if not self.available:
+            return LOCK_RELEASED
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in _lock_keys(name):
+                pipe.get(key)
+            return _lock_status(*pipe.execute())
+        except Exception as e:
+            logger.warning(f"查询锁状态失败 [{name}]: {str(e)}")
+            return LOCK_RELEASED
+    
+    def _unlink_batches(self, keys: Iterable[str]) -> int:
+        """分批 UNLINK（后台释放内存，不阻塞Redis）"""
+        deleted = 0
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= SCAN_BATCH_SIZE:
+                deleted += self.client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += self.client.unlink(*batch)
+        return deleted
+    
     def clear_pattern(self, pattern: str) -> int:
         """
         清除匹配模式的所有缓存
         
+        使用 SCAN 增量遍历，不会像 KEYS 那样阻塞Redis；
+        已知范围的失效请优先使用 invalidate_tags（开销只与受影响的键数量相关）。
+        
         Args:
             pattern: 键模式（如 "user:*"）
         
@@ -105,19 +292,271 @@ class RedisCache:
             return 0
         
         try:
-            keys = self.client.keys(pattern)
-            if keys:
-                return self.client.delete(*keys)
-            return 0
+            return self._unlink_batches(self.client.scan_iter(match=pattern, count=SCAN_BATCH_SIZE))
         except Exception as e:
             logger.warning(f"清除缓存失败 [{pattern}]: {str(e)}")
             return 0
+    
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        删除打了指定标签的所有缓存
+        
+        先把标签集合原子地 RENAME 到临时键，之后新写入的缓存会进入新的标签集合，
+        不会在删除过程中丢失登记。
+        
+        Returns:
+            删除的缓存键数量
+        """
+        if not self.available:
+            return 0
+        
+        deleted = 0
+        for tag in tags:
+            source = tag_key(tag)
+            pending = f"{source}:invalidating:{os.getpid()}:{time.monotonic_ns()}"
+            try:
+                self.client.rename(source, pending)
+            except redis.ResponseError:
+                continue  # 标签下没有缓存
+            except Exception as e:
+                logger.warning(f"缓存标签失效失败 [{tag}]: {str(e)}")
+                continue
+            
+            try:
+                deleted += self._unlink_batches(self.client.sscan_iter(pending, count=SCAN_BATCH_SIZE))
+            except Exception as e:
+                logger.warning(f"缓存标签失效失败 [{tag}]: {str(e)}")
+            # 调用方通常已提交数据库，Redis 故障只记录日志，不能让请求失败
+            try:
+                self.client.unlink(pending)
+            except Exception as e:
+                logger.warning(f"删除临时标签集合失败 [{pending}]: {str(e)}")
+        
+        if deleted:
+            logger.debug(f"缓存标签失效: {tags} -> {deleted} 个键")
+        return deleted
+    
+    def prune_tags(self) -> int:
+        """
+        清理标签集合中已过期的缓存键（定时维护任务）
+        
+        标签集合本身不设过期时间，缓存键过期后集合里会留下失效成员，
+        这里用 SCAN/SSCAN 增量遍历并移除，空集合由Redis自动删除。
+        
+        Returns:
+            移除的失效成员数量
+        """
+        if not self.available:
+            return 0
+        
+        removed = 0
+        try:
+            for set_key in self.client.scan_iter(match=f"{TAG_KEY_PREFIX}*", count=SCAN_BATCH_SIZE):
+                members = []
+                for member in self.client.sscan_iter(set_key, count=SCAN_BATCH_SIZE):
+                    members.append(member)
+                    if len(members) >= SCAN_BATCH_SIZE:
+                        removed += self._remove_dead_members(set_key, members)
+                        members = []
+                if members:
+                    removed += self._remove_dead_members(set_key, members)
+        except Exception as e:
+            logger.warning(f"清理缓存标签失败: {str(e)}")
+        return removed
+    
+    def _remove_dead_members(self, set_key: str, members: List[str]) -> int:
+        pipe = self.client.pipeline(transaction=False)
+        for member in members:
+            pipe.exists(member)
+        dead = [member for member, exists in zip(members, pipe.execute()) if not exists]
+        if dead:
+            self.client.srem(set_key, *dead)
+        return len(dead)
 
 
 # 全局缓存实例
 cache = RedisCache()
 
 
+class AsyncRedisCache:
+    """
+    异步Redis缓存管理器（redis.asyncio）
+    
+    连接池按事件循环隔离：API进程只有一个事件循环，所有协程共享同一个连接池；
+    Celery任务等同步代码请通过 run_async 运行协程，事件循环结束前会关闭该循环的连接池。
+    """
+    
+    # Redis不可用后暂停访问的秒数，避免每次调用都等待连接超时
+    RETRY_AFTER_FAILURE = 30
+    
+    def __init__(self, host: str = None, port: int = None, db: int = 1, password: str = None,
+                 max_connections: int = None, codec: CacheCodec = None):
+        self.codec = codec or default_codec
+        self.connection_kwargs = {
+            'host': host or os.getenv('REDIS_HOST', 'localhost'),
+            'port': port or int(os.getenv('REDIS_PORT', 6379)),
+            'db': db,
+            'password': password or os.getenv('REDIS_PASSWORD'),
+            'socket_connect_timeout': 5,
+            'socket_timeout': 5,
+            'max_connections': max_connections or int(os.getenv('REDIS_ASYNC_MAX_CONNECTIONS', 50)),
+        }
+        self._clients = weakref.WeakKeyDictionary()
+        self._disabled_until = 0.0
+    
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+    
+    def _client(self) -> aioredis.Redis:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = aioredis.Redis(**self.connection_kwargs)
+            self._clients[loop] = client
+        return client
+    
+    def _mark_failed(self, action: str, key: str, error: Exception):
+        logger.warning(f"{action}失败 [{key}]: {str(error)}")
+        if isinstance(error, (redis.ConnectionError, redis.TimeoutError, OSError)):
+            self._disabled_until = time.monotonic() + self.RETRY_AFTER_FAILURE
+    
+    async def get(self, key: str) -> Optional[Any]:
+        """获取缓存值"""
+        if not self.available:
+            return None
+        
+        try:
+            value = await self._client().get(key)
+            CACHE_REQUESTS.labels('async', cache_key_prefix(key), 'hit' if value else 'miss').inc()
+            if value:
+                return self.codec.decode(value)
+            return None
+        except Exception as e:
+            CACHE_REQUESTS.labels('async', cache_key_prefix(key), 'error').inc()
+            self._mark_failed("获取缓存", key, e)
+            return None
+    
+    async def set(self, key: str, value: Any, ttl: int = 300, tags: Optional[Iterable[str]] = None) -> bool:
+        """设置缓存值（tags 含义同 RedisCache.set）"""
+        if not self.available:
+            return False
+        
+        try:
+            serialized = self.codec.encode(value)
+            pipe = self._client().pipeline(transaction=False)
+            pipe.setex(key, ttl, serialized)
+            for tag in tags or ():
+                pipe.sadd(tag_key(tag), key)
+            await pipe.execute()
+            return True
+        except Exception as e:
+            self._mark_failed("设置缓存", key, e)
+            return False
+    
+    async def delete(self, key: str) -> bool:
+        """删除缓存"""
+        if not self.available:
+            return False
+        
+        try:
+            await self._client().delete(key)
+            return True
+        except Exception as e:
+            self._mark_failed("删除缓存", key, e)
+            return False
+    
+    async def acquire_lock(self, name: str, ttl: float = 30) -> Optional[str]:
+        """获取分布式锁（返回值含义同 RedisCache.acquire_lock）"""
+        if not self.available:
+            return ''
+        token = uuid.uuid4().hex
+        try:
+            if await self._client().set(f"lock:{name}", token, nx=True, px=int(ttl * 1000)):
+                return token
+            return None
+        except Exception as e:
+            self._mark_failed("获取锁", name, e)
+            return ''
+    
+    async def release_lock(self, name: str, token: Optional[str], outcome: str = ''):
+        """释放分布式锁（outcome 含义同 RedisCache.release_lock）"""
+        if not token or not self.available:
+            return
+        try:
+            await self._client().eval(_RELEASE_LOCK_LUA, 2, *_lock_keys(name), token, outcome, LOCK_OUTCOME_TTL)
+        except Exception as e:
+            self._mark_failed("释放锁", name, e)
+    
+    async def lock_status(self, name: str) -> str:
+        """查询锁状态（返回值同 RedisCache.lock_status）"""
+        if not self.available:
+            return LOCK_RELEASED
+        try:
+            pipe = self._client().pipeline(transaction=False)
+            for key in _lock_keys(name):
+                pipe.get(key)
+            return _lock_status(*await pipe.execute())
+        except Exception as e:
+            self._mark_failed("查询锁状态", name, e)
+            return LOCK_RELEASED
+    
+    async def close(self):
+        """关闭当前事件循环的连接池"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+# 全局异步缓存实例
+async_cache = AsyncRedisCache()
+
+
+def run_async(coro: Awaitable[Any]) -> Any:
+    """
+    在新建的事件循环中运行协程并返回结果（供 Celery 任务等同步代码使用）
+    
+    关闭事件循环之前：
+    - 等待 async_cached 在该循环上启动的后台刷新完成（否则任务随循环关闭被销毁，旧值永远得不到刷新）
+    - 关闭该循环上的异步Redis连接池，避免每个任务遗留一组打开的连接
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            loop.run_until_complete(_drain_background_tasks())
+            loop.run_until_complete(async_cache.close())
+        except Exception as e:
+            logger.warning(f"关闭异步Redis连接池失败: {str(e)}")
+        asyncio.set_event_loop(None)
+        loop.close()
+
+# 正在计算中的缓存键（按事件循环隔离）：{loop: {cache_key: Task}}
+_inflight = weakref.WeakKeyDictionary()
+
+
+async def single_flight(key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    同一个键的并发调用只执行一次 compute，其余调用等待同一个结果
+    
+    compute 在独立的Task中执行：某个等待者被取消不会中断计算，也不影响其他等待者。
+    """
+    loop = asyncio.get_running_loop()
+    inflight: Dict[str, asyncio.Task] = _inflight.setdefault(loop, {})
+    
+    task = inflight.get(key)
+    if task is None:
+        task = loop.create_task(compute())
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    else:
+        logger.debug(f"合并并发请求: {key}")
+    
+    return await asyncio.shield(task)
+
+
 def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     """
     生成缓存键
@@ -150,79 +589,321 @@ def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     return f"{prefix}:{key_hash}"
 
 
-def cached(prefix: str, ttl: int = 300):
+def _key_builder(prefix: str, func: Callable) -> Callable[..., str]:
+    """
+    装饰器使用的缓存键函数
+    
+    被装饰的是实例方法（第一个参数名为 self）时不把 self 放进键：对象的 repr 带内存地址，
+    每个进程/实例都不同，会让跨 worker 的缓存、锁和后台刷新全部失效。
+    """
+    params = list(inspect.signature(func).parameters)
+    skip_self = bool(params) and params[0] == 'self'
+    
+    def build(*args, **kwargs) -> str:
+        return generate_cache_key(prefix, *(args[1:] if skip_self else args), **kwargs)
+    return build
+
+
+def _resolve_tags(tags: TagsSpec, args: tuple, kwargs: dict) -> List[str]:
+    """装饰器的 tags 参数可以是固定列表，也可以是根据调用参数生成标签的函数"""
+    if tags is None:
+        return []
+    if callable(tags):
+        return list(tags(*args, **kwargs))
+    return list(tags)
+
+
+# ============================================================================
+# 缓存装饰器：软/硬过期 + 提前刷新 + 分布式锁，防止缓存击穿
+#
+# 写入的缓存条目：{"__swr__": 1, "v": 值, "exp": 软过期时间戳, "delta": 计算耗时, "neg": 是否空结果}
+# - 软过期前：直接返回；临近软过期时按 XFetch 算法概率性提前刷新（计算越慢越早刷新）
+# - 软过期后、硬过期前（stale_ttl 窗口）：抢到锁的调用方刷新，其余调用方返回旧值
+# - 完全没有缓存：抢到锁的调用方计算，其余调用方等待锁释放后读取结果（超时后自行计算）；
+#   持有者没有写入缓存（空结果不缓存/计算异常）时释放锁会留下短时结果标记，等待者立即结束等待
+# - 返回 None 的结果按 negative_ttl 缓存，避免反复计算不存在的数据
+# ============================================================================
+
+SWR_MARKER = '__swr__'
+LOCK_POLL_INTERVAL = 0.1
+
+
+def _wrap_entry(value: Any, ttl: int, delta: float) -> dict:
+    return {SWR_MARKER: 1, "v": value, "exp": time.time() + ttl, "delta": round(delta, 4), "neg": value is None}
+
+
+def _entry_state(entry: Any, beta: float) -> str:
+    """
+    判断缓存条目状态
+
+    Returns:
+        'fresh' 直接使用 / 'refresh' 值可用但需要刷新
+    """
+    if not isinstance(entry, dict) or entry.get(SWR_MARKER) != 1:
+        return 'fresh'  # 旧格式条目，按原语义视为有效
+    now = time.time()
+    if now >= entry['exp']:
+        return 'refresh'
+    # XFetch：now - delta * beta * ln(rand) >= exp 时提前刷新
+    if beta > 0 and entry.get('delta') and not entry.get('neg'):
+        if now - entry['delta'] * beta * math.log(1.0 - random.random()) >= entry['exp']:
+            return 'refresh'
+    return 'fresh'
+
+
+def _entry_value(entry: Any) -> Any:
+    if isinstance(entry, dict) and entry.get(SWR_MARKER) == 1:
+        return entry['v']
+    return entry
+
+
+def _wait_for_lock(cache_key: str, lock_ttl: float) -> str:
+    """
+    等待其他调用方释放锁（只查询锁状态，不读取缓存值，不计入未命中统计）
+    
+    Returns:
+        锁状态（见 RedisCache.lock_status），超时返回 LOCK_HELD
+    """
+    deadline = time.monotonic() + lock_ttl
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        status = cache.lock_status(cache_key)
+        if status != LOCK_HELD:
+            return status
+    return LOCK_HELD
+
+
+async def _async_wait_for_lock(cache_key: str, lock_ttl: float) -> str:
+    """_wait_for_lock 的异步版本"""
+    deadline = time.monotonic() + lock_ttl
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        status = await async_cache.lock_status(cache_key)
+        if status != LOCK_HELD:
+            return status
+    return LOCK_HELD
+
+
+def _store_ttl(result: Any, ttl: int, stale_ttl: int, negative_ttl: int) -> int:
+    """写入Redis的硬过期时间；0 表示不缓存"""
+    if result is None:
+        return negative_ttl
+    return ttl + stale_ttl
+
+
+def cached(
+    prefix: str,
+    ttl: int = 300,
+    tags: TagsSpec = None,
+    stale_ttl: int = 0,
+    negative_ttl: int = 0,
+    beta: float = 1.0,
+    lock_ttl: float = 30
+):
     """
     同步缓存装饰器
     
     Args:
-        prefix: 缓存键前缀
-        ttl: 缓存过期时间（秒）
+        prefix: 缓存键前缀（装饰实例方法时 self 不参与缓存键，同一参数在所有实例/进程间共享缓存）
+        ttl: 缓存有效时间（秒，软过期）
+        tags: 缓存标签列表，或 (*args, **kwargs) -> 标签列表 的函数
+        stale_ttl: 软过期后仍可返回旧值的时间（秒），期间只有一个调用方刷新
+        negative_ttl: 返回 None 时的缓存时间（秒），0 表示不缓存空结果
+        beta: 提前刷新系数（0 关闭，越大越早刷新）
+        lock_ttl: 刷新锁的最长持有时间（秒），也是未命中时等待其他调用方的最长时间
     
     Example:
-        @cached(prefix="user", ttl=600)
+        @cached(prefix="user", ttl=600, tags=lambda user_id: [f"user:{user_id}"])
         def get_user(user_id: int):
             return db.query(User).get(user_id)
+        
+        cache.invalidate_tags("user:1")
     """
     def decorator(func: Callable) -> Callable:
+        build_key = _key_builder(prefix, func)
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
             # 生成缓存键
-            cache_key = generate_cache_key(prefix, *args, **kwargs)
+            cache_key = build_key(*args, **kwargs)
             
-            # 尝试从缓存获取
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                logger.debug(f"缓存命中: {cache_key}")
-                return cached_value
+            def compute():
+                # 执行函数
+                start = time.monotonic()
+                result = func(*args, **kwargs)
+                
+                # 存入缓存
+                store_ttl = _store_ttl(result, ttl, stale_ttl, negative_ttl)
+                if store_ttl:
+                    entry_ttl = ttl if result is not None else negative_ttl
+                    cache.set(
+                        cache_key, _wrap_entry(result, entry_ttl, time.monotonic() - start), store_ttl,
+                        tags=_resolve_tags(tags, args, kwargs)
+                    )
+                    logger.debug(f"缓存写入: {cache_key}")
+                return result
+            
+            def compute_locked(token):
+                # 持有锁时计算；没有写入缓存（空结果/异常）时释放锁并留下结果标记
+                outcome = LOCK_OUTCOME_ERROR
+                try:
+                    result = compute()
+                    outcome = '' if _store_ttl(result, ttl, stale_ttl, negative_ttl) else LOCK_OUTCOME_NONE
+                    return result
+                finally:
+                    cache.release_lock(cache_key, token, outcome)
             
-            # 执行函数
-            result = func(*args, **kwargs)
+            # 尝试从缓存获取
+            entry = cache.get(cache_key)
+            if entry is not None:
+                if _entry_state(entry, beta) == 'fresh':
+                    logger.debug(f"缓存命中: {cache_key}")
+                    return _entry_value(entry)
+                # 需要刷新：只有抢到锁的调用方刷新，其余返回旧值
+                token = cache.acquire_lock(cache_key, lock_ttl)
+                if token is None:
+                    return _entry_value(entry)
+                return compute_locked(token)
             
-            # 存入缓存
-            if result is not None:
-                cache.set(cache_key, result, ttl)
-                logger.debug(f"缓存写入: {cache_key}")
+            # 未命中：抢到锁的调用方计算，其余等待锁释放
+            token = cache.acquire_lock(cache_key, lock_ttl)
+            if token is not None:
+                return compute_locked(token)
             
-            return result
+            status = _wait_for_lock(cache_key, lock_ttl)
+            if status == LOCK_OUTCOME_NONE:
+                return None  # 持有者刚算出空结果（不缓存），直接共用
+            if status == LOCK_RELEASED:
+                entry = cache.get(cache_key)
+                if entry is not None:
+                    return _entry_value(entry)
+            elif status == LOCK_HELD:
+                logger.warning(f"等待缓存超时，自行计算: {cache_key}")
+            # 持有者计算失败、结果没有写入缓存或等待超时：自行计算
+            return compute()
         
+        wrapper.cache_key = build_key  # 按调用参数计算缓存键（调试/测试用）
         return wrapper
     return decorator
 
 
-def async_cached(prefix: str, ttl: int = 300):
+def async_cached(
+    prefix: str,
+    ttl: int = 300,
+    tags: TagsSpec = None,
+    stale_ttl: int = 0,
+    negative_ttl: int = 0,
+    beta: float = 1.0,
+    lock_ttl: float = 30
+):
     """
-    异步缓存装饰器
+    异步缓存装饰器（使用 async_cache，参数同 cached）
     
-    Args:
-        prefix: 缓存键前缀
-        ttl: 缓存过期时间（秒）
+    进程内同一个键的并发调用只计算一次；需要刷新时在后台刷新，调用方立即拿到旧值。
+    后台刷新依赖事件循环继续运行：在临时事件循环中调用（如 Celery 任务）请使用 run_async，
+    它会在关闭循环前等待刷新完成。
     
     Example:
-        @async_cached(prefix="email_analysis", ttl=3600)
+        @async_cached(prefix="email_analysis", ttl=3600, stale_ttl=600)
         async def analyze_email(subject: str, body: str):
             return await ai_service.analyze(subject, body)
     """
     def decorator(func: Callable) -> Callable:
+        build_key = _key_builder(prefix, func)
+        
         @wraps(func)
         async def wrapper(*args, **kwargs):
             # 生成缓存键
-            cache_key = generate_cache_key(prefix, *args, **kwargs)
+            cache_key = build_key(*args, **kwargs)
             
-            # 尝试从缓存获取
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                logger.debug(f"缓存命中: {cache_key}")
-                return cached_value
+            async def compute():
+                # 执行异步函数
+                start = time.monotonic()
+                result = await func(*args, **kwargs)
+                
+                # 存入缓存
+                store_ttl = _store_ttl(result, ttl, stale_ttl, negative_ttl)
+                if store_ttl:
+                    entry_ttl = ttl if result is not None else negative_ttl
+                    await async_cache.set(
+                        cache_key, _wrap_entry(result, entry_ttl, time.monotonic() - start), store_ttl,
+                        tags=_resolve_tags(tags, args, kwargs)
+                    )
+                    logger.debug(f"缓存写入: {cache_key}")
+                return result
+            
+            async def compute_locked(token):
+                # 持有锁时计算；没有写入缓存（空结果/异常）时释放锁并留下结果标记
+                outcome = LOCK_OUTCOME_ERROR
+                try:
+                    result = await compute()
+                    outcome = '' if _store_ttl(result, ttl, stale_ttl, negative_ttl) else LOCK_OUTCOME_NONE
+                    return result
+                finally:
+                    await async_cache.release_lock(cache_key, token, outcome)
             
-            # 执行异步函数
-            result = await func(*args, **kwargs)
+            async def refresh():
+                token = await async_cache.acquire_lock(cache_key, lock_ttl)
+                if token is None:
+                    return None  # 其他进程正在刷新
+                return await compute_locked(token)
             
-            # 存入缓存
-            if result is not None:
-                cache.set(cache_key, result, ttl)
-                logger.debug(f"缓存写入: {cache_key}")
+            async def compute_or_wait():
+                token = await async_cache.acquire_lock(cache_key, lock_ttl)
+                if token is not None:
+                    return await compute_locked(token)
+                
+                status = await _async_wait_for_lock(cache_key, lock_ttl)
+                if status == LOCK_OUTCOME_NONE:
+                    return None  # 持有者刚算出空结果（不缓存），直接共用
+                if status == LOCK_RELEASED:
+                    entry = await async_cache.get(cache_key)
+                    if entry is not None:
+                        return _entry_value(entry)
+                elif status == LOCK_HELD:
+                    logger.warning(f"等待缓存超时，自行计算: {cache_key}")
+                # 持有者计算失败、结果没有写入缓存或等待超时：自行计算
+                return await compute()
             
-            return result
+            # 尝试从缓存获取（异步客户端，不阻塞事件循环）
+            entry = await async_cache.get(cache_key)
+            if entry is not None:
+                if _entry_state(entry, beta) == 'refresh':
+                    # 后台刷新（进程内合并），调用方直接拿旧值
+                    _spawn_refresh(f"refresh:{cache_key}", refresh)
+                else:
+                    logger.debug(f"缓存命中: {cache_key}")
+                return _entry_value(entry)
+            
+            # 同一个键的并发未命中只计算一次
+            return await single_flight(cache_key, compute_or_wait)
         
+        wrapper.cache_key = build_key  # 按调用参数计算缓存键（调试/测试用）
         return wrapper
     return decorator
+
+
+async def _drain_background_tasks():
+    """等待当前事件循环上尚未完成的后台刷新/合并计算任务"""
+    tasks = list(_inflight.get(asyncio.get_running_loop(), {}).values())
+    if tasks:
+        logger.debug(f"等待 {len(tasks)} 个后台缓存任务完成")
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _spawn_refresh(key: str, refresh: Callable[[], Awaitable[Any]]):
+    """在后台执行刷新（同一个键同时只有一个刷新任务）"""
+    loop = asyncio.get_running_loop()
+    inflight: Dict[str, asyncio.Task] = _inflight.setdefault(loop, {})
+    if key in inflight:
+        return
+    
+    async def run():
+        try:
+            await refresh()
+        except Exception as e:
+            logger.warning(f"后台刷新缓存失败 [{key}]: {str(e)}")
+    
+    task = loop.create_task(run())
+    inflight[key] = task
+    task.add_done_callback(lambda _: inflight.pop(key, None))
@@ -0,0 +1,143 @@
+"""
+缓存编解码
+把缓存值编码为带版本头的二进制信封，序列化格式和压缩算法可插拔：
+
+    [版本号 1B][序列化格式 1B][压缩算法 1B][数据...]
+
+- 序列化：msgpack > orjson > json（按已安装的依赖自动选择，可用 CACHE_SERIALIZER 指定）
+- 压缩：超过 CACHE_COMPRESS_MIN_BYTES 时压缩，zstd > lz4 > zlib（可用 CACHE_COMPRESSOR 指定，none 关闭）
+- 解码只看信封头，任何格式写入的值都能被读出；没有信封头的旧值按 JSON 文本解析
+
+msgpack / orjson / zstandard / lz4 都是可选依赖，未安装时自动退回标准库实现。
+"""
+import os
+import json
+import zlib
+import logging
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+ENVELOPE_VERSION = 1
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv('CACHE_COMPRESS_MIN_BYTES', 1024))
+
+# 序列化格式ID / 压缩算法ID 写入信封，只能新增，不能修改已有编号
+SERIALIZER_IDS = {'json': 1, 'orjson': 2, 'msgpack': 3}
+COMPRESSOR_IDS = {'none': 0, 'zlib': 1, 'zstd': 2, 'lz4': 3}
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data)
+
+
+SERIALIZERS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    'json': (_json_dumps, _json_loads),
+}
+if orjson is not None:
+    SERIALIZERS['orjson'] = (orjson.dumps, orjson.loads)
+if msgpack is not None:
+    SERIALIZERS['msgpack'] = (
+        lambda value: msgpack.packb(value, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+    )
+
+COMPRESSORS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    COMPRESSORS['zstd'] = (_zstd_compressor.compress, _zstd_decompressor.decompress)
+if lz4_frame is not None:
+    COMPRESSORS['lz4'] = (lz4_frame.compress, lz4_frame.decompress)
+
+_SERIALIZER_BY_ID = {SERIALIZER_IDS[name]: name for name in SERIALIZERS}
+_COMPRESSOR_BY_ID = {COMPRESSOR_IDS[name]: name for name in COMPRESSORS}
+
+
+def _pick(preferred: str, available: dict, order: Tuple[str, ...]) -> str:
+    if preferred and preferred != 'auto':
+        if preferred in available or preferred == 'none':
+            return preferred
+        logger.warning(f"缓存编解码 {preferred} 不可用（未安装依赖），使用自动选择")
+    return next(name for name in order if name in available)
+
+
+class CacheCodec:
+    """缓存值编解码器"""
+
+    def __init__(self, serializer: str = None, compressor: str = None, compress_min_bytes: int = None):
+        self.serializer = _pick(
+            serializer or os.getenv('CACHE_SERIALIZER', 'auto'), SERIALIZERS, ('msgpack', 'orjson', 'json')
+        )
+        self.compressor = _pick(
+            compressor or os.getenv('CACHE_COMPRESSOR', 'auto'), COMPRESSORS, ('zstd', 'lz4', 'zlib')
+        )
+        self.compress_min_bytes = CACHE_COMPRESS_MIN_BYTES if compress_min_bytes is None else compress_min_bytes
+        self._dumps = SERIALIZERS[self.serializer][0]
+
+    def encode(self, value: Any) -> bytes:
+        """编码为信封字节串"""
+        payload = self._dumps(value)
+        compressor = 'none'
+        if self.compressor != 'none' and len(payload) >= self.compress_min_bytes:
+            compressed = COMPRESSORS[self.compressor][0](payload)
+            # 压缩收益太小时保留原文，省掉读取时的解压
+            if len(compressed) < len(payload) * 0.9:
+                payload = compressed
+                compressor = self.compressor
+        header = bytes((ENVELOPE_VERSION, SERIALIZER_IDS[self.serializer], COMPRESSOR_IDS[compressor]))
+        return header + payload
+
+    @staticmethod
+    def decode(data: bytes) -> Any:
+        """解码信封字节串（兼容没有信封头的旧JSON文本）"""
+        if isinstance(data, str):
+            return json.loads(data)
+        if not data or data[0] != ENVELOPE_VERSION:
+            return json.loads(data)
+
+        serializer = _SERIALIZER_BY_ID.get(data[1])
+        compressor = _COMPRESSOR_BY_ID.get(data[2]) if data[2] else 'none'
+        if serializer is None or compressor is None:
+            raise ValueError(f"缓存值格式不受支持（序列化={data[1]}, 压缩={data[2]}），缺少对应依赖")
+
+        payload = data[3:]
+        if compressor != 'none':
+            payload = COMPRESSORS[compressor][1](payload)
+        return SERIALIZERS[serializer][1](payload)
+
+    def describe(self) -> dict:
+        return {
+            "serializer": self.serializer,
+            "compressor": self.compressor,
+            "compress_min_bytes": self.compress_min_bytes,
+        }
+
+
+# 全局默认编解码器
+default_codec = CacheCodec()
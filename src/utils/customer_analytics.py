@@ -1,5 +1,114 @@
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, case
+
+from src.utils.cache import cache
+
+# 批量分析结果缓存时间（秒）
+ANALYTICS_CACHE_TTL = 60
+# 单次批量分析的最大客户数
+MAX_BULK_CUSTOMERS = 500
+
+
+def _analytics_key(customer_id):
+    """单个客户分析结果的缓存键"""
+    return f"analytics:customer:{customer_id}"
+
+
+def _score_health(order_count, total_amount, email_count, replied_count, last_contact_date, now=None):
+    """根据预聚合数据计算客户健康度评分（0-100）"""
+    now = now or datetime.now()
+    score = 0
+    
+    # 1. 订单活跃度（30分）
+    if order_count > 0:
+        score += 15
+    if order_count > 3:
+        score += 10
+    if order_count > 10:
+        score += 5
+    
+    # 2. 邮件互动度（30分）
+    if email_count:
+        reply_rate = replied_count / email_count
+        score += int(reply_rate * 30)
+    
+    # 3. 最近活跃度（20分）
+    if last_contact_date:
+        days_since = (now - last_contact_date).days
+        if days_since < 7:
+            score += 20
+        elif days_since < 30:
+            score += 15
+        elif days_since < 90:
+            score += 10
+    
+    # 4. 订单金额（20分）
+    if total_amount > 50000:
+        score += 20
+    elif total_amount > 20000:
+        score += 15
+    elif total_amount > 5000:
+        score += 10
+    
+    return min(score, 100)
+
+
+def _score_churn_risk(last_contact_date, status, recent_outbound_replied, now=None):
+    """根据预聚合数据预测客户流失风险（Low/Medium/High）"""
+    now = now or datetime.now()
+    risk_score = 0
+    
+    # 1. 长时间未联系
+    if last_contact_date:
+        days_since = (now - last_contact_date).days
+        if days_since > 90:
+            risk_score += 3
+        elif days_since > 60:
+            risk_score += 2
+        elif days_since > 30:
+            risk_score += 1
+    else:
+        risk_score += 2
+    
+    # 2. 邮件无回复（最近5封外发邮件）
+    if recent_outbound_replied and not any(recent_outbound_replied):
+        risk_score += 2
+    
+    # 3. 状态判断
+    if status in ['lost']:
+        risk_score += 5
+    elif status in ['cold']:
+        risk_score += 1
+    
+    # 分类
+    if risk_score >= 5:
+        return "High"
+    elif risk_score >= 3:
+        return "Medium"
+    else:
+        return "Low"
+
+
+def _pick_next_action(status, latest_order_status=None):
+    """根据客户状态和最近订单状态推荐下一步行动"""
+    if status == 'cold':
+        return "发送开发信，介绍产品优势"
+    elif status == 'contacted':
+        return "跟进邮件回复，询问需求细节"
+    elif status == 'replied':
+        return "准备报价方案，发送样品册"
+    elif status == 'qualified':
+        return "安排视频会议，洽谈合作细节"
+    elif status == 'negotiating':
+        if latest_order_status == 'quotation':
+            return "跟进报价，提供优惠方案促成订单"
+        return "推进合同签署，确认订单细节"
+    elif status == 'customer':
+        return "定期回访，询问产品使用情况，推荐新品"
+    elif status == 'lost':
+        return "分析失败原因，6个月后重新激活"
+    
+    return "持续跟进，保持联系"
 
 
 class CustomerAnalytics:
@@ -33,44 +142,14 @@ class CustomerAnalytics:
         if not customer:
             return 0
         
-        score = 0
-        
-        # 1. 订单活跃度（30分）
         orders = self.session.query(Order).filter_by(customer_id=customer_id).all()
-        if len(orders) > 0:
-            score += 15
-        if len(orders) > 3:
-            score += 10
-        if len(orders) > 10:
-            score += 5
-        
-        # 2. 邮件互动度（30分）
         emails = self.session.query(EmailHistory).filter_by(customer_id=customer_id).all()
         replied_count = sum(1 for e in emails if e.replied)
-        if emails:
-            reply_rate = replied_count / len(emails)
-            score += int(reply_rate * 30)
-        
-        # 3. 最近活跃度（20分）
-        if customer.last_contact_date:
-            days_since = (datetime.now() - customer.last_contact_date).days
-            if days_since < 7:
-                score += 20
-            elif days_since < 30:
-                score += 15
-            elif days_since < 90:
-                score += 10
-        
-        # 4. 订单金额（20分）
         total_amount = sum(float(o.total_amount or 0) for o in orders)
-        if total_amount > 50000:
-            score += 20
-        elif total_amount > 20000:
-            score += 15
-        elif total_amount > 5000:
-            score += 10
         
-        return min(score, 100)
+        return _score_health(
+            len(orders), total_amount, len(emails), replied_count, customer.last_contact_date
+        )
     
     def get_churn_risk(self, customer_id):
         """预测客户流失风险（Low/Medium/High）"""
@@ -80,44 +159,17 @@ class CustomerAnalytics:
         if not customer:
             return "Unknown"
         
-        risk_score = 0
-        
-        # 1. 长时间未联系
-        if customer.last_contact_date:
-            days_since = (datetime.now() - customer.last_contact_date).days
-            if days_since > 90:
-                risk_score += 3
-            elif days_since > 60:
-                risk_score += 2
-            elif days_since > 30:
-                risk_score += 1
-        else:
-            risk_score += 2
-        
-        # 2. 邮件无回复
         from src.crm.database import EmailHistory
         recent_emails = self.session.query(EmailHistory).filter(
             EmailHistory.customer_id == customer_id,
             EmailHistory.direction == 'outbound'
         ).order_by(EmailHistory.sent_at.desc()).limit(5).all()
         
-        replied_count = sum(1 for e in recent_emails if e.replied)
-        if recent_emails and replied_count == 0:
-            risk_score += 2
-        
-        # 3. 状态判断
-        if customer.status in ['lost']:
-            risk_score += 5
-        elif customer.status in ['cold']:
-            risk_score += 1
-        
-        # 分类
-        if risk_score >= 5:
-            return "High"
-        elif risk_score >= 3:
-            return "Medium"
-        else:
-            return "Low"
+        return _score_churn_risk(
+            customer.last_contact_date,
+            customer.status,
+            [bool(e.replied) for e in recent_emails]
+        )
     
     def recommend_next_action(self, customer_id):
         """推荐下一步行动"""
@@ -127,28 +179,142 @@ class CustomerAnalytics:
         if not customer:
             return "无可用建议"
         
-        # 根据状态和最后联系时间推荐
-        if customer.status == 'cold':
-            return "发送开发信，介绍产品优势"
-        elif customer.status == 'contacted':
-            return "跟进邮件回复，询问需求细节"
-        elif customer.status == 'replied':
-            return "准备报价方案，发送样品册"
-        elif customer.status == 'qualified':
-            return "安排视频会议，洽谈合作细节"
-        elif customer.status == 'negotiating':
+        # 只有谈判阶段需要参考最近订单状态
+        latest_order_status = None
+        if customer.status == 'negotiating':
             recent_orders = self.session.query(Order).filter_by(
                 customer_id=customer_id
             ).order_by(Order.order_date.desc()).limit(1).all()
-            if recent_orders and recent_orders[0].status == 'quotation':
-                return "跟进报价，提供优惠方案促成订单"
-            return "推进合同签署，确认订单细节"
-        elif customer.status == 'customer':
-            return "定期回访，询问产品使用情况，推荐新品"
-        elif customer.status == 'lost':
-            return "分析失败原因，6个月后重新激活"
-        
-        return "持续跟进，保持联系"
+            if recent_orders:
+                latest_order_status = recent_orders[0].status
+        
+        return _pick_next_action(customer.status, latest_order_status)
+    
+    def get_bulk_analytics(self, customers):
+        """
+        批量计算客户分析指标（CLV、健康度、流失风险、下一步行动）
+        
+        所有客户共享一份按客户分组的预聚合数据，查询次数与客户数量无关；
+        单个客户的结果会短时缓存，缓存命中的客户不再参与聚合。
+        
+        Args:
+            customers: Customer 对象列表
+        
+        Returns:
+            {customer_id: 分析结果字典}
+        """
+        results = {}
+        pending = {}
+        batch = customers[:MAX_BULK_CUSTOMERS]
+        cached_values = cache.get_many([_analytics_key(customer.id) for customer in batch])
+        for customer in batch:
+            cached_value = cached_values.get(_analytics_key(customer.id))
+            if cached_value is not None:
+                results[customer.id] = cached_value
+            else:
+                pending[customer.id] = customer
+        
+        if not pending:
+            return results
+        
+        stats = self._load_bulk_stats(list(pending.keys()))
+        now = datetime.now()
+        
+        for customer_id, customer in pending.items():
+            order_count, total_amount = stats['orders'].get(customer_id, (0, 0.0))
+            email_count, replied_count = stats['emails'].get(customer_id, (0, 0))
+            
+            item = {
+                "customer_id": customer_id,
+                "clv": total_amount,
+                "health_score": _score_health(
+                    order_count, total_amount, email_count, replied_count,
+                    customer.last_contact_date, now
+                ),
+                "churn_risk": _score_churn_risk(
+                    customer.last_contact_date, customer.status,
+                    stats['recent_outbound'].get(customer_id, []), now
+                ),
+                "next_action": _pick_next_action(
+                    customer.status, stats['latest_order_status'].get(customer_id)
+                ),
+            }
+            results[customer_id] = item
+        
+        # 新结果在一个 pipeline 内写回缓存
+        cache.set_many(
+            {_analytics_key(customer_id): results[customer_id] for customer_id in pending},
+            ANALYTICS_CACHE_TTL,
+            tags=lambda key: [f"customer:{key.rsplit(':', 1)[-1]}"]
+        )
+        
+        return results
+    
+    def _load_bulk_stats(self, customer_ids):
+        """一次性加载一批客户的订单/邮件聚合数据（每类一条 GROUP BY 或窗口查询）"""
+        from src.crm.database import Order, EmailHistory
+        
+        # 订单数量与金额
+        order_rows = self.session.query(
+            Order.customer_id,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0)
+        ).filter(
+            Order.customer_id.in_(customer_ids)
+        ).group_by(Order.customer_id).all()
+        
+        # 邮件数量与回复数量
+        email_rows = self.session.query(
+            EmailHistory.customer_id,
+            func.count(EmailHistory.id),
+            func.coalesce(func.sum(case((EmailHistory.replied == True, 1), else_=0)), 0)
+        ).filter(
+            EmailHistory.customer_id.in_(customer_ids)
+        ).group_by(EmailHistory.customer_id).all()
+        
+        # 每个客户最近5封外发邮件的回复情况
+        email_rank = func.row_number().over(
+            partition_by=EmailHistory.customer_id,
+            order_by=EmailHistory.sent_at.desc()
+        ).label('rn')
+        recent_sub = self.session.query(
+            EmailHistory.customer_id,
+            EmailHistory.replied,
+            email_rank
+        ).filter(
+            EmailHistory.customer_id.in_(customer_ids),
+            EmailHistory.direction == 'outbound'
+        ).subquery()
+        recent_rows = self.session.query(
+            recent_sub.c.customer_id,
+            recent_sub.c.replied
+        ).filter(recent_sub.c.rn <= 5).all()
+        
+        # 每个客户最近一笔订单的状态
+        order_rank = func.row_number().over(
+            partition_by=Order.customer_id,
+            order_by=Order.order_date.desc()
+        ).label('rn')
+        latest_sub = self.session.query(
+            Order.customer_id,
+            Order.status,
+            order_rank
+        ).filter(Order.customer_id.in_(customer_ids)).subquery()
+        latest_rows = self.session.query(
+            latest_sub.c.customer_id,
+            latest_sub.c.status
+        ).filter(latest_sub.c.rn == 1).all()
+        
+        recent_outbound = {}
+        for customer_id, replied in recent_rows:
+            recent_outbound.setdefault(customer_id, []).append(bool(replied))
+        
+        return {
+            'orders': {cid: (int(cnt), float(total or 0)) for cid, cnt, total in order_rows},
+            'emails': {cid: (int(cnt), int(replied or 0)) for cid, cnt, replied in email_rows},
+            'recent_outbound': recent_outbound,
+            'latest_order_status': {cid: status for cid, status in latest_rows},
+        }
     
     def get_top_customers(self, limit=10, metric='revenue'):
         """获取TOP客户"""
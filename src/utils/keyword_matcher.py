@@ -0,0 +1,205 @@
+"""
+多模式关键词匹配（Aho-Corasick）
+
+规则引擎和关键词过滤原来对每个关键词做一次 `word in text`，
+关键词越多越慢（关键词数 × 文本长度）。这里把一组关键词编译成一个自动机：
+- 每个关键词集合只构建一次，之后一次扫描文本就能找出所有命中
+- 按字符转移，中文关键词不需要分词，和英文一样按子串匹配
+- 默认忽略大小写，与原来先 lower() 再 `in` 的语义一致
+
+规则数据放在 config/keyword_rules.json（可用 KEYWORD_RULES_PATH 指定其他文件），
+每个规则集由若干维度组成，每个维度是有序的 (取值, 关键词列表)：
+    {
+        "email_analyzer": {
+            "category": {
+                "default": "inquiry",
+                "rules": [{"value": "order", "keywords": ["order", "订单"]}, ...]
+            }
+        }
+    }
+单值维度取第一条命中的规则（顺序即优先级），"multi": true 的维度返回所有命中的取值。
+
+用法：
+    rules = get_rule_set('email_analyzer')
+    rules.evaluate(text)  # {"category": "order", "sentiment": "neutral", ...}
+"""
+import os
+import json
+import logging
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parents[2] / 'config' / 'keyword_rules.json'
+KEYWORD_RULES_PATH = Path(os.getenv('KEYWORD_RULES_PATH', str(DEFAULT_RULES_PATH)))
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick 自动机
+
+    Args:
+        patterns: {标签: 关键词列表}，同一个关键词可以属于多个标签
+        ignore_case: 是否忽略大小写
+    """
+
+    def __init__(self, patterns: Mapping[Hashable, Iterable[str]], ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        # 每个状态的转移表、失败指针、输出（(关键词, 标签) 列表，已合并失败链上的输出）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, Hashable]]] = [[]]
+        self.size = 0
+
+        for label, keywords in patterns.items():
+            for keyword in keywords:
+                if keyword:
+                    self._add(self._normalize(keyword), label)
+        self._build_fail_links()
+
+    def _normalize(self, text: str) -> str:
+        return text.lower() if self.ignore_case else text
+
+    def _add(self, keyword: str, label: Hashable):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        if (keyword, label) not in self._out[state]:
+            self._out[state].append((keyword, label))
+            self.size += 1
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def _states(self, text: str) -> Iterator[Tuple[int, int]]:
+        """逐字符推进自动机，产出 (字符位置, 状态)"""
+        goto, fail = self._goto, self._fail
+        state = 0
+        for i, char in enumerate(self._normalize(text)):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if self._out[state]:
+                yield i, state
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str, Hashable]]:
+        """
+        找出所有命中（允许重叠）
+
+        Returns:
+            [(起始位置, 结束位置, 关键词, 标签), ...]，按结束位置排序
+        """
+        if not text:
+            return []
+        return [
+            (i - len(keyword) + 1, i + 1, keyword, label)
+            for i, state in self._states(text)
+            for keyword, label in self._out[state]
+        ]
+
+    def labels(self, text: str) -> Set[Hashable]:
+        """命中的标签集合"""
+        if not text:
+            return set()
+        return {label for _, state in self._states(text) for _, label in self._out[state]}
+
+    def matches_any(self, text: str) -> bool:
+        """是否命中任意关键词（找到第一个命中就返回）"""
+        if not text:
+            return False
+        return next(self._states(text), None) is not None
+
+
+class KeywordRuleSet:
+    """
+    数据驱动的关键词规则集：所有维度的关键词编译进同一个自动机，一次扫描得出全部结果
+
+    Args:
+        name: 规则集名称
+        dimensions: {维度: {"default": 默认值, "multi": 是否多值, "rules": [{"value": ..., "keywords": [...]}]}}
+    """
+
+    def __init__(self, name: str, dimensions: Mapping[str, Mapping[str, Any]]):
+        self.name = name
+        self.dimensions = {}
+        patterns = {}
+        for dimension, spec in dimensions.items():
+            rules = spec.get('rules', [])
+            self.dimensions[dimension] = {
+                'default': spec.get('default', [] if spec.get('multi') else None),
+                'multi': bool(spec.get('multi', False)),
+                'values': [rule['value'] for rule in rules],
+            }
+            for index, rule in enumerate(rules):
+                patterns[(dimension, index)] = rule.get('keywords', [])
+        self.matcher = KeywordMatcher(patterns)
+
+    def evaluate(self, text: str) -> Dict[str, Any]:
+        """返回各维度的取值"""
+        hits = self.matcher.labels(text)
+        result = {}
+        for dimension, spec in self.dimensions.items():
+            matched = [value for index, value in enumerate(spec['values']) if (dimension, index) in hits]
+            if spec['multi']:
+                result[dimension] = matched
+            else:
+                result[dimension] = matched[0] if matched else spec['default']
+        return result
+
+    def explain(self, text: str) -> Dict[str, List[Tuple[Any, str]]]:
+        """调试用：各维度命中的 (取值, 关键词)"""
+        result = {dimension: [] for dimension in self.dimensions}
+        for _, _, keyword, (dimension, index) in self.matcher.find_all(text):
+            hit = (self.dimensions[dimension]['values'][index], keyword)
+            if hit not in result[dimension]:
+                result[dimension].append(hit)
+        return result
+
+
+_rule_sets: Dict[str, KeywordRuleSet] = {}
+_rules_data: Dict[str, Any] = {}
+
+
+def load_keyword_rules(path: Path = None) -> Dict[str, Any]:
+    """读取规则文件（JSON）"""
+    path = Path(path or KEYWORD_RULES_PATH)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_rule_set(name: str) -> KeywordRuleSet:
+    """获取编译好的规则集（每个规则集只编译一次）"""
+    rule_set = _rule_sets.get(name)
+    if rule_set is None:
+        if not _rules_data:
+            _rules_data.update(load_keyword_rules())
+        if name not in _rules_data:
+            raise KeyError(f"关键词规则集不存在: {name}（规则文件: {KEYWORD_RULES_PATH}）")
+        rule_set = KeywordRuleSet(name, _rules_data[name])
+        _rule_sets[name] = rule_set
+        logger.info(f"✅ 关键词规则集已编译: {name}（{rule_set.matcher.size} 个关键词）")
+    return rule_set
+
+
+def reload_keyword_rules():
+    """规则文件修改后重新加载（下次 get_rule_set 时重新编译）"""
+    _rule_sets.clear()
+    _rules_data.clear()
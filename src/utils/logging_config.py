@@ -16,8 +16,14 @@ request_id_var: ContextVar[str] = ContextVar('request_id', default='')
 
 
 def set_request_id(request_id: str):
-    """设置当前请求ID"""
-    request_id_var.set(request_id)
+    """设置当前请求ID，返回 token（交给 reset_request_id 恢复）"""
+    return request_id_var.set(request_id)
+
+
+def reset_request_id(token):
+    """恢复设置之前的请求ID"""
+    if token is not None:
+        request_id_var.reset(token)
 
 
 def get_request_id() -> str:
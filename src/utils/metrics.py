@@ -0,0 +1,413 @@
+"""
+进程内指标（Prometheus 文本格式输出）
+
+不依赖 prometheus_client，提供三种指标：
+- Counter：只增计数（缓存命中/未命中、LLM token 数）
+- Gauge：当前值（进行中的请求数、连接池连接数）
+- Histogram：分桶直方图（请求耗时、LLM 调用耗时、连接池等待时间），
+  Prometheus 侧用 histogram_quantile() 计算 p50/p95/p99，/metrics/summary 也会按分桶估算
+
+多进程（uvicorn --workers / gunicorn / Celery prefork）：
+设置 METRICS_MULTIPROC_DIR 后，每个进程每 METRICS_FLUSH_INTERVAL 秒把自己的指标快照写到
+{目录}/{pid}.json，/metrics 输出时把本进程的实时数据和其他进程的快照相加。
+超过 METRICS_STALE_SECONDS 没有更新的快照（进程已退出）不再计入。
+fork 出的子进程会清空继承来的数值，避免和父进程重复计数。
+
+用法：
+    from src.utils.metrics import LLM_TOKENS
+    LLM_TOKENS.labels('gpt-4o-mini', 'prompt').inc(123)
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+METRICS_STALE_SECONDS = float(os.getenv('METRICS_STALE_SECONDS', 300))
+
+# 秒
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class _Child:
+    """某一组标签值对应的指标"""
+
+    def __init__(self, metric: 'Metric', key: Tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._metric._add(self._key, amount)
+
+    def dec(self, amount: float = 1):
+        self._metric._add(self._key, -amount)
+
+    def set(self, value: float):
+        self._metric._set(self._key, value)
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+
+class Metric:
+    """指标基类：按标签值保存数值"""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> _Child:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，收到 {values}")
+        return _Child(self, tuple(str(v) for v in values))
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _set(self, key, value):
+        raise TypeError(f"{self.type} 类型的指标不支持 set()")
+
+    def _observe(self, key, value):
+        raise TypeError(f"{self.type} 类型的指标不支持 observe()")
+
+    def reset(self):
+        # fork 时其他线程可能正持有锁，子进程里重新创建
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def snapshot(self) -> List:
+        """[[标签值列表, 数值], ...]"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _add(self, key, amount):
+        if amount < 0:
+            raise ValueError("Counter 只能增加")
+        super()._add(key, amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """分桶直方图：数值为 [各桶计数..., +Inf 桶计数, 总和]"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _add(self, key, amount):
+        raise TypeError("Histogram 不支持 inc()")
+
+    def _observe(self, key, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def snapshot(self) -> List:
+        with self._lock:
+            return [[list(key), list(value)] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def time(self, *labels):
+        """计时上下文：with HISTOGRAM.time('a', 'b'): ..."""
+        return _Timer(self.labels(*labels))
+
+
+class _Timer:
+    def __init__(self, child: _Child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+def estimate_quantile(buckets: Sequence[float], counts: Sequence[int], q: float) -> Optional[float]:
+    """按分桶线性插值估算分位数（与 Prometheus histogram_quantile 相同的算法）"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            lower = buckets[i - 1] if i > 0 else 0.0
+            if i >= len(buckets):
+                return buckets[-1]
+            return lower + (buckets[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return buckets[-1]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """指标注册表（每个进程一个）"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._flusher_pid = None
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """输出前调用的回调（用于刷新连接池连接数这类按需读取的 Gauge）"""
+        self._collectors.append(collector)
+
+    def reset(self):
+        """清空所有数值（fork 后的子进程调用）"""
+        for metric in self._metrics.values():
+            metric.reset()
+        self._flusher_pid = None
+
+    def snapshot(self) -> Dict[str, List]:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.debug(f"指标采集回调失败: {str(e)}")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    # ---------- 多进程 ----------
+
+    def _snapshot_path(self, pid: int = None) -> Path:
+        return Path(METRICS_MULTIPROC_DIR) / f"{pid or os.getpid()}.json"
+
+    def flush(self):
+        """把本进程的快照写入共享目录（先写临时文件再改名，读取方不会读到半个文件）"""
+        if not METRICS_MULTIPROC_DIR:
+            return
+        path = self._snapshot_path()
+        tmp = path.with_suffix('.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(self.snapshot()), encoding='utf-8')
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning(f"写入指标快照失败: {str(e)}")
+
+    def remove_snapshot(self):
+        if METRICS_MULTIPROC_DIR:
+            try:
+                self._snapshot_path().unlink()
+            except FileNotFoundError:
+                pass
+
+    def ensure_flusher(self):
+        """启动后台写快照线程（每个进程一个；未配置 METRICS_MULTIPROC_DIR 时不启动）"""
+        if not METRICS_MULTIPROC_DIR or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(METRICS_FLUSH_INTERVAL)
+                self.flush()
+
+        threading.Thread(target=run, name='metrics-flusher', daemon=True).start()
+
+    def _other_snapshots(self) -> Iterable[Dict[str, List]]:
+        directory = Path(METRICS_MULTIPROC_DIR)
+        if not directory.is_dir():
+            return
+        now = time.time()
+        own = self._snapshot_path().name
+        for path in directory.glob('*.json'):
+            if path.name == own:
+                continue
+            try:
+                if now - path.stat().st_mtime > METRICS_STALE_SECONDS:
+                    continue
+                yield json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                logger.debug(f"读取指标快照失败 [{path.name}]: {str(e)}")
+
+    def collect(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        """本进程 + 其他进程快照合并后的数值 {指标名: {标签值: 数值}}"""
+        snapshots = [self.snapshot()]
+        if METRICS_MULTIPROC_DIR:
+            snapshots.extend(self._other_snapshots())
+
+        merged = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                values = merged[name]
+                for labels, value in samples:
+                    key = tuple(labels)
+                    values[key] = metric.merge(values[key], value) if key in values else value
+        return merged
+
+    # ---------- 输出 ----------
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(values.items()):
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else _format_value(float(bound))
+                        lines.append(f"{name}_bucket{_format_labels(metric.labelnames, key, ('le', le))} {cumulative}")
+                    labels = _format_labels(metric.labelnames, key)
+                    lines.append(f"{name}_sum{labels} {_format_value(float(value[-1]))}")
+                    lines.append(f"{name}_count{labels} {cumulative}")
+                else:
+                    lines.append(f"{name}{_format_labels(metric.labelnames, key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict[str, List[Dict]]:
+        """直方图的 JSON 汇总（次数、平均值、p50/p95/p99，单位毫秒）"""
+        result = {}
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            if not isinstance(metric, Histogram):
+                continue
+            rows = []
+            for key, value in values.items():
+                counts, total = value[:-1], value[-1]
+                count = sum(counts)
+                row = dict(zip(metric.labelnames, key))
+                row['count'] = count
+                row['avg_ms'] = round(total / count * 1000, 2) if count else None
+                for q in (0.5, 0.95, 0.99):
+                    estimate = estimate_quantile(metric.buckets, counts, q)
+                    row[f"p{int(q * 100)}_ms"] = round(estimate * 1000, 2) if estimate is not None else None
+                rows.append(row)
+            result[name] = sorted(rows, key=lambda r: r['count'], reverse=True)
+        return result
+
+
+registry = MetricsRegistry()
+
+
+def _after_fork_in_child():
+    registry.reset()
+    registry.ensure_flusher()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(registry.remove_snapshot)
+
+
+def _register(metric):
+    registry.register(metric)
+    registry.ensure_flusher()
+    return metric
+
+
+# ---------- 指标定义 ----------
+
+HTTP_REQUEST_DURATION = _register(Histogram(
+    'http_request_duration_seconds', 'HTTP 请求耗时（按路由模板和状态码）',
+    ['method', 'route', 'status'],
+))
+HTTP_REQUESTS_IN_PROGRESS = _register(Gauge(
+    'http_requests_in_progress', '正在处理的 HTTP 请求数', ['method'],
+))
+CACHE_REQUESTS = _register(Counter(
+    'cache_requests_total', 'Redis 缓存读取次数（按键前缀和结果 hit/miss/error）',
+    ['client', 'prefix', 'result'],
+))
+LLM_REQUEST_DURATION = _register(Histogram(
+    'llm_request_duration_seconds', '大模型 API 调用耗时', ['model', 'status'],
+    buckets=LLM_LATENCY_BUCKETS,
+))
+LLM_TOKENS = _register(Counter(
+    'llm_tokens_total', '大模型 token 用量', ['model', 'type'],
+))
+DB_POOL_CHECKOUT_WAIT = _register(Histogram(
+    'db_pool_checkout_wait_seconds', '从数据库连接池取连接的等待时间', ['pool'],
+    buckets=POOL_WAIT_BUCKETS,
+))
+DB_N_PLUS_ONE = _register(Counter(
+    'db_n_plus_one_total', '疑似 N+1 查询次数（按路由模板/任务名）', ['profile'],
+))
+DB_POOL_CONNECTIONS = _register(Gauge(
+    'db_pool_connections', '数据库连接池连接数（checked_out/checked_in/overflow/size）', ['pool', 'state'],
+))
+
+
+def cache_key_prefix(key: str) -> str:
+    """缓存键的前缀（第一个冒号之前），作为指标标签避免基数爆炸"""
+    return key.split(':', 1)[0]
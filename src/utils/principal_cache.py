@@ -0,0 +1,140 @@
+"""
+认证主体缓存
+缓存 token 对应的用户对象（已脱离会话，角色已预加载）和预编译的权限集合，
+认证依赖在缓存命中时只需一次字典查找，不再每个请求查库、反序列化权限JSON。
+
+失效策略：
+- 短 TTL（AUTH_PRINCIPAL_TTL 秒），多进程部署下权限变更最长在 TTL 内生效
+- 每个用户名有一个版本号；User 更新/删除时版本号递增，Role 更新/删除时全部失效
+  （通过 SQLAlchemy 事件自动触发，也可以手动调用 invalidate）
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from sqlalchemy import event
+
+from src.crm.database import User, Role
+
+logger = logging.getLogger(__name__)
+
+AUTH_PRINCIPAL_TTL = float(os.getenv('AUTH_PRINCIPAL_TTL', 30))
+AUTH_PRINCIPAL_MAX_SIZE = int(os.getenv('AUTH_PRINCIPAL_MAX_SIZE', 1000))
+
+PermissionSet = Dict[str, FrozenSet[str]]
+
+
+def compile_permissions(roles: Iterable[Role]) -> PermissionSet:
+    """把所有启用角色的权限JSON合并为 {资源: frozenset(操作)}"""
+    merged: Dict[str, set] = {}
+    for role in roles:
+        if not role.is_active or not role.permissions:
+            continue
+        try:
+            permissions = json.loads(role.permissions)
+        except (TypeError, ValueError):
+            logger.warning(f"角色权限配置不是合法JSON: {role.name}")
+            continue
+        for resource, actions in permissions.items():
+            merged.setdefault(resource, set()).update(actions or [])
+    return {resource: frozenset(actions) for resource, actions in merged.items()}
+
+
+class Principal:
+    """已认证主体：脱离会话的用户对象 + 预编译权限"""
+
+    __slots__ = ('user', 'permissions', 'version', 'expires_at')
+
+    def __init__(self, user: User, permissions: PermissionSet, version: int, expires_at: float):
+        self.user = user
+        self.permissions = permissions
+        self.version = version
+        self.expires_at = expires_at
+
+
+class PrincipalCache:
+    """进程内认证主体缓存（线程安全）"""
+
+    def __init__(self, ttl: float = AUTH_PRINCIPAL_TTL, max_size: int = AUTH_PRINCIPAL_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[str, Principal] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def version(self, username: str) -> int:
+        return self._versions.get(username, 0)
+
+    def get(self, username: str) -> Optional[Principal]:
+        """获取未过期且版本一致的缓存主体"""
+        principal = self._entries.get(username)
+        if principal is None:
+            return None
+        if principal.expires_at < time.monotonic() or principal.version != self.version(username):
+            self._entries.pop(username, None)
+            return None
+        return principal
+
+    def put(self, username: str, user: User, version: int) -> Principal:
+        """
+        缓存一个用户（user 必须已预加载 roles 并脱离会话）
+
+        version 为加载前读取的版本号：加载期间发生失效时，这个条目在下次读取时直接作废
+        """
+        principal = Principal(
+            user=user,
+            permissions=compile_permissions(user.roles),
+            version=version,
+            expires_at=time.monotonic() + self.ttl
+        )
+        # 挂在用户对象上，check_permission 直接使用
+        user._permission_set = principal.permissions
+
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._evict()
+            self._entries[username] = principal
+        return principal
+
+    def _evict(self):
+        """清理过期条目，仍然超出上限时清空（调用方持有锁）"""
+        now = time.monotonic()
+        for username in [u for u, p in self._entries.items() if p.expires_at < now]:
+            del self._entries[username]
+        if len(self._entries) >= self.max_size:
+            self._entries.clear()
+
+    def invalidate(self, username: str):
+        """使某个用户的缓存失效"""
+        with self._lock:
+            self._versions[username] = self.version(username) + 1
+            self._entries.pop(username, None)
+
+    def invalidate_all(self):
+        """使所有缓存失效（角色权限变化时）"""
+        with self._lock:
+            for username in list(self._entries):
+                self._versions[username] = self.version(username) + 1
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self._entries), "ttl": self.ttl}
+
+
+# 全局缓存实例
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    principal_cache.invalidate(target.username)
+
+
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+def _invalidate_roles(mapper, connection, target):
+    principal_cache.invalidate_all()
@@ -0,0 +1,186 @@
+"""
+分布式限流器
+基于 Redis 有序集合的滑动窗口限流，检查和记录在同一个 Lua 脚本中原子完成，
+多个 API worker 共享同一份限额；Redis 不可用时退化为进程内限流。
+
+用法：
+    # 作为路由依赖（超限返回 429 并带 Retry-After）
+    @router.post("/ai/generate-reply", dependencies=[Depends(rate_limit("ai_reply", 20, 60))])
+
+    # 直接使用（登录失败计数）
+    login_limiter = SlidingWindowLimiter("login", limit=5, window=900)
+    if not login_limiter.peek(key).allowed: ...
+    login_limiter.hit(key)
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request, status
+
+from src.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 全局开关（压测/本地调试时可关闭）
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# 仅在部署于反向代理之后时开启，否则客户端可以伪造 X-Forwarded-For 绕过限流
+TRUST_PROXY_HEADERS = os.getenv('TRUST_PROXY_HEADERS', 'false').lower() == 'true'
+
+# KEYS[1] = 限流键
+# ARGV[1] = 窗口（毫秒）, ARGV[2] = 上限, ARGV[3] = 本次消耗（0 表示只检查不记录）, ARGV[4] = 成员ID
+# 只检查时按消耗 1 次判断（额度用完即拒绝）
+# 返回 {是否允许, 窗口内已用次数, 需要等待的毫秒数}
+_SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+local used = redis.call('ZCARD', KEYS[1])
+
+if used + math.max(cost, 1) > limit then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    local retry_after = window
+    if oldest[2] then
+        retry_after = tonumber(oldest[2]) + window - now
+    end
+    return {0, used, retry_after}
+end
+
+for i = 1, cost do
+    redis.call('ZADD', KEYS[1], now, ARGV[4] .. ':' .. i)
+end
+if cost > 0 then
+    redis.call('PEXPIRE', KEYS[1], window)
+end
+return {1, used + cost, 0}
+"""
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    used: int
+    limit: int
+    retry_after: float  # 秒
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+
+class SlidingWindowLimiter:
+    """滑动窗口限流器：任意 window 秒内最多 limit 次"""
+
+    def __init__(self, name: str, limit: int, window: int, client=None):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.client = client if client is not None else (cache.client if cache.available else None)
+        self._script = self.client.register_script(_SLIDING_WINDOW_LUA) if self.client is not None else None
+        self._local: Dict[str, Deque[float]] = {}
+        self._local_lock = threading.Lock()
+
+    def _key(self, identity: str) -> str:
+        return f"ratelimit:{self.name}:{identity}"
+
+    def _check(self, identity: str, cost: int) -> RateLimitResult:
+        key = self._key(identity)
+        if self._script is not None:
+            try:
+                allowed, used, retry_ms = self._script(
+                    keys=[key],
+                    args=[self.window * 1000, self.limit, cost, uuid.uuid4().hex]
+                )
+                return RateLimitResult(bool(allowed), int(used), self.limit, max(0, int(retry_ms)) / 1000)
+            except Exception as e:
+                logger.warning(f"Redis限流失败，使用本地限流 [{key}]: {str(e)}")
+        return self._check_local(key, cost)
+
+    def _check_local(self, key: str, cost: int) -> RateLimitResult:
+        now = time.monotonic()
+        with self._local_lock:
+            hits = self._local.setdefault(key, deque())
+            while hits and now - hits[0] >= self.window:
+                hits.popleft()
+            if len(hits) + max(cost, 1) > self.limit:
+                retry_after = self.window - (now - hits[0]) if hits else self.window
+                return RateLimitResult(False, len(hits), self.limit, retry_after)
+            hits.extend([now] * cost)
+            if not hits:
+                del self._local[key]
+            return RateLimitResult(True, len(hits), self.limit, 0)
+
+    def hit(self, identity: str) -> RateLimitResult:
+        """记录一次请求（超限时不记录）"""
+        return self._check(identity, 1)
+
+    def peek(self, identity: str) -> RateLimitResult:
+        """只检查是否还有额度（至少还能再记录一次），不消耗"""
+        return self._check(identity, 0)
+
+    def reset(self, identity: str):
+        """清空某个标识的记录"""
+        key = self._key(identity)
+        if self.client is not None:
+            try:
+                self.client.delete(key)
+            except Exception:
+                pass
+        with self._local_lock:
+            self._local.pop(key, None)
+
+
+def client_ip(request: Request) -> str:
+    """获取客户端IP（TRUST_PROXY_HEADERS 开启时使用反向代理传入的 X-Forwarded-For）"""
+    forwarded = request.headers.get('x-forwarded-for') if TRUST_PROXY_HEADERS else None
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit(
+    name: str,
+    limit: int,
+    window: int,
+    key_func: Optional[Callable[[Request], str]] = None
+):
+    """
+    创建限流依赖
+
+    Args:
+        name: 限流名称（同名共享额度）
+        limit: 窗口内允许的请求数
+        window: 窗口长度（秒）
+        key_func: 从请求中提取限流标识，默认按客户端IP
+    """
+    limit = int(os.getenv(f'RATE_LIMIT_{name.upper()}', limit))
+    limiter = SlidingWindowLimiter(name, limit, window)
+    key_func = key_func or client_ip
+
+    # 普通函数：FastAPI 在线程池中执行，同步 Redis 往返/超时不会阻塞事件循环
+    def dependency(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        result = limiter.hit(key_func(request))
+        if not result.allowed:
+            retry_after = max(1, int(result.retry_after + 0.999))
+            logger.warning(f"限流触发: {name} [{key_func(request)}] {result.used}/{limit}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"请求过于频繁，请{retry_after}秒后再试",
+                headers={
+                    "Retry-After": str(retry_after),
+                    "X-RateLimit-Limit": str(limit),
+                    "X-RateLimit-Remaining": "0",
+                }
+            )
+
+    dependency.limiter = limiter
+    return dependency
@@ -0,0 +1,366 @@
+"""
+分布式链路追踪（OpenTelemetry 兼容）
+
+一封入站邮件会经过 sync_emails_task → analyze_email_task → generate_auto_reply_task → 企业微信通知，
+跨 API、多个 Celery 任务和外部调用。这里提供轻量的 span 追踪：
+- span 上下文保存在 ContextVar 中，同步/异步代码都能自动找到父 span
+- 跨进程用 W3C traceparent 传递：HTTP 请求头、Celery 消息头（before_task_publish / task_prerun）
+- 导出为 OTLP/JSON（ExportTraceServiceRequest），可以：
+  - 写入本地文件 TRACE_EXPORT_FILE（每批一行，OpenTelemetry Collector 的 otlpjsonfile 接收器可直接读取）
+  - 发送到 OTLP/HTTP 采集端 OTEL_EXPORTER_OTLP_ENDPOINT（如 http://localhost:4318，自动加 /v1/traces）
+- 两者都未配置时追踪关闭，start_span 不做任何事
+
+采样：根 span 按 TRACE_SAMPLE_RATE 采样，子 span 和下游任务沿用 traceparent 中的采样标记。
+
+用法：
+    with start_span("imap.fetch", kind=SPAN_KIND_CLIENT, attributes={"email.account": addr}) as span:
+        ...
+
+    @traced("llm.chat", kind=SPAN_KIND_CLIENT)
+    async def _call_api(...): ...
+"""
+import os
+import json
+import time
+import queue
+import random
+import socket
+import logging
+import threading
+import functools
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE')
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'crm')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+TRACING_ENABLED = bool(TRACE_EXPORT_FILE or OTEL_EXPORTER_OTLP_ENDPOINT)
+
+# 导出批次
+TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', 2))
+TRACE_EXPORT_BATCH_SIZE = 256
+TRACE_QUEUE_SIZE = 10000
+# 属性值最大长度（SQL 等长文本截断）
+MAX_ATTRIBUTE_CHARS = 1000
+
+# OTLP SpanKind
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+SPAN_KIND_PRODUCER = 4
+SPAN_KIND_CONSUMER = 5
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+TRACEPARENT_HEADER = 'traceparent'
+
+
+class Span:
+    """一个 span（开始时间、结束时间、属性、状态）"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, sampled: bool = True,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.sampled = sampled
+        self.attributes = dict(attributes or {})
+        self.status_code = 0
+        self.status_message = ''
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:MAX_ATTRIBUTE_CHARS]
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            _exporter.export(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)[:MAX_ATTRIBUTE_CHARS]}
+    return {"key": key, "value": typed}
+
+
+class SpanExporter:
+    """后台线程批量导出（队列满时丢弃，不阻塞业务代码）"""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._pid = None
+        self._lock = threading.Lock()
+        self._resource = {
+            "attributes": [
+                _otlp_attribute("service.name", OTEL_SERVICE_NAME),
+                _otlp_attribute("host.name", socket.gethostname()),
+            ]
+        }
+
+    def export(self, span: Span):
+        if not TRACING_ENABLED:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            logger.debug("追踪队列已满，丢弃 span")
+
+    def _ensure_worker(self):
+        # fork 出的子进程（Celery prefork / uvicorn workers）需要重新启动导出线程
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+            threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + TRACE_EXPORT_INTERVAL
+            while len(batch) < TRACE_EXPORT_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _payload(self, batch) -> Dict:
+        resource = dict(self._resource)
+        resource["attributes"] = resource["attributes"] + [_otlp_attribute("process.pid", os.getpid())]
+        return {
+            "resourceSpans": [{
+                "resource": resource,
+                "scopeSpans": [{
+                    "scope": {"name": "src.utils.tracing"},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        }
+
+    def _write(self, batch):
+        payload = self._payload(batch)
+        if TRACE_EXPORT_FILE:
+            try:
+                with open(TRACE_EXPORT_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+            except OSError as e:
+                logger.warning(f"写入追踪文件失败: {str(e)}")
+        if OTEL_EXPORTER_OTLP_ENDPOINT:
+            try:
+                import httpx
+                httpx.post(
+                    f"{OTEL_EXPORTER_OTLP_ENDPOINT.rstrip('/')}/v1/traces",
+                    json=payload, timeout=5.0
+                ).raise_for_status()
+            except Exception as e:
+                logger.warning(f"发送追踪数据失败: {str(e)}")
+
+
+_exporter = SpanExporter()
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(value: Optional[str]):
+    """解析 W3C traceparent，返回 (trace_id, parent_span_id, sampled)，格式不对时返回 None"""
+    if not value:
+        return None
+    parts = value.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def create_span(name: str, kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None,
+                traceparent: Optional[str] = None) -> Optional[Span]:
+    """
+    创建 span（不设置为当前 span，调用方负责 end()）
+
+    父 span 优先取 traceparent（跨进程），其次取当前上下文中的 span；都没有时开始新的 trace
+    """
+    if not TRACING_ENABLED:
+        return None
+    remote = parse_traceparent(traceparent)
+    if remote:
+        trace_id, parent_id, sampled = remote
+    else:
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE
+    return Span(name, trace_id, parent_id, kind=kind, sampled=sampled, attributes=attributes)
+
+
+def activate(span: Optional[Span]):
+    """把 span 设为当前 span，返回 token（交给 deactivate）"""
+    return _current_span.set(span) if span is not None else None
+
+
+def deactivate(token):
+    if token is not None:
+        _current_span.reset(token)
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None,
+               traceparent: Optional[str] = None):
+    """创建 span 并设为当前 span；异常会记录到 span 状态后继续抛出"""
+    span = create_span(name, kind, attributes, traceparent)
+    if span is None:
+        yield None
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(name: str = None, kind: int = SPAN_KIND_INTERNAL):
+    """函数级 span 装饰器（支持同步和异步函数）"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attributes(**attributes):
+    """给当前 span 添加属性（没有 span 时忽略）"""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    """把当前 span 写入 traceparent 头（HTTP 请求 / Celery 消息）"""
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent
+    return headers
+
+
+def connect_celery_signals():
+    """Celery 消息头传递 trace 上下文，每个任务一个 consumer span（在 celery_config 中调用）"""
+    from celery.signals import before_task_publish, task_prerun, task_postrun, task_failure
+
+    from src.utils.logging_config import get_request_id, set_request_id, reset_request_id
+
+    active = {}
+    request_ids = {}
+
+    @before_task_publish.connect(weak=False)
+    def _inject_headers(headers=None, **kwargs):
+        if headers is None:
+            return
+        inject(headers)
+        request_id = get_request_id()
+        if request_id:
+            headers.setdefault('x_request_id', request_id)
+
+    @task_prerun.connect(weak=False)
+    def _start_task_span(task_id=None, task=None, **kwargs):
+        request = task.request if task else None
+        message_headers = (getattr(request, 'headers', None) or {}) if request else {}
+        traceparent = getattr(request, TRACEPARENT_HEADER, None) or message_headers.get(TRACEPARENT_HEADER)
+        request_id = getattr(request, 'x_request_id', None) or message_headers.get('x_request_id')
+        # 没有请求ID的任务也要清空，否则 worker 会沿用上一个任务的ID（日志和子任务消息头里都会带上）
+        request_ids[task_id] = set_request_id(request_id or '')
+
+        span = create_span(
+            f"celery.task {task.name if task else 'unknown'}", SPAN_KIND_CONSUMER,
+            {"celery.task_id": task_id, "celery.retries": getattr(request, 'retries', 0)},
+            traceparent=traceparent
+        )
+        if span is not None:
+            active[task_id] = (span, activate(span))
+
+    @task_failure.connect(weak=False)
+    def _mark_task_failed(task_id=None, exception=None, **kwargs):
+        entry = active.get(task_id)
+        if entry and exception is not None:
+            entry[0].set_error(exception)
+
+    @task_postrun.connect(weak=False)
+    def _end_task_span(task_id=None, state=None, **kwargs):
+        entry = active.pop(task_id, None)
+        if entry:
+            span, token = entry
+            span.set_attribute("celery.state", state)
+            deactivate(token)
+            span.end()
+        reset_request_id(request_ids.pop(task_id, None))
@@ -9,6 +9,8 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 from dotenv import load_dotenv
 
+from src.utils.tracing import traced, SPAN_KIND_CLIENT
+
 # 🔥 加载环境变量
 load_dotenv()
 
@@ -157,6 +159,7 @@ class WeComNotification:
             print(f"❌ 发送企业微信群机器人消息异常: {str(e)}")
             return False
     
+    @traced("wecom.notify", SPAN_KIND_CLIENT)
     def send_approval_notification(
         self, 
         task_id: int, 
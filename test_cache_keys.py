@@ -0,0 +1,55 @@
+"""
+测试缓存键：装饰实例方法时 self 不参与缓存键，
+不同实例/进程对同样的参数必须得到同一个键（跨 worker 共享缓存、锁和后台刷新）
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.utils.cache import cached, async_cached
+
+
+class Service:
+    @cached(prefix="test_service")
+    def lookup(self, name: str, limit: int = 10):
+        return name
+
+    @async_cached(prefix="test_service_async")
+    async def analyze(self, subject: str, body: str):
+        return subject
+
+
+def test_method_key_ignores_instance():
+    assert Service.lookup.cache_key(Service(), "abc", limit=5) == Service.lookup.cache_key(Service(), "abc", limit=5)
+    assert Service.analyze.cache_key(Service(), "s", "b") == Service.analyze.cache_key(Service(), "s", "b")
+
+
+def test_method_key_still_depends_on_arguments():
+    service = Service()
+    assert Service.lookup.cache_key(service, "abc") != Service.lookup.cache_key(service, "abd")
+    assert Service.analyze.cache_key(service, "s", "b") != Service.analyze.cache_key(service, "s", "c")
+
+
+def test_function_key_keeps_first_argument():
+    @cached(prefix="test_function")
+    def load(user_id: int):
+        return user_id
+
+    assert load.cache_key(1) != load.cache_key(2)
+
+
+def test_email_analyzer_key_is_stable_across_instances():
+    from src.ai.email_analyzer import EmailAIAnalyzer
+
+    key_args = ("Quotation request", "Please quote 5000 pcs.")
+    first = EmailAIAnalyzer.analyze_email.cache_key(EmailAIAnalyzer(), *key_args, from_email="a@example.com")
+    second = EmailAIAnalyzer.analyze_email.cache_key(EmailAIAnalyzer(), *key_args, from_email="a@example.com")
+    assert first == second
+    assert first.startswith("email_analysis:")
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-v"]))
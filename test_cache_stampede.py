@@ -0,0 +1,147 @@
+"""
+测试缓存装饰器的防击穿等待：锁持有者没有写入缓存（返回 None / 抛出异常）时，
+等待者必须立即结束等待，而不是睡满 lock_ttl
+"""
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis 执行 Lua 脚本需要 lupa
+
+from src.utils import cache as cache_module
+
+LOCK_TTL = 3
+THREADS = 3
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """把全局缓存实例指向内存中的 fakeredis"""
+    import fakeredis.aioredis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(cache_module.cache, 'client', fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(cache_module.cache, 'binary_client', fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(cache_module.cache, 'available', True)
+    monkeypatch.setattr(cache_module.async_cache, '_client', lambda: fakeredis.aioredis.FakeRedis(server=server))
+    monkeypatch.setattr(cache_module.async_cache, '_disabled_until', 0.0)
+    yield server
+
+
+def run_concurrently(func, threads: int = THREADS):
+    """多个线程同时调用 func，返回 (每个线程的耗时, 每个线程的结果或异常)"""
+    barrier = threading.Barrier(threads)
+    elapsed, outcomes = [0.0] * threads, [None] * threads
+
+    def worker(index):
+        barrier.wait()
+        start = time.monotonic()
+        try:
+            outcomes[index] = func()
+        except Exception as e:
+            outcomes[index] = e
+        elapsed[index] = time.monotonic() - start
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return elapsed, outcomes
+
+
+def test_waiters_released_when_result_is_none():
+    calls = []
+
+    @cache_module.cached(prefix="test_none", ttl=60, lock_ttl=LOCK_TTL)
+    def load():
+        calls.append(1)
+        time.sleep(0.3)
+        return None
+
+    elapsed, outcomes = run_concurrently(load)
+    assert outcomes == [None] * THREADS
+    assert max(elapsed) < 1.5
+    assert len(calls) == 1  # 等待者共用持有者刚算出的空结果
+
+
+def test_waiters_released_when_compute_raises():
+    calls = []
+
+    @cache_module.cached(prefix="test_error", ttl=60, lock_ttl=LOCK_TTL)
+    def load():
+        calls.append(1)
+        time.sleep(0.3)
+        raise RuntimeError("upstream failed")
+
+    elapsed, outcomes = run_concurrently(load)
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert max(elapsed) < 1.5
+    assert len(calls) == THREADS  # 持有者失败后等待者各自重试
+
+
+def test_waiters_read_stored_value():
+    calls = []
+
+    @cache_module.cached(prefix="test_value", ttl=60, lock_ttl=LOCK_TTL)
+    def load():
+        calls.append(1)
+        time.sleep(0.3)
+        return {"answer": 42}
+
+    elapsed, outcomes = run_concurrently(load)
+    assert outcomes == [{"answer": 42}] * THREADS
+    assert max(elapsed) < 1.5
+    assert len(calls) == 1
+
+
+def test_stale_none_marker_does_not_hide_later_value():
+    """上一次留下的空结果标记，在成功写入缓存后必须被清除"""
+    token = cache_module.cache.acquire_lock("test_marker", 5)
+    cache_module.cache.release_lock("test_marker", token, cache_module.LOCK_OUTCOME_NONE)
+    assert cache_module.cache.lock_status("test_marker") == cache_module.LOCK_OUTCOME_NONE
+
+    token = cache_module.cache.acquire_lock("test_marker", 5)
+    assert cache_module.cache.lock_status("test_marker") == cache_module.LOCK_HELD
+    cache_module.cache.release_lock("test_marker", token)
+    assert cache_module.cache.lock_status("test_marker") == cache_module.LOCK_RELEASED
+
+
+def test_async_waiters_released_when_result_is_none():
+    """其他进程持有锁并得到空结果时，异步等待者立即返回"""
+    calls = []
+
+    @cache_module.async_cached(prefix="test_async_none", ttl=60, lock_ttl=LOCK_TTL)
+    async def load():
+        calls.append(1)
+        return None
+
+    async def scenario():
+        key = cache_module.generate_cache_key("test_async_none")
+        token = cache_module.cache.acquire_lock(key, LOCK_TTL)  # 模拟另一个进程持有锁
+
+        def release_later():
+            time.sleep(0.3)
+            cache_module.cache.release_lock(key, token, cache_module.LOCK_OUTCOME_NONE)
+
+        threading.Thread(target=release_later).start()
+        start = time.monotonic()
+        result = await load()
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(scenario())
+    assert result is None
+    assert elapsed < 1.5
+    assert calls == []
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
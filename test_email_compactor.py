@@ -0,0 +1,146 @@
+"""
+测试邮件正文压缩：去掉引用/签名/免责声明，但不能丢掉客户的真实需求
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.ai.email_compactor import compact_email_body, strip_disclaimers, strip_quoted, strip_signature
+
+
+# ---------- 不能误删的正文 ----------
+
+def test_short_thanks_opener_is_not_a_signature():
+    body = (
+        "Hi Tom,\n\n"
+        "Thanks!\n"
+        "We need 5000 pieces by March.\n"
+        "Also please quote shipping to LA.\n"
+        "What is MOQ for the blue version?"
+    )
+    compacted = compact_email_body(body)
+    assert "Also please quote shipping to LA." in compacted
+    assert "What is MOQ for the blue version?" in compacted
+
+
+def test_sign_off_followed_by_sentences_is_kept():
+    body = (
+        "Hello,\n\n"
+        "Please find the updated drawings attached for review.\n\n"
+        "Thanks,\n"
+        "One more thing: we also need the CE certificate.\n"
+        "Can you send it before Friday?"
+    )
+    compacted = strip_signature(body)
+    assert "we also need the CE certificate" in compacted
+    assert "Can you send it before Friday?" in compacted
+
+
+def test_body_from_line_without_outlook_header_is_kept():
+    body = (
+        "Hi,\n\n"
+        "Please ship the samples as below.\n"
+        "From: our Shenzhen warehouse\n"
+        "To: Los Angeles port\n"
+        "Quantity: 20 cartons\n"
+        "Please confirm the freight cost."
+    )
+    compacted = strip_quoted(body)
+    assert "To: Los Angeles port" in compacted
+    assert "Please confirm the freight cost." in compacted
+
+
+def test_confidential_business_paragraph_is_kept():
+    body = (
+        "Dear Lisa,\n\n"
+        "Thank you for the quotation.\n\n"
+        "We can accept USD 3.20/pc for 10,000 pcs.\n\n"
+        "This price is confidential, please do not share it with other buyers."
+    )
+    compacted = strip_disclaimers(body)
+    assert "This price is confidential" in compacted
+
+
+# ---------- 应该去掉的内容 ----------
+
+def test_real_outlook_header_is_cut():
+    body = (
+        "Hi Lisa,\n\n"
+        "Please see my comments below and confirm the delivery date.\n\n"
+        "From: Lisa Wang <lisa@example.com>\n"
+        "Sent: Monday, March 3, 2025 10:12 AM\n"
+        "To: Tom <tom@buyer.example.com>\n"
+        "Subject: RE: Quotation for LED panels\n\n"
+        "Dear Tom, our price is USD 3.50/pc."
+    )
+    compacted = strip_quoted(body)
+    assert "confirm the delivery date" in compacted
+    assert "Sent: Monday" not in compacted
+    assert "USD 3.50/pc" not in compacted
+
+
+def test_chinese_outlook_header_is_cut():
+    body = (
+        "王经理您好，\n\n"
+        "请确认最新的交货期，谢谢配合，我们这边等待回复后安排付款。\n\n"
+        "发件人: 李明 <liming@example.com>\n"
+        "发送时间: 2025年3月3日 10:12\n"
+        "收件人: 王经理\n"
+        "主题: 回复: 报价单\n\n"
+        "之前的报价内容"
+    )
+    compacted = strip_quoted(body)
+    assert "请确认最新的交货期" in compacted
+    assert "之前的报价内容" not in compacted
+
+
+def test_signature_contact_block_is_removed():
+    body = (
+        "Hi Lisa,\n\n"
+        "Please send the proforma invoice for order #2291 today.\n\n"
+        "Best regards,\n"
+        "Tom Miller\n"
+        "Purchasing Manager\n"
+        "ABC Trading Co., Ltd.\n"
+        "Tel: +1 (310) 555-0147\n"
+        "Email: tom@abc-trading.example.com\n"
+        "www.abc-trading.example.com"
+    )
+    compacted = strip_signature(body)
+    assert "Please send the proforma invoice" in compacted
+    assert "Tom Miller" in compacted
+    assert "Tel:" not in compacted
+    assert "www.abc-trading" not in compacted
+
+
+def test_standard_disclaimer_is_removed():
+    body = (
+        "Hi Lisa,\n\n"
+        "Please confirm the sample shipping date.\n\n"
+        "Tom\n\n"
+        "CONFIDENTIALITY NOTICE: This e-mail and any attachments are confidential and may be privileged. "
+        "If you have received this e-mail in error, please notify the sender and delete it."
+    )
+    compacted = strip_disclaimers(body)
+    assert "Please confirm the sample shipping date." in compacted
+    assert "CONFIDENTIALITY NOTICE" not in compacted
+
+
+def test_long_trailing_single_hint_disclaimer_is_removed():
+    disclaimer = (
+        "The information contained in this communication is confidential to the addressee and its "
+        "affiliates and should not be copied, forwarded or relied upon by any other person for any "
+        "purpose whatsoever without the prior written consent of the sender."
+    )
+    body = "Hi,\n\nPlease check the packing list.\n\nTom\n\n" + disclaimer
+    compacted = strip_disclaimers(body)
+    assert "Please check the packing list." in compacted
+    assert "should not be copied" not in compacted
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,78 @@
+"""
+测试登录限流：连续失败 MAX_LOGIN_ATTEMPTS 次后，下一次登录必须被拒绝
+（本地限流和 Redis 限流两条路径）
+"""
+import sys
+import uuid
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.utils.cache import cache
+from src.utils.rate_limiter import SlidingWindowLimiter
+
+LIMIT = 5
+
+
+def simulate_failed_logins(limiter: SlidingWindowLimiter, identity: str, attempts: int):
+    """按登录路由的顺序：先检查是否允许，允许则记录一次失败；返回每次尝试是否被允许"""
+    allowed = []
+    for _ in range(attempts):
+        ok = limiter.peek(identity).allowed
+        allowed.append(ok)
+        if ok:
+            limiter.hit(identity)
+    return allowed
+
+
+def local_limiter() -> SlidingWindowLimiter:
+    limiter = SlidingWindowLimiter(f"test_login_{uuid.uuid4().hex}", limit=LIMIT, window=900)
+    limiter._script = None  # 强制使用进程内限流
+    return limiter
+
+
+def test_local_lockout_after_limit():
+    """本地限流：第 limit+1 次失败登录被拒绝"""
+    limiter = local_limiter()
+    allowed = simulate_failed_logins(limiter, "127.0.0.1:admin", LIMIT + 1)
+    assert allowed == [True] * LIMIT + [False]
+
+    result = limiter.peek("127.0.0.1:admin")
+    assert not result.allowed
+    assert result.used == LIMIT
+    assert result.retry_after > 0
+
+
+def test_local_lockout_is_per_identity():
+    """其他 IP/用户名不受影响"""
+    limiter = local_limiter()
+    simulate_failed_logins(limiter, "127.0.0.1:admin", LIMIT)
+    assert not limiter.peek("127.0.0.1:admin").allowed
+    assert limiter.peek("127.0.0.1:other").allowed
+    assert limiter.peek("10.0.0.1:admin").allowed
+
+
+def test_local_reset_unlocks():
+    limiter = local_limiter()
+    simulate_failed_logins(limiter, "127.0.0.1:admin", LIMIT)
+    limiter.reset("127.0.0.1:admin")
+    assert limiter.peek("127.0.0.1:admin").allowed
+
+
+@pytest.mark.skipif(not cache.available, reason="Redis 不可用")
+def test_redis_lockout_after_limit():
+    """Redis 限流（Lua 脚本）：第 limit+1 次失败登录被拒绝"""
+    limiter = SlidingWindowLimiter(f"test_login_{uuid.uuid4().hex}", limit=LIMIT, window=900)
+    identity = "127.0.0.1:admin"
+    try:
+        allowed = simulate_failed_logins(limiter, identity, LIMIT + 1)
+        assert allowed == [True] * LIMIT + [False]
+    finally:
+        limiter.reset(identity)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))